@@ -0,0 +1,215 @@
+"""
+Admission - Concurrency limits and a bounded waiting queue for story generation
+
+Every POST /generate_story takes a permit before any work starts:
+
+- At most GENERATION_MAX_PER_CLIENT generations per client may be running or
+  waiting at once; more are rejected with 429.
+- At most GENERATION_MAX_CONCURRENT generations run at once. Up to
+  GENERATION_QUEUE_SIZE more wait for a slot in arrival order; beyond that,
+  or after GENERATION_QUEUE_TIMEOUT seconds of waiting, requests are rejected
+  with 503.
+
+Rejections carry a Retry-After estimated from recent generation times, so a
+burst degrades into quick, honest refusals instead of dozens of concurrent
+renders. Limits apply per web process.
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from metrics import ADMISSION_ACTIVE, ADMISSION_WAITING, ADMISSION_REJECTIONS, ADMISSION_WAIT
+
+logger = logging.getLogger(__name__)
+
+# Generations running at once in this process
+GENERATION_MAX_CONCURRENT = int(os.environ.get('GENERATION_MAX_CONCURRENT', 4))
+# Generations running or waiting at once for a single client
+GENERATION_MAX_PER_CLIENT = int(os.environ.get('GENERATION_MAX_PER_CLIENT', 2))
+# Generations allowed to wait for a slot
+GENERATION_QUEUE_SIZE = int(os.environ.get('GENERATION_QUEUE_SIZE', 8))
+# Seconds a synchronous request waits for a slot before giving up
+GENERATION_QUEUE_TIMEOUT = float(os.environ.get('GENERATION_QUEUE_TIMEOUT', 30))
+# Retry-After (seconds) used until a generation time has been measured
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 30))
+# Take the client address from X-Forwarded-For (only behind a trusted proxy)
+ADMISSION_TRUST_PROXY = os.environ.get('ADMISSION_TRUST_PROXY', 'false').lower() in ('1', 'true', 'yes')
+
+class AdmissionRejected(Exception):
+    """
+    A generation request that cannot be accepted now.
+
+    status is 429 when the client is over its own limit and 503 when the whole
+    process is saturated; retry_after is in seconds.
+    """
+
+    def __init__(self, message, status, retry_after, reason):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+class Permit:
+    """One client's claim on a generation slot; wait() for the slot, always release()"""
+
+    def __init__(self, controller, client_id):
+        self.controller = controller
+        self.client_id = client_id
+        self.admitted = False
+        self.released = False
+        self.created = time.monotonic()
+        self.admitted_at = None
+
+    def wait(self, timeout=None):
+        """Block until this permit holds a slot; returns False on timeout (the permit is then released)"""
+        return self.controller._wait(self, timeout)
+
+    def release(self):
+        self.controller._release(self)
+
+class AdmissionController:
+    """Global and per-client generation limits with a FIFO waiting queue"""
+
+    def __init__(self, max_concurrent=GENERATION_MAX_CONCURRENT, max_per_client=GENERATION_MAX_PER_CLIENT,
+                 queue_size=GENERATION_QUEUE_SIZE, queue_timeout=GENERATION_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_per_client = max_per_client
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejections = {'client_limit': 0, 'queue_full': 0, 'queue_timeout': 0}
+        self.avg_generation_seconds = None
+        self._per_client = {}
+        self._ready = deque()
+        self._cond = threading.Condition()
+
+    def _retry_after(self, position=1):
+        # Caller holds self._cond: time for `position` generations to clear the slots
+        if self.avg_generation_seconds is None:
+            return ADMISSION_RETRY_AFTER
+        estimate = self.avg_generation_seconds * position / max(1, self.max_concurrent)
+        return max(1, min(600, math.ceil(estimate)))
+
+    def _reject(self, message, status, reason, position=1):
+        # Caller holds self._cond
+        self.rejections[reason] += 1
+        ADMISSION_REJECTIONS.inc(reason=reason)
+        retry_after = self._retry_after(position)
+        logger.warning(f"Generation rejected ({reason}), retry after {retry_after}s")
+        return AdmissionRejected(message, status, retry_after, reason)
+
+    def _publish(self):
+        ADMISSION_ACTIVE.set(self.active)
+        ADMISSION_WAITING.set(self.waiting)
+
+    def reserve(self, client_id):
+        """
+        Claim a place for client_id without blocking.
+
+        Returns:
+            Permit: Counted as waiting until wait() grants it a slot
+
+        Raises:
+            AdmissionRejected: Client over its limit (429) or queue full (503)
+        """
+        with self._cond:
+            if self._per_client.get(client_id, 0) >= self.max_per_client:
+                raise self._reject(f"You already have {self.max_per_client} stories in progress. "
+                                   f"Please wait for one to finish.", 429, 'client_limit')
+            if self.active + self.waiting >= self.max_concurrent + self.queue_size:
+                raise self._reject("The storyteller is busy with other stories. Please try again shortly.",
+                                   503, 'queue_full', position=self.waiting + 1)
+            self._per_client[client_id] = self._per_client.get(client_id, 0) + 1
+            self.waiting += 1
+            self._publish()
+            return Permit(self, client_id)
+
+    def _wait(self, permit, timeout):
+        with self._cond:
+            if permit.admitted:
+                return True
+            self._ready.append(permit)
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                if self._ready[0] is permit and self.active < self.max_concurrent:
+                    self._ready.popleft()
+                    permit.admitted = True
+                    permit.admitted_at = time.monotonic()
+                    self.active += 1
+                    self.waiting -= 1
+                    self._publish()
+                    # The next permit in line may also fit
+                    self._cond.notify_all()
+                    ADMISSION_WAIT.observe(permit.admitted_at - permit.created)
+                    return True
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._ready.remove(permit)
+                    self._cond.notify_all()
+                    break
+                self._cond.wait(remaining)
+        self._release(permit)
+        return False
+
+    def _release(self, permit):
+        with self._cond:
+            if permit.released:
+                return
+            permit.released = True
+            if permit.admitted:
+                self.active -= 1
+                held = time.monotonic() - permit.admitted_at
+                # Exponentially weighted, so Retry-After follows current generation times
+                self.avg_generation_seconds = (held if self.avg_generation_seconds is None
+                                               else 0.8 * self.avg_generation_seconds + 0.2 * held)
+            else:
+                self.waiting -= 1
+                if permit in self._ready:
+                    self._ready.remove(permit)
+            remaining = self._per_client.get(permit.client_id, 1) - 1
+            if remaining > 0:
+                self._per_client[permit.client_id] = remaining
+            else:
+                self._per_client.pop(permit.client_id, None)
+            self._publish()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, client_id):
+        """Hold a generation slot for the with-block, waiting up to queue_timeout for it"""
+        permit = self.reserve(client_id)
+        if not permit.wait(self.queue_timeout):
+            with self._cond:
+                raise self._reject("The storyteller is busy with other stories. Please try again shortly.",
+                                   503, 'queue_timeout', position=self.waiting + 1)
+        try:
+            yield permit
+        finally:
+            permit.release()
+
+    def to_dict(self):
+        with self._cond:
+            return {
+                'active': self.active,
+                'waiting': self.waiting,
+                'max_concurrent': self.max_concurrent,
+                'max_per_client': self.max_per_client,
+                'queue_size': self.queue_size,
+                'rejections': dict(self.rejections),
+                'avg_generation_seconds': (round(self.avg_generation_seconds, 2)
+                                           if self.avg_generation_seconds is not None else None)
+            }
+
+controller = AdmissionController()
+
+def client_id_for(request):
+    """Identify the client behind a Flask request for per-client limits"""
+    if ADMISSION_TRUST_PROXY and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or 'unknown'
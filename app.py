@@ -34,58 +34,6 @@ if env_path.exists():
 else:
     print(f"Warning: .env file not found at {env_path}")
 
-# PRODUCTION-GRADE LOGGING SYSTEM
-# SPEAKING POINT: "Our logging system is enterprise-ready with both file and console output,
-# automatic log rotation, and detailed debugging information. This is crucial for monitoring
-# system performance and troubleshooting issues in production."
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-# FILE HANDLER - Persistent logging with rotation
-# SPEAKING POINT: "We use RotatingFileHandler to automatically manage log files,
-# preventing them from growing too large and filling up disk space."
-file_handler = RotatingFileHandler(
-    os.path.join(log_dir, 'app.log'),
-    maxBytes=10240,  # 10KB per file
-    backupCount=10   # Keep 10 backup files
-)
-file_handler.setFormatter(logging.Formatter(
-    '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-))
-file_handler.setLevel(logging.DEBUG)
-
-# CONSOLE HANDLER - Real-time debugging output
-# SPEAKING POINT: "During development, we get immediate feedback through console logging,
-# which is essential for debugging the complex AI pipeline interactions."
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-console_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(console_formatter)
-
-# ROOT LOGGER CONFIGURATION
-# SPEAKING POINT: "We configure the root logger to capture all log levels,
-# ensuring we don't miss any important system events or errors."
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-
-# CLEAN UP EXISTING HANDLERS - Prevent duplicate logs
-for handler in logger.handlers[:]:
-    logger.removeHandler(handler)
-
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
-
-# ENVIRONMENT VARIABLE VALIDATION
-# SPEAKING POINT: "We validate that all required environment variables are present
-# before starting the application. This prevents runtime errors and ensures
-# all AI services are properly configured."
-logger.info("Environment variables loaded")
-logger.debug(f"SESSION_SECRET present: {'SESSION_SECRET' in os.environ}")
-logger.debug(f"DATABASE_URL present: {'DATABASE_URL' in os.environ}")
-if not os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"):
-    logger.warning("GOOGLE_APPLICATION_CREDENTIALS environment variable not set. Audio generation may fail.")
-
 # FLASK APPLICATION INITIALIZATION
 # SPEAKING POINT: "Here we create our Flask web application instance with secure session management.
 # The secret key is loaded from environment variables for security."
@@ -96,12 +44,20 @@ app.secret_key = os.environ.get("SESSION_SECRET", "vedic-stories-secret-key-1234
 # SPEAKING POINT: "Our database configuration includes connection pooling and health checks
 # to ensure reliable performance under load. The pool_recycle prevents stale connections,
 # and pool_pre_ping verifies connection health before use."
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///vedic_stories.db")
+# MYTHOSCRIBE_DATABASE_URL (not set in .env) lets tools such as benchmark.py use a scratch database
+app.config["SQLALCHEMY_DATABASE_URI"] = (os.environ.get("MYTHOSCRIBE_DATABASE_URL")
+                                         or os.environ.get("DATABASE_URL", "sqlite:///vedic_stories.db"))
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,    # Recycle connections every 5 minutes
     "pool_pre_ping": True,  # Verify connection health before use
 }
 
+# STORY GENERATION MODE
+# SPEAKING POINT: "In 'async' mode POST /generate_story returns a job id immediately and a
+# background worker pool runs the pipeline, so web workers stay free for reads. Clients can
+# also opt in per request with {"async": true}."
+app.config["STORY_GENERATION_MODE"] = os.environ.get("STORY_GENERATION_MODE", "sync")
+
 # DATABASE INITIALIZATION
 # SPEAKING POINT: "We initialize SQLAlchemy with our Flask app, establishing the database connection
 # that will handle all our story data persistence and retrieval operations."
@@ -112,19 +68,99 @@ db.init_app(app)
 # and provide RESTful endpoints for story generation, retrieval, and management."
 from routes import *
 
-# DATABASE TABLE CREATION
-# SPEAKING POINT: "Within the application context, we ensure all database tables are created
-# based on our SQLAlchemy models. This sets up the schema for storing stories, images, and metadata."
-with app.app_context():
-    # Import models to ensure tables are created
-    import models
-    db.create_all()
-
+# STARTUP SIDE EFFECTS
+# SPEAKING POINT: "Importing this module only builds the Flask app and its routes. Logging,
+# the static asset build and the database schema are set up by initialize_app(), which the
+# entry points call (python app.py, wsgi.py for gunicorn, the maintenance scripts). Render
+# workers are started with 'spawn', which re-imports this file in every worker; keeping
+# these steps out of the import means a worker does not boot a second copy of the app."
+_initialized = False
+
+def initialize_app():
+    """Configure logging, build static assets and create database tables; runs once per process"""
+    global _initialized
+    if _initialized:
+        return app
+    _initialized = True
+
+    # PRODUCTION-GRADE LOGGING SYSTEM
+    # SPEAKING POINT: "Our logging system is enterprise-ready with both file and console output,
+    # automatic log rotation, and detailed debugging information. This is crucial for monitoring
+    # system performance and troubleshooting issues in production."
+    log_dir = 'logs'
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    # FILE HANDLER - Persistent logging with rotation
+    # SPEAKING POINT: "We use RotatingFileHandler to automatically manage log files,
+    # preventing them from growing too large and filling up disk space."
+    file_handler = RotatingFileHandler(
+        os.path.join(log_dir, 'app.log'),
+        maxBytes=10240,  # 10KB per file
+        backupCount=10   # Keep 10 backup files
+    )
+    file_handler.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+    ))
+    file_handler.setLevel(logging.DEBUG)
+
+    # CONSOLE HANDLER - Real-time debugging output
+    # SPEAKING POINT: "During development, we get immediate feedback through console logging,
+    # which is essential for debugging the complex AI pipeline interactions."
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.DEBUG)
+    console_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    console_handler.setFormatter(console_formatter)
+
+    # ROOT LOGGER CONFIGURATION
+    # SPEAKING POINT: "We configure the root logger to capture all log levels,
+    # ensuring we don't miss any important system events or errors."
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+
+    # CLEAN UP EXISTING HANDLERS - Prevent duplicate logs
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+
+    logger.addHandler(file_handler)
+    logger.addHandler(console_handler)
+
+    # ENVIRONMENT VARIABLE VALIDATION
+    # SPEAKING POINT: "We validate that all required environment variables are present
+    # before starting the application. This prevents runtime errors and ensures
+    # all AI services are properly configured."
+    logger.info("Environment variables loaded")
+    logger.debug(f"SESSION_SECRET present: {'SESSION_SECRET' in os.environ}")
+    logger.debug(f"DATABASE_URL present: {'DATABASE_URL' in os.environ}")
+    if not os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"):
+        logger.warning("GOOGLE_APPLICATION_CREDENTIALS environment variable not set. Audio generation may fail.")
+
+    # STATIC ASSET BUILD
+    # SPEAKING POINT: "CSS and JavaScript are minified, fingerprinted and precompressed once at startup,
+    # so browsers cache them forever and no response is compressed on the fly."
+    import static_assets
+    static_assets.build_assets()
+
+    # DATABASE TABLE CREATION
+    # SPEAKING POINT: "Within the application context, we ensure all database tables are created
+    # based on our SQLAlchemy models. This sets up the schema for storing stories, images, and metadata."
+    with app.app_context():
+        # Import models to ensure tables are created
+        import models
+        db.create_all()
+        # create_all only builds indexes together with new tables, so add any
+        # indexes introduced since an existing database was created
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+    return app
 
 # MAIN APPLICATION ENTRY POINT
 # SPEAKING POINT: "This is where our Flask application starts. We handle command-line arguments,
 # set up necessary directories, and launch the web server with debugging enabled for development."
 if __name__ == "__main__":
+    initialize_app()
+
     # COMMAND LINE ARGUMENT PARSING
     # SPEAKING POINT: "We support custom port configuration through command line arguments,
     # allowing flexible deployment options for different environments."
@@ -1,30 +1,203 @@
 import os
+import re
+import time
 import logging
-from gtts import gTTS
+from concurrent.futures import ThreadPoolExecutor
+from providers import get_speech_provider
+from metrics import PROVIDER_REQUEST_DURATION, TTS_CHUNKS
+from resilience import call_with_retry
+import media_store
+
+# Speech provider calls per narration chunk, including retries with backoff
+SPEECH_MAX_ATTEMPTS = int(os.environ.get('SPEECH_MAX_ATTEMPTS', 2))
+# Longest piece of text sent to the speech provider in one call
+TTS_CHUNK_CHARS = int(os.environ.get('TTS_CHUNK_CHARS', 600))
+# Chunks synthesized at the same time, shared by all stories
+TTS_CONCURRENCY = int(os.environ.get('TTS_CONCURRENCY', 4))
+
+_speech_pool = ThreadPoolExecutor(max_workers=TTS_CONCURRENCY, thread_name_prefix='tts')
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n|\n')
+_SENTENCE_END = re.compile(r'(?<=[.!?।॥])\s+|(?<=[.!?।॥]["”’\'])\s+')
+_CLAUSE_END = re.compile(r'(?<=[,;:—])\s+')
+
+def _pack(pieces, max_chars):
+    """Greedily join pieces with spaces into strings of at most max_chars"""
+    chunks, current = [], ''
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _split_long(sentence, max_chars):
+    """Break a sentence longer than max_chars at clause boundaries, then at spaces"""
+    pieces = []
+    for clause in _CLAUSE_END.split(sentence):
+        while len(clause) > max_chars:
+            cut = clause.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(clause[:cut].strip())
+            clause = clause[cut:].strip()
+        if clause:
+            pieces.append(clause)
+    return _pack(pieces, max_chars)
+
+def split_narration(text, max_chars=TTS_CHUNK_CHARS):
+    """
+    Split narration text into chunks of whole sentences.
+
+    Chunks never span paragraphs, so editing one paragraph leaves the chunks
+    (and cached audio) of every other paragraph unchanged.
+
+    Returns:
+        list: Chunks of at most max_chars characters, in reading order
+    """
+    chunks = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = ' '.join(paragraph.split())
+        if not paragraph:
+            continue
+        sentences = []
+        for sentence in _SENTENCE_END.split(paragraph):
+            if len(sentence) > max_chars:
+                sentences.extend(_split_long(sentence, max_chars))
+            elif sentence:
+                sentences.append(sentence)
+        chunks.extend(_pack(sentences, max_chars))
+    return chunks
+
+# MP3 frame parsing, enough to join segments frame by frame without re-encoding
+
+_BITRATES_MPEG1 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+_BITRATES_MPEG2 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+def _frame_length(data, offset):
+    """Length of the MPEG Layer III frame starting at offset, or None if there is no valid header"""
+    if offset + 4 > len(data) or data[offset] != 0xFF or (data[offset + 1] & 0xE0) != 0xE0:
+        return None
+    version = (data[offset + 1] >> 3) & 0x3  # 3: MPEG-1, 2: MPEG-2, 0: MPEG-2.5
+    layer = (data[offset + 1] >> 1) & 0x3    # 1: Layer III
+    bitrate_index = (data[offset + 2] >> 4) & 0xF
+    rate_index = (data[offset + 2] >> 2) & 0x3
+    padding = (data[offset + 2] >> 1) & 0x1
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrates = _BITRATES_MPEG1 if version == 3 else _BITRATES_MPEG2
+    samples_factor = 144 if version == 3 else 72
+    return samples_factor * bitrates[bitrate_index] * 1000 // _SAMPLE_RATES[version][rate_index] + padding
+
+def mp3_frames(data):
+    """
+    Return the audio frames of an MP3 file as one bytes object.
+
+    ID3v2/ID3v1 tags and the Xing/Info header frame are dropped, since they
+    describe a single file and would be wrong for the joined narration.
+    """
+    offset = 0
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        offset = 10 + size + (10 if data[5] & 0x10 else 0)
+    end = len(data) - 128 if data[-128:-125] == b'TAG' else len(data)
+
+    frames = []
+    first = True
+    while offset < end:
+        length = _frame_length(data, offset)
+        if length is None:
+            # Skip junk until the next frame sync
+            offset = data.find(b'\xff', offset + 1, end)
+            if offset == -1:
+                break
+            continue
+        frame = data[offset:offset + length]
+        if not (first and (b'Xing' in frame[:64] or b'Info' in frame[:64])):
+            frames.append(frame)
+        first = False
+        offset += length
+    return b''.join(frames)
+
+def concatenate_mp3(segment_paths, output_path):
+    """Join MP3 segments into output_path by copying their frames (no decoding or re-encoding)"""
+    with open(output_path, 'wb') as out:
+        for path in segment_paths:
+            with open(path, 'rb') as f:
+                out.write(mp3_frames(f.read()))
+
+def _synthesize(text, filepath):
+    """Call the speech provider once, recording its latency"""
+    started = time.perf_counter()
+    try:
+        get_speech_provider().synthesize(text, filepath)
+    except Exception:
+        PROVIDER_REQUEST_DURATION.observe(time.perf_counter() - started, provider='speech', outcome='error')
+        raise
+    PROVIDER_REQUEST_DURATION.observe(time.perf_counter() - started, provider='speech', outcome='ok')
+
+def _voice_settings():
+    # Recording wrappers sound exactly like the service they wrap
+    provider = get_speech_provider()
+    voice = getattr(provider, 'inner', provider)
+    return f"{voice.name}:{getattr(voice, 'lang', '')}:{getattr(voice, 'slow', False)}"
+
+def synthesize_chunk(text):
+    """
+    Return the media store path of narration audio for one chunk, synthesizing
+    it only if the same text was never synthesized with the same voice before.
+    """
+    key = media_store.content_key('tts-chunk', _voice_settings(), text)
+    path = media_store.lookup('tts', key, 'mp3')
+    if path:
+        TTS_CHUNKS.inc(result='cached')
+        return path
+
+    with media_store.writing('tts', key, 'mp3') as tmp_path:
+        call_with_retry(lambda: _synthesize(text, tmp_path), provider='speech', attempts=SPEECH_MAX_ATTEMPTS)
+    TTS_CHUNKS.inc(result='synthesized')
+    return media_store.blob_path('tts', key, 'mp3')
 
 def generate_audio_narration(story_content, story_id):
-    """Generate audio narration for the story using gTTS"""
+    """
+    Generate audio narration for the story using the speech provider (gTTS when live).
+
+    The full text is narrated: it is split into sentence chunks that are
+    synthesized concurrently (or reused from the chunk cache) and joined into
+    one MP3 without re-encoding. The result is kept in the media store, so an
+    identical narration is linked rather than generated again.
+    """
     try:
         # Ensure audio directory exists - use Mythoscribe/static path
         audio_dir = os.path.join('static', 'audio')
         os.makedirs(audio_dir, exist_ok=True)
 
-        # Generate audio using gTTS
-        # Truncate content if too long to avoid gTTS limitations
-        max_chars = 4000  # gTTS has limitations on text length
-        if len(story_content) > max_chars:
-            story_content = story_content[:max_chars]
-            logging.info(f"Truncated story content to {max_chars} characters for audio generation")
-        
-        tts = gTTS(text=story_content, lang='en', slow=False, lang_check=False)
-        
-        # Save audio file
         filename = f"story_{story_id}_narration.mp3"
         filepath = os.path.join(audio_dir, filename)
-        
-        tts.save(filepath)
+
+        key = media_store.content_key('narration', _voice_settings(), story_content)
+        blob = media_store.lookup('audio', key, 'mp3')
+        if blob:
+            logging.info(f"Reusing stored narration for story {story_id}")
+        else:
+            chunks = split_narration(story_content)
+            if not chunks:
+                logging.error("No narration text to synthesize")
+                return None
+            segment_paths = list(_speech_pool.map(synthesize_chunk, chunks))
+            logging.info(f"Synthesized narration for story {story_id} in {len(chunks)} chunk(s)")
+
+            with media_store.writing('audio', key, 'mp3') as tmp_path:
+                concatenate_mp3(segment_paths, tmp_path)
+            blob = media_store.blob_path('audio', key, 'mp3')
+
+        # Save audio file
+        media_store.link(blob, filepath)
         logging.info(f"Generated audio: {filename}")
-        
+
         # Verify file was created
         if os.path.exists(filepath):
             logging.info(f"Audio file exists at: {filepath}")
@@ -36,4 +209,4 @@ def generate_audio_narration(story_content, story_id):
 
     except Exception as e:
         logging.error(f"Audio generation failed: {e}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,385 @@
+"""
+Benchmark - End-to-end pipeline benchmark with per-stage latency and throughput
+
+Runs the full story pipeline in-process against the stub providers, so provider
+latency is simulated and repeatable while everything else (streaming parser,
+image batching, stage graph, video encoding, database commits) is real. Stories
+are generated at a configurable concurrency either by calling
+create_story_from_prompt directly (service mode) or through the Flask test
+client (http mode, POST /generate_story).
+
+Each run reports p50/p95/p99 per stage (text, images, audio, video, DB commit)
+and end to end, stories per minute and peak RSS, and can save the report as
+JSON so two commits can be compared.
+
+Usage:
+    python benchmark.py --stories 20 --concurrency 4 --output before.json
+    python benchmark.py --stories 20 --concurrency 4 --compare before.json
+    python benchmark.py --placeholders 400
+
+The benchmark runs in a scratch directory with its own SQLite database, so the
+real library and static/ media are never touched.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Stages reported in order; 'db_commit' and 'total' are measured by the harness itself
+REPORT_STAGES = ('text', 'images', 'audio', 'video', 'db_commit', 'total')
+
+# Subjects mixed into prompts so every story gets its own cache key
+SUBJECTS = ['Hanuman', 'Arjuna', 'Draupadi', 'Prahlada', 'Savitri', 'Nachiketa',
+            'Ganesha', 'Markandeya', 'Dhruva', 'Ekalavya', 'Bhishma', 'Karna']
+
+def percentile(values, pct):
+    """Linearly interpolated percentile of values (pct in 0-100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def summarize(values):
+    """Count, mean and tail latencies (seconds) of a list of durations"""
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 4),
+        'p50': round(percentile(values, 50), 4),
+        'p95': round(percentile(values, 95), 4),
+        'p99': round(percentile(values, 99), 4),
+        'max': round(max(values), 4)
+    }
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None if unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+class StageRecorder:
+    """
+    Collects stage durations from story_service progress updates.
+
+    Stage updates other than 'partial' are reported on the thread running the
+    story, so a 'running' event is paired with the next final event for the
+    same stage on the same thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = {}
+        self.durations = {stage: [] for stage in REPORT_STAGES}
+        self.failures = {stage: 0 for stage in REPORT_STAGES}
+
+    def on_progress(self, stage, status, **detail):
+        if status == 'partial' or detail.get('cached') or detail.get('coalesced'):
+            return
+        key = (threading.get_ident(), stage)
+        now = time.perf_counter()
+        with self._lock:
+            if status == 'running':
+                self._started[key] = now
+                return
+            started = self._started.pop(key, None)
+            if status == 'failed':
+                self.failures[stage] += 1
+            elif status == 'completed' and started is not None:
+                self.durations[stage].append(now - started)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.durations[stage].append(seconds)
+
+    def on_before_commit(self, session):
+        with self._lock:
+            self._started[(threading.get_ident(), 'db_commit')] = time.perf_counter()
+
+    def on_after_commit(self, session):
+        now = time.perf_counter()
+        with self._lock:
+            started = self._started.pop((threading.get_ident(), 'db_commit'), None)
+            if started is not None:
+                self.durations['db_commit'].append(now - started)
+
+def _prepare_environment(args, workdir):
+    """Point providers, database and media output at the scratch directory before importing the app"""
+    os.environ['MYTHOSCRIBE_PROVIDERS'] = 'stub'
+    os.environ['PROVIDER_STUB_LATENCY'] = args.latency
+    os.environ['MYTHOSCRIBE_DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    for folder in ('static/audio', 'static/images', 'static/videos', 'logs'):
+        os.makedirs(os.path.join(workdir, folder), exist_ok=True)
+    os.chdir(workdir)
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+
+def run_benchmark(args):
+    """
+    Generate args.stories stories at args.concurrency and measure every stage.
+
+    Returns:
+        dict: JSON-serializable report
+    """
+    workdir = tempfile.mkdtemp(prefix='mythoscribe-bench-')
+    original_cwd = os.getcwd()
+    _prepare_environment(args, workdir)
+
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    from app import app, initialize_app
+    import routes  # noqa: F401 - registers the HTTP endpoints
+    initialize_app()
+    import story_service
+
+    # The app configures verbose file and console logging; keep benchmark output readable
+    logging.getLogger().setLevel(getattr(logging, args.log_level))
+
+    recorder = StageRecorder()
+    story_service.add_progress_listener(recorder.on_progress)
+    event.listen(Session, 'before_commit', recorder.on_before_commit)
+    event.listen(Session, 'after_commit', recorder.on_after_commit)
+
+    run_id = datetime.now().strftime('%H%M%S')
+    outcomes = {'completed': 0, 'failed': 0}
+    errors = []
+    outcome_lock = threading.Lock()
+
+    def generate(index):
+        prompt = f"{SUBJECTS[index % len(SUBJECTS)]} and the trial number {index} of run {run_id}"
+        start = time.perf_counter()
+        if args.mode == 'http':
+            response = app.test_client().post('/generate_story', json={'prompt': prompt, 'async': False})
+            body = response.get_json(silent=True) or {}
+            ok = response.status_code == 200 and body.get('success')
+            error = None if ok else body.get('error') or f"HTTP {response.status_code}"
+        else:
+            with app.app_context():
+                story, error = story_service.create_story_from_prompt(prompt)
+                ok = story is not None
+        elapsed = time.perf_counter() - start
+        with outcome_lock:
+            outcomes['completed' if ok else 'failed'] += 1
+            if not ok:
+                errors.append(error)
+        if ok:
+            recorder.record('total', elapsed)
+
+    try:
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix='bench') as pool:
+            list(pool.map(generate, range(args.stories)))
+        wall = time.perf_counter() - wall_start
+    finally:
+        os.chdir(original_cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'mode': args.mode,
+            'stories': args.stories,
+            'concurrency': args.concurrency,
+            'latency': args.latency,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'workdir': workdir if args.keep else None
+        },
+        'summary': {
+            'completed': outcomes['completed'],
+            'failed': outcomes['failed'],
+            'wall_seconds': round(wall, 3),
+            'stories_per_minute': round(60 * outcomes['completed'] / wall, 2) if wall else 0.0,
+            'peak_rss_mb': peak_rss_mb(),
+            'errors': sorted(set(str(e) for e in errors))[:10]
+        },
+        'stages': {stage: dict(summarize(recorder.durations[stage]), failed=recorder.failures[stage])
+                   for stage in REPORT_STAGES}
+    }
+
+def run_placeholder_benchmark(args):
+    """
+    Micro-benchmark of the placeholder engine: images per second with the base
+    layers redrawn for every image, with cached layers, with the PNG encode,
+    and through create_placeholder_images() into an empty media store.
+
+    Returns:
+        dict: JSON-serializable report
+    """
+    workdir = tempfile.mkdtemp(prefix='mythoscribe-bench-')
+    original_cwd = os.getcwd()
+    os.chdir(workdir)
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    import io
+    import placeholder_images
+    from image_generator import STYLES
+
+    count = args.placeholders
+    slots = [(i % 4, f"{SUBJECTS[i % len(SUBJECTS)]} in scene {i}", STYLES[i % len(STYLES)]) for i in range(count)]
+
+    def uncached():
+        for slot in slots:
+            placeholder_images._base_layer.cache_clear()
+            placeholder_images._title_layer.cache_clear()
+            placeholder_images.render_placeholders([slot])
+
+    def encoded():
+        for image in placeholder_images.render_placeholders(slots):
+            image.save(io.BytesIO(), format='PNG')
+
+    def stored():
+        os.makedirs('static/images', exist_ok=True)
+        for story_id in range(0, count, 4):
+            placeholder_images.create_placeholder_images('static/images', story_id, slots[story_id:story_id + 4])
+
+    cases = (('render, layers redrawn', uncached),
+             ('render, cached layers', lambda: placeholder_images.render_placeholders(slots)),
+             ('render + PNG encode', encoded),
+             ('stored in media store', stored))
+    results = {}
+    try:
+        placeholder_images.render_placeholders(slots[:len(STYLES)])  # warm the layer caches
+        for name, case in cases:
+            start = time.perf_counter()
+            case()
+            elapsed = time.perf_counter() - start
+            results[name] = {'seconds': round(elapsed, 4), 'images_per_second': round(count / elapsed, 1)}
+    finally:
+        os.chdir(original_cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'placeholders': count,
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count()
+        },
+        'placeholders': results
+    }
+
+def print_placeholder_report(report):
+    print(f"\nRevision {report['meta']['revision'] or 'unknown'}: {report['meta']['placeholders']} placeholders")
+    print(f"{'case':<24} {'seconds':>9} {'images/s':>10}")
+    for name, stats in report['placeholders'].items():
+        print(f"{name:<24} {stats['seconds']:>9.3f} {stats['images_per_second']:>10.1f}")
+
+def _format_seconds(value):
+    return '-' if value is None else f"{value * 1000:.0f}ms"
+
+def print_report(report):
+    meta, summary = report['meta'], report['summary']
+    print(f"\nRevision {meta['revision'] or 'unknown'}: {meta['stories']} stories, "
+          f"concurrency {meta['concurrency']}, {meta['mode']} mode, latency '{meta['latency']}'")
+    print(f"{'stage':<10} {'count':>6} {'failed':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for stage, stats in report['stages'].items():
+        print(f"{stage:<10} {stats['count']:>6} {stats.get('failed', 0):>6} "
+              f"{_format_seconds(stats.get('p50')):>9} {_format_seconds(stats.get('p95')):>9} "
+              f"{_format_seconds(stats.get('p99')):>9} {_format_seconds(stats.get('max')):>9}")
+    print(f"\nCompleted {summary['completed']}, failed {summary['failed']} in {summary['wall_seconds']}s "
+          f"-> {summary['stories_per_minute']} stories/min, peak RSS {summary['peak_rss_mb']} MiB")
+    for error in summary['errors']:
+        print(f"  error: {error}")
+
+def _change(old, new):
+    if not old or new is None:
+        return '-'
+    return f"{100 * (new - old) / old:+.1f}%"
+
+def print_comparison(baseline, report):
+    """Show how report moved relative to baseline; latency increases are regressions"""
+    print(f"\nCompared with {baseline['meta'].get('revision') or 'baseline'} "
+          f"({baseline['meta'].get('timestamp')}):")
+    print(f"{'stage':<10} {'p50':>19} {'change':>8} {'p95':>19} {'change':>8}")
+    for stage, stats in report['stages'].items():
+        old = baseline.get('stages', {}).get(stage, {})
+        print(f"{stage:<10} "
+              f"{_format_seconds(old.get('p50')):>8} -> {_format_seconds(stats.get('p50')):>7} "
+              f"{_change(old.get('p50'), stats.get('p50')):>8} "
+              f"{_format_seconds(old.get('p95')):>8} -> {_format_seconds(stats.get('p95')):>7} "
+              f"{_change(old.get('p95'), stats.get('p95')):>8}")
+    old_summary = baseline.get('summary', {})
+    for key, label in (('stories_per_minute', 'stories/min'), ('peak_rss_mb', 'peak RSS MiB')):
+        old, new = old_summary.get(key), report['summary'].get(key)
+        print(f"{label:<14} {old} -> {new} ({_change(old, new)})")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Mythoscribe story pipeline in-process')
+    parser.add_argument('--stories', type=int, default=8, help='number of stories to generate')
+    parser.add_argument('--concurrency', type=int, default=2, help='stories generated at once')
+    parser.add_argument('--mode', choices=('service', 'http'), default='service',
+                        help='call create_story_from_prompt directly or go through the Flask app')
+    parser.add_argument('--latency', default='text=2.0,image=1.0,speech=1.5',
+                        help='simulated provider latency in seconds, as in PROVIDER_STUB_LATENCY')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--compare', help='JSON report of an earlier run to compare against')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory with the generated media')
+    parser.add_argument('--placeholders', type=int, metavar='COUNT',
+                        help='instead of the pipeline, time rendering COUNT placeholder images')
+    parser.add_argument('--log-level', default='WARNING', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'))
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.placeholders:
+        report = run_placeholder_benchmark(args)
+        print_placeholder_report(report)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        return 0
+
+    # Read the baseline first so a bad path fails before the run, not after it
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report = run_benchmark(args)
+    print_report(report)
+    if baseline:
+        print_comparison(baseline, report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved to {args.output}")
+    return 0 if report['summary']['failed'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
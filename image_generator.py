@@ -1,11 +1,18 @@
 import os
 import json
 import logging
-import requests
 import base64
 from pathlib import Path
 from dotenv import load_dotenv
-import random
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from providers import get_image_provider
+from resilience import call_with_retry, CircuitOpenError, EmptyResponseError, InvalidImageError
+from metrics import PROVIDER_REQUEST_DURATION, IMAGES_CREATED, record_file_written
+import media_store
+from placeholder_images import create_placeholder_images
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -15,16 +22,45 @@ env_path = Path(__file__).parent / '.env'
 if env_path.exists():
     load_dotenv(dotenv_path=env_path, override=True)
 
+# Worker threads shared by all stories for scene fetches
+IMAGE_FETCH_POOL_SIZE = int(os.environ.get('IMAGE_FETCH_POOL_SIZE', 8))
+# Maximum scenes fetched at the same time for a single story
+IMAGE_FETCH_CONCURRENCY = int(os.environ.get('IMAGE_FETCH_CONCURRENCY', 4))
+# Total wall-clock budget (seconds) for all scene fetches of a story
+IMAGE_FETCH_DEADLINE = float(os.environ.get('IMAGE_FETCH_DEADLINE', 45))
+# Calls per scene image, including retries with backoff within the deadline
+IMAGE_FETCH_ATTEMPTS = int(os.environ.get('IMAGE_FETCH_ATTEMPTS', 2))
+# Image formats accepted from the provider
+IMAGE_ACCEPTED_FORMATS = tuple(os.environ.get('IMAGE_ACCEPTED_FORMATS', 'PNG,JPEG,WEBP').upper().split(','))
+# Accepted range (pixels) for the shorter and longer side of a provider image
+IMAGE_MIN_DIMENSION = int(os.environ.get('IMAGE_MIN_DIMENSION', 64))
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', 4096))
+
+_fetch_pool = ThreadPoolExecutor(max_workers=IMAGE_FETCH_POOL_SIZE, thread_name_prefix='image-fetch')
+
+STYLES = [
+    "traditional Indian miniature art (Pahari/Kangra/Rajput style)",
+    "Kerala mural painting style",
+    "Tanjore painting style with gold leaf detailing",
+    "Mysore painting style",
+    "Pattachitra style from Odisha"
+]
+
+def style_for_scene(scene):
+    """Art style for a scene; stable, so a repeated scene maps to the same stored image"""
+    return STYLES[int(hashlib.sha256(scene.encode()).hexdigest(), 16) % len(STYLES)]
+
 def generate_story_images(story_data, story_id):
     """
     Generate images for story scenes using AI image generation services.
 
     This function handles the complete image generation pipeline:
     1. Validates and prepares the images directory
-    2. Processes each scene from the story data
-    3. Generates images using Pollinations AI as primary service
-    4. Falls back to placeholder generation if AI fails
-    5. Returns web-accessible paths for all generated images
+    2. Queues every scene from the story data on a StoryImageBatch
+    3. Fetches all slots concurrently from Pollinations AI over a shared session,
+       bounded by IMAGE_FETCH_CONCURRENCY and an overall IMAGE_FETCH_DEADLINE
+    4. Falls back to placeholder generation for any slot that failed or ran late
+    5. Returns web-accessible paths for all generated images in scene order
 
     Args:
         story_data (dict): Story data containing scenes and metadata
@@ -33,204 +69,322 @@ def generate_story_images(story_data, story_id):
     Returns:
         list: List of web paths to generated images (/static/images/filename.png)
     """
-    try:
-        logger.info(f"Starting image generation for story ID: {story_id}")
-
-        # Ensure images directory exists - use Mythoscribe/static path
-        images_dir = os.path.join('static', 'images')
-        os.makedirs(images_dir, exist_ok=True)
-
-        image_paths = []
-        scenes = story_data.get('scenes', [])
-
-        # Handle case where no scenes are provided in story data
-        if not scenes:
-            logger.warning("No scenes found in story data, creating placeholder images")
-            # Create 4 placeholder images for consistent video sequences
-            for i in range(4):
-                style = "traditional Indian miniature art"
-                create_visual_scene_image(images_dir, story_id, i, style, f"Scene {i+1} placeholder", image_paths)
-            return image_paths
+    batch = StoryImageBatch()
+    for i, scene in enumerate(story_data.get('scenes', [])):
+        batch.add_scene(i, scene)
+    return batch.finish(story_data, story_id)
 
-        if not scenes:
-            logger.warning("No scenes found in story data, creating placeholder images")
-            # Create placeholder images if no scenes
-            for i in range(4):
-                style = "traditional Indian miniature art"
-                create_visual_scene_image(images_dir, story_id, i, style, f"Scene {i+1} placeholder", image_paths)
-            return image_paths
+class StoryImageBatch:
+    """
+    Scene image fetches for one story, started as soon as each scene is known.
+
+    add_scene() can be called while the story text is still streaming in, so
+    image downloads overlap with text generation. finish() waits for the
+    fetches, fills any missing or failed slots with placeholders and writes the
+    files once the story id is known.
+
+    At most IMAGE_FETCH_CONCURRENCY requests are in flight for the story and
+    all of them share the IMAGE_FETCH_DEADLINE budget, counted from the first
+    fetch. Late results are discarded because only finish() writes files.
+    When the text request is retried, the new attempt's scenes replace the
+    old ones slot by slot.
+    """
 
-        styles = [
-            "traditional Indian miniature art (Pahari/Kangra/Rajput style)",
-            "Kerala mural painting style",
-            "Tanjore painting style with gold leaf detailing",
-            "Mysore painting style",
-            "Pattachitra style from Odisha"
-        ]
-
-        # Generate exactly 4 images for consistent video sequences
-        # Pre-select random styles to avoid repeated random.choice calls
-        selected_styles = random.choices(styles, k=4)
-        num_scenes = len(scenes)
-
-        for i in range(4):
-            if i < num_scenes:
-                scene = scenes[i]
-            else:
-                # Create a placeholder scene if we don't have enough scenes
-                scene = f"Scene {i+1}: Continuation of the Vedic story '{story_data.get('title', 'Story')}' - depicting divine characters and sacred elements in traditional Indian art style"
-            try:
-                logger.info(f"Generating image {i+1} for scene: {scene[:100]}...")
-
-                style = selected_styles[i]  # Use pre-selected style for better performance
-                # Create detailed prompt for image generation with user context
-                image_prompt = f"""Create a masterpiece digital painting in the style of {style} depicting: {scene}
-
-                ARTISTIC STYLE: {style} with exceptional detail and craftsmanship
-                QUALITY: Ultra-high resolution, professional illustration quality, photorealistic details
-                COLORS: Rich, vibrant Vedic color palette with gold, saffron, deep blues, and traditional hues
-                LIGHTING: Divine golden glow, spiritual atmosphere with ethereal light
-                COMPOSITION: Balanced, harmonious layout with proper perspective and depth
-
-                AUTHENTIC ELEMENTS TO INCLUDE:
-                - Traditional Indian/Vedic iconography and sacred symbols
-                - Authentic period-appropriate clothing and jewelry
-                - Divine attributes, mudras (hand gestures), and expressions
-                - Sacred geometry, yantras, and traditional decorative elements
-                - Cultural accuracy in architecture, objects, and settings
-
-                TECHNICAL EXCELLENCE:
-                - Sharp, crisp details with no blurring
-                - Professional color grading and contrast
-                - High dynamic range with proper shadows and highlights
-                - Traditional artistic techniques with modern digital quality
-
-                CONTEXT: This illustration is for a Vedic mythological story - ensure all elements are culturally and spiritually accurate."""
-
-                # Use Google Gemini for high-quality image generation
+    NUM_SCENES = 4
+
+    def __init__(self):
+        self.styles = {}
+        self.scenes = {}
+        self.futures = {}
+        self.queued = []
+        self.deadline = None
+        self.closed = False
+        self._lock = threading.RLock()
+
+    def add_scene(self, index, scene):
+        """
+        Start fetching the image for scene slot index. Extra slots and repeats of
+        a known scene are ignored; a different scene for a known slot (from a
+        retried response, or the final parsed story) replaces it and its fetch.
+        """
+        if index >= self.NUM_SCENES:
+            return
+        with self._lock:
+            if self.closed or self.scenes.get(index) == scene:
+                return
+            if index in self.scenes:
+                logger.info(f"Scene {index+1} changed, replacing its image fetch")
+                if index in self.queued:
+                    self.queued.remove(index)
+                future = self.futures.pop(index, None)
+                if future is not None:
+                    future.cancel()
+            self.scenes[index] = scene
+            self.styles[index] = style_for_scene(scene)
+            self.queued.append(index)
+            self._submit_queued()
+
+    def _submit_queued(self):
+        # Caller holds self._lock (an RLock: a fetch that finishes instantly
+        # runs its done-callback re-entrantly from add_done_callback)
+        while self.queued and self._in_flight() < IMAGE_FETCH_CONCURRENCY:
+            index = self.queued.pop(0)
+            scene = self.scenes[index]
+            logger.info(f"Generating image {index+1} for scene: {scene[:100]}...")
+            if self.deadline is None:
+                self.deadline = time.monotonic() + IMAGE_FETCH_DEADLINE
+            future = _fetch_pool.submit(fetch_scene_blob, scene, self.styles[index], self.deadline)
+            self.futures[index] = future
+            future.add_done_callback(self._on_fetch_done)
+
+    def _in_flight(self):
+        return sum(1 for future in self.futures.values() if not future.done())
+
+    def _on_fetch_done(self, future):
+        with self._lock:
+            if not self.closed:
+                self._submit_queued()
+
+    def cancel(self):
+        """Abandon the batch, e.g. when text generation failed"""
+        with self._lock:
+            self.closed = True
+            self.queued = []
+            for future in self.futures.values():
+                future.cancel()
+
+    def finish(self, story_data, story_id, on_image=None):
+        """
+        Wait for outstanding fetches and write the scene images for story_id.
+
+        Each slot is written as soon as its fetch lands (or fails), and
+        on_image(index, web_path) is called for it right away so callers can
+        show images progressively.
+
+        Returns:
+            list: Web paths of the NUM_SCENES images, in scene order
+        """
+        try:
+            # Ensure images directory exists - use Mythoscribe/static path
+            images_dir = os.path.join('static', 'images')
+            os.makedirs(images_dir, exist_ok=True)
+
+            # Handle case where no scenes are provided in story data
+            if not self.scenes and not story_data.get('scenes'):
+                logger.warning("No scenes found in story data, creating placeholder images")
+                self.cancel()
+                # Create 4 placeholder images for consistent video sequences, in one batch
+                slots = [(i, f"Scene {i+1} placeholder", STYLES[0]) for i in range(self.NUM_SCENES)]
                 try:
-                    logger.info(f"Generating image using Gemini API for scene: {scene[:100]}...")
-
-                    # Create detailed prompt for Gemini image generation with user context
-                    gemini_prompt = f"""Create a masterpiece digital painting depicting: {scene}
-
-ARTISTIC STYLE: {style} with exceptional detail and craftsmanship
-QUALITY: Ultra-high resolution, professional illustration quality, photorealistic details
-COLORS: Rich, vibrant Vedic color palette with gold, saffron, deep blues, and traditional hues
-LIGHTING: Divine golden glow, spiritual atmosphere with ethereal light
-COMPOSITION: Balanced, harmonious layout with proper perspective and depth
-
-AUTHENTIC ELEMENTS TO INCLUDE:
-- Traditional Indian/Vedic iconography and sacred symbols
-- Authentic period-appropriate clothing and jewelry
-- Divine attributes, mudras (hand gestures), and expressions
-- Sacred geometry, yantras, and traditional decorative elements
-- Cultural accuracy in architecture, objects, and settings
-
-TECHNICAL EXCELLENCE:
-- Sharp, crisp details with no blurring
-- Professional color grading and contrast
-- High dynamic range with proper shadows and highlights
-- Traditional artistic techniques with modern digital quality
-
-CONTEXT: This illustration is for a Vedic mythological story - ensure all elements are culturally and spiritually accurate.
-
-Make this a complete visual scene that tells the story, not just text or descriptions."""
+                    web_paths = create_placeholder_images(images_dir, story_id, slots)
+                    image_paths = [web_paths[i] for i in range(self.NUM_SCENES)]
+                except Exception as e:
+                    logger.error(f"Error creating placeholder images: {str(e)}", exc_info=True)
+                    image_paths = []
+                    for i, scene, style in slots:
+                        create_simple_placeholder_image(images_dir, story_id, i, style, scene, image_paths)
+                if on_image:
+                    for i, web_path in enumerate(image_paths):
+                        on_image(i, web_path)
+                return image_paths
+
+            # Reconcile with the parsed story: queue scenes the stream never delivered, replace any
+            # streamed by a discarded attempt, and add continuation scenes to reach 4
+            scenes = story_data.get('scenes', [])
+            for i in range(self.NUM_SCENES):
+                if i < len(scenes):
+                    self.add_scene(i, scenes[i])
+                else:
+                    # Create a placeholder scene if we don't have enough scenes
+                    self.add_scene(i, f"Scene {i+1}: Continuation of the Vedic story '{story_data.get('title', 'Story')}' - depicting divine characters and sacred elements in traditional Indian art style")
+
+            slot_paths = [None] * self.NUM_SCENES
+            for i, blob, reused in self._iter_results():
+                slot_paths[i] = self._write_slot(images_dir, story_id, i, blob, reused)
+                if on_image and slot_paths[i]:
+                    try:
+                        on_image(i, slot_paths[i])
+                    except Exception as e:
+                        logger.warning(f"Image callback failed for scene {i+1}: {e}")
 
-                    # Use Pollinations AI for image generation (Gemini image generation not available)
-                    logger.info("Using Pollinations AI for image generation...")
+            image_paths = [path for path in slot_paths if path]
+            logger.info(f"Image generation completed for story {story_id}, generated {len(image_paths)} images")
+            return image_paths
 
-                    # Create optimized prompt for Pollinations AI
-                    visual_prompt = f"Indian mythology {scene[:50]} traditional art colorful divine"
-                    encoded_prompt = visual_prompt.replace(' ', '%20').replace(',', '%2C')
-                    API_URL = f"https://image.pollinations.ai/prompt/{encoded_prompt}?width=512&height=384&nologo=true&model=flux"
+        except Exception as e:
+            logger.error(f"Image generation failed: {str(e)}", exc_info=True)
+            return []
+
+    def _write_slot(self, images_dir, story_id, index, blob, reused=False):
+        """
+        Link the stored image for a slot, or a placeholder when there is none;
+        returns the web path. reused says the blob came from the media store
+        rather than from the provider.
+        """
+        scene, style = self.scenes[index], self.styles[index]
+        slot_paths = []
+        try:
+            if blob is not None:
+                filename = f"story_{story_id}_scene_{index+1}.png"
+                filepath = os.path.join(images_dir, filename)
+
+                media_store.link(blob, filepath)
+                if reused:
+                    IMAGES_CREATED.inc(source='store')
+                    logger.info(f"Linked stored scene image: {filepath}")
+                else:
+                    IMAGES_CREATED.inc(source='provider')
+                    logger.info(f"Successfully generated image with Pollinations AI: {filepath}")
+                return f"/static/images/{filename}"
+            create_visual_scene_image(images_dir, story_id, index, style, scene, slot_paths)
+        except Exception as e:
+            logger.error(f"Error generating image {index+1}: {str(e)}", exc_info=True)
+            create_visual_scene_image(images_dir, story_id, index, style, scene, slot_paths)
+        return slot_paths[0] if slot_paths else None
+
+    def _iter_results(self):
+        """
+        Yield (index, blob path or None, reused) for each slot as soon as its fetch finishes.
+
+        Slots still outstanding at the deadline are cancelled and yielded last
+        with None so they fall back to placeholders.
+        """
+        reported = set()
+        while True:
+            with self._lock:
+                # Top up the window in case a done-callback has not run yet
+                self._submit_queued()
+                done = [(i, f) for i, f in self.futures.items() if f.done() and i not in reported]
+                pending = [f for f in self.futures.values() if not f.done()]
+
+            for i, future in done:
+                reported.add(i)
+                blob, reused = None, False
+                try:
+                    blob, reused = future.result()
+                except Exception as poll_error:
+                    logger.warning(f"Pollinations AI request failed for scene {i+1}: {str(poll_error)}, creating visual placeholder")
+                yield i, blob, reused
+
+            if not pending:
+                break
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+        with self._lock:
+            self.closed = True
+            for future in self.futures.values():
+                future.cancel()
+
+        late = [i for i in range(self.NUM_SCENES) if i not in reported]
+        if late:
+            logger.warning(f"Image fetch deadline of {IMAGE_FETCH_DEADLINE}s reached, "
+                           f"{len(late)} scene(s) will use placeholders")
+        for i in late:
+            yield i, None, False
+
+def validate_image(filepath):
+    """
+    Check that a downloaded file is a complete image we can use.
 
-                    try:
-                        response = requests.get(API_URL, timeout=30)  # Reduced timeout
+    The header is checked first (format, dimensions), so an oversized image is
+    rejected before anything is decoded; the full decode then catches
+    truncated or corrupt data that would otherwise only fail in the video step.
 
-                        if response.status_code == 200 and 'image' in response.headers.get('content-type', ''):
-                            filename = f"story_{story_id}_scene_{i+1}.png"
-                            filepath = os.path.join(images_dir, filename)
+    Raises:
+        InvalidImageError: The file is not an acceptable image
+    """
+    from PIL import Image
 
-                            with open(filepath, "wb") as f:
-                                f.write(response.content)
+    try:
+        with Image.open(filepath) as image:
+            if image.format not in IMAGE_ACCEPTED_FORMATS:
+                raise InvalidImageError(f"Unexpected image format {image.format}")
+            width, height = image.size
+            if not (IMAGE_MIN_DIMENSION <= min(width, height) and max(width, height) <= IMAGE_MAX_DIMENSION):
+                raise InvalidImageError(f"Unexpected image size {width}x{height}")
+            image.load()
+    except InvalidImageError:
+        raise
+    except Exception as e:
+        raise InvalidImageError(f"Corrupt image: {e}") from e
 
-                            web_path = f"/static/images/{filename}"
-                            image_paths.append(web_path)
-                            logger.info(f"Successfully generated image with Pollinations AI: {filepath}")
-                        else:
-                            logger.warning(f"Pollinations AI failed with status {response.status_code}, creating visual placeholder")
-                            create_visual_scene_image(images_dir, story_id, i, style, scene, image_paths)
-                    except Exception as poll_error:
-                        logger.warning(f"Pollinations AI request failed: {str(poll_error)}, creating visual placeholder")
-                        create_visual_scene_image(images_dir, story_id, i, style, scene, image_paths)
+def fetch_scene_image(scene, filepath, deadline=None):
+    """
+    Fetch a single scene illustration from the configured image provider
+    (Pollinations AI when live) into filepath, retrying with backoff until
+    deadline. Responses that fail validate_image() are retried like errors.
 
-                except Exception as e:
-                    logger.error(f"Error with image generation: {str(e)}")
-                    create_visual_scene_image(images_dir, story_id, i, style, scene, image_paths)
+    While the image provider's circuit is open no request is made at all, so
+    the slot goes straight to a create_visual_scene_image placeholder.
 
-            except Exception as e:
-                logger.error(f"Error generating placeholder image {i+1}: {str(e)}", exc_info=True)
-                continue
+    Returns:
+        bool: Whether filepath now holds a valid image
+    """
+    def request_image():
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            fetched = get_image_provider().fetch(scene, filepath)
+            if fetched:
+                outcome = 'invalid'
+                validate_image(filepath)
+            outcome = 'ok' if fetched else 'empty'
+        finally:
+            PROVIDER_REQUEST_DURATION.observe(time.perf_counter() - started, provider='image', outcome=outcome)
+        if not fetched:
+            raise EmptyResponseError("Image provider returned no image")
+        return True
 
-        logger.info(f"Image generation completed for story {story_id}, generated {len(image_paths)} images")
-        return image_paths
+    try:
+        return call_with_retry(request_image, provider='image', attempts=IMAGE_FETCH_ATTEMPTS, deadline=deadline)
+    except CircuitOpenError:
+        logger.info("Image provider circuit is open, using a placeholder")
+        return False
+    except InvalidImageError as e:
+        logger.warning(f"Rejected image from the provider: {e}")
+        return False
+    except EmptyResponseError:
+        return False
+
+def scene_image_key(scene, style):
+    """Media store key of the provider image for a scene"""
+    provider = get_image_provider()
+    source = getattr(provider, 'inner', provider)
+    return media_store.content_key('scene-image', source.name, scene, style)
+
+def fetch_scene_blob(scene, style, deadline=None):
+    """
+    Return the stored image for a scene, fetching it only when no earlier story
+    already did.
 
-    except Exception as e:
-        logger.error(f"Image generation failed: {str(e)}", exc_info=True)
-        return []
+    Returns:
+        (str, bool): Path of the media store blob (None if no image could be
+        fetched), and whether it was already stored
+    """
+    key = scene_image_key(scene, style)
+    blob = media_store.lookup('image', key, 'png')
+    if blob:
+        logger.info(f"Reusing stored image for scene: {scene[:60]}")
+        return blob, True
+    # The download goes to a temp file that is only renamed into the store once
+    # it validated, so readers never see a partial or broken image
+    try:
+        with media_store.writing('image', key, 'png') as tmp_path:
+            if not fetch_scene_image(scene, tmp_path, deadline):
+                raise EmptyResponseError("No image was fetched")
+    except EmptyResponseError:
+        return None, False
+    return media_store.blob_path('image', key, 'png'), False
 
 def create_visual_scene_image(images_dir, story_id, index, style, scene, image_paths):
     """Create simplified visual scene representation"""
     try:
-        from PIL import Image, ImageDraw, ImageFont
-
-        # Create simple canvas with gradient background
-        width, height = 512, 384  # Smaller size for faster generation
-        image = Image.new('RGB', (width, height), color=(135, 206, 235))  # Sky blue
-        draw = ImageDraw.Draw(image)
-
-        # Simple ground
-        draw.rectangle([0, height//2, width, height], fill=(139, 69, 19))
-
-        # Simple mountain
-        mountain_points = [(0, height//2), (width//3, height//2 - 60), (2*width//3, height//2 - 40), (width, height//2)]
-        draw.polygon(mountain_points, fill=(101, 67, 33))
-
-        # Simple tree
-        tree_x = width//4
-        draw.rectangle([tree_x-3, height//2, tree_x+3, height//2 + 30], fill=(101, 67, 33))
-        draw.ellipse([tree_x-15, height//2 - 15, tree_x+15, height//2 + 15], fill=(34, 139, 34))
-
-        # Simple figure based on scene
-        if any(keyword in scene.lower() for keyword in ['hanuman', 'monkey', 'vanara']):
-            figure_x, figure_y = width//2, height//2 + 20
-            draw.ellipse([figure_x-10, figure_y, figure_x+10, figure_y+40], fill=(255, 140, 0))
-            draw.ellipse([figure_x-8, figure_y-15, figure_x+8, figure_y+5], fill=(255, 140, 0))
-        elif any(keyword in scene.lower() for keyword in ['krishna', 'rama', 'lord']):
-            figure_x, figure_y = width//2, height//2 + 20
-            color = (0, 100, 200) if 'krishna' in scene.lower() else (255, 215, 0)
-            draw.ellipse([figure_x-8, figure_y, figure_x+8, figure_y+35], fill=color)
-            draw.ellipse([figure_x-6, figure_y-12, figure_x+6, figure_y+3], fill=(255, 220, 177))
-
-        # Simple sun
-        draw.ellipse([width-60, 20, width-20, 60], fill=(255, 255, 0))
-
-        # Title
-        font = ImageFont.load_default()
-        title = f"Scene {index+1}"
-        title_bbox = draw.textbbox((0, 0), title, font=font)
-        title_width = title_bbox[2] - title_bbox[0]
-        title_x = (width - title_width) // 2
-        draw.text((title_x, 10), title, fill=(0, 0, 0), font=font)
-
-        # Save the image
-        filename = f"story_{story_id}_scene_{index+1}.png"
-        filepath = os.path.join(images_dir, filename)
-        image.save(filepath)
-        web_path = f"/static/images/{filename}"
+        web_path = create_placeholder_images(images_dir, story_id, [(index, scene, style)])[index]
         image_paths.append(web_path)
-        logging.info(f"Created simplified visual scene image: {filepath}")
+        logging.info(f"Created simplified visual scene image: {web_path}")
 
     except Exception as e:
         logging.error(f"Error creating visual scene image: {str(e)}", exc_info=True)
@@ -254,9 +408,23 @@ def create_simple_placeholder_image(images_dir, story_id, index, style, scene, i
         filepath = os.path.join(images_dir, filename)
 
         image.save(filepath)
+        IMAGES_CREATED.inc(source='placeholder')
+        record_file_written('image', filepath)
         web_path = f"/static/images/{filename}"
         image_paths.append(web_path)
         logging.info(f"Created simple placeholder: {filepath}")
 
     except Exception as e:
-        logging.error(f"Error creating simple placeholder: {str(e)}")
\ No newline at end of file
+        logging.error(f"Error creating simple placeholder: {str(e)}")
+
+def create_missing_scene_images(images_dir, story_id, indices):
+    """
+    Draw placeholders for scenes missing from an existing story, all in one
+    batch. Used by regenerate_missing_images.py through the render farm.
+
+    Returns:
+        list: Web paths of the new images, in the order of indices
+    """
+    # The original scene text is gone, so these get the plain landscape of the default style
+    web_paths = create_placeholder_images(images_dir, story_id, [(index, '', STYLES[0]) for index in indices])
+    return [web_paths[index] for index in indices]
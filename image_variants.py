@@ -0,0 +1,168 @@
+"""
+Image Variants - Resized WebP/AVIF derivatives of story images
+
+Scene images are stored as lossless PNGs of up to 800x600, which is what the
+video and the full-size modal need, but far more than a library card or the
+story page grid shows. For every scene image this module writes smaller
+variants next to it:
+
+    static/images/story_12_scene_1.png
+    static/images/variants/story_12_scene_1-400w.webp
+    static/images/variants/story_12_scene_1-400w.avif
+    static/images/variants/story_12_scene_1-800w.webp   ...
+
+Variant paths follow from the image path alone, so templates and to_dict()
+can point at them without any extra columns; image_sources() only lists
+formats whose files actually exist, and pages fall back to the PNG for images
+that have no variants yet (run regenerate_image_variants.py to backfill).
+
+Like the images themselves, variants are blobs in the media store keyed by the
+source image's bytes, so a scene image shared by several stories is encoded
+once. Images are never upscaled: a variant wider than its source keeps the
+source width, and image_sources() describes it by that width.
+"""
+
+import os
+import hashlib
+import logging
+from functools import lru_cache
+import media_store
+
+logger = logging.getLogger(__name__)
+
+# Variant widths in pixels, matching the card and grid sizes at 1x and 2x density
+IMAGE_VARIANT_WIDTHS = tuple(int(w) for w in os.environ.get('IMAGE_VARIANT_WIDTHS', '400,800').split(','))
+# Variant formats, best compression first (formats this Pillow build cannot write are skipped)
+IMAGE_VARIANT_FORMATS = tuple(os.environ.get('IMAGE_VARIANT_FORMATS', 'avif,webp').split(','))
+# Encoder quality (0-100) per format
+IMAGE_VARIANT_QUALITY = {'webp': int(os.environ.get('WEBP_QUALITY', 70)),
+                         'avif': int(os.environ.get('AVIF_QUALITY', 45))}
+
+VARIANTS_DIR = 'variants'
+
+_MIME_TYPES = {'webp': 'image/webp', 'avif': 'image/avif'}
+_ENCODER_OPTIONS = {'webp': {'method': 4}, 'avif': {'speed': 8}}
+
+_supported_formats = None
+
+def supported_formats():
+    """IMAGE_VARIANT_FORMATS that the installed Pillow can encode"""
+    global _supported_formats
+    if _supported_formats is None:
+        from PIL import features
+        _supported_formats = tuple(fmt for fmt in IMAGE_VARIANT_FORMATS if features.check(fmt))
+        skipped = set(IMAGE_VARIANT_FORMATS) - set(_supported_formats)
+        if skipped:
+            logger.warning(f"Pillow cannot encode {', '.join(sorted(skipped))}; those image variants are skipped")
+    return _supported_formats
+
+def variant_web_path(web_path, width, fmt):
+    """Web path of one variant of the image at web_path"""
+    directory, filename = web_path.rsplit('/', 1)
+    stem = os.path.splitext(filename)[0]
+    return f"{directory}/{VARIANTS_DIR}/{stem}-{width}w.{fmt}"
+
+@lru_cache(maxsize=1024)
+def _image_width(filepath, identity):
+    # identity (inode, mtime) changes whenever the file is replaced
+    from PIL import Image
+
+    with Image.open(filepath) as image:
+        return image.width
+
+def source_width(filepath):
+    """Pixel width of an image file (read from its header), or None if it cannot be read"""
+    try:
+        stat = os.stat(filepath)
+        return _image_width(filepath, (stat.st_ino, stat.st_mtime_ns))
+    except Exception:
+        return None
+
+def image_sources(web_path):
+    """
+    <source> descriptions for an image, for templates and to_dict().
+
+    Each variant is described by its real width: images are never upscaled,
+    so for a 512 px source the -800w variant is 512 px wide, and variants
+    that come out the same width are listed once.
+
+    Returns:
+        list: {'type': mime type, 'srcset': 'url 400w, url 512w'} per format
+        whose variants all exist, best format first; empty when the image has
+        no variants (callers then use the original)
+    """
+    sources = []
+    if not web_path or not web_path.startswith('/'):
+        return sources
+    width_limit = source_width(web_path.lstrip('/'))
+    if width_limit is None:
+        return sources
+    for fmt in supported_formats():
+        paths = [(variant_web_path(web_path, width, fmt), min(width, width_limit)) for width in IMAGE_VARIANT_WIDTHS]
+        if all(os.path.exists(path.lstrip('/')) for path, _ in paths):
+            candidates = {}
+            for path, width in paths:
+                candidates.setdefault(width, path)
+            sources.append({'type': _MIME_TYPES[fmt],
+                            'srcset': ', '.join(f"{path} {width}w" for width, path in sorted(candidates.items()))})
+    return sources
+
+def _encode(image, fmt, tmp_path):
+    image.save(tmp_path, format=fmt.upper(), quality=IMAGE_VARIANT_QUALITY[fmt], **_ENCODER_OPTIONS[fmt])
+
+def generate_image_variants(web_path):
+    """
+    Write every variant of one image, reusing stored encodes of identical images.
+
+    Args:
+        web_path (str): Web path of the source image (/static/images/...)
+
+    Returns:
+        int: Number of variants encoded (0 when all were already stored)
+    """
+    from PIL import Image
+
+    filepath = web_path.lstrip('/')
+    with open(filepath, 'rb') as f:
+        source_hash = hashlib.sha256(f.read()).hexdigest()
+
+    image = None
+    encoded = 0
+    for width in IMAGE_VARIANT_WIDTHS:
+        resized = None
+        for fmt in supported_formats():
+            key = media_store.content_key('image-variant', 'v1', source_hash, width, fmt, IMAGE_VARIANT_QUALITY[fmt])
+            blob = media_store.lookup('variant', key, fmt)
+            if not blob:
+                if resized is None:
+                    if image is None:
+                        image = Image.open(filepath).convert('RGB')
+                    target = min(width, image.width)
+                    resized = image.resize((target, round(image.height * target / image.width)), Image.LANCZOS)
+                with media_store.writing('variant', key, fmt) as tmp_path:
+                    _encode(resized, fmt, tmp_path)
+                blob = media_store.blob_path('variant', key, fmt)
+                encoded += 1
+            media_store.link(blob, variant_web_path(web_path, width, fmt).lstrip('/'))
+    return encoded
+
+def generate_story_variants(image_paths):
+    """
+    Write the variants of a story's images. Runs as an 'images' render farm job.
+
+    Returns:
+        int: Number of variants encoded
+    """
+    encoded = 0
+    for web_path in image_paths:
+        try:
+            encoded += generate_image_variants(web_path)
+        except Exception as e:
+            logger.error(f"Could not create variants of {web_path}: {e}")
+    logger.info(f"Encoded {encoded} image variant(s) for {len(image_paths)} image(s)")
+    return encoded
+
+def variant_file_paths(web_path):
+    """Filesystem paths of every possible variant of an image, for deletion"""
+    return [variant_web_path(web_path, width, fmt).lstrip('/')
+            for width in IMAGE_VARIANT_WIDTHS for fmt in IMAGE_VARIANT_FORMATS]
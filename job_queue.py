@@ -0,0 +1,313 @@
+"""
+Job Queue - Runs story generation in a background worker pool
+
+POST /generate_story can hand the prompt to this module and return at once with
+a job id. The pipeline then runs on a worker thread, recording each stage's
+status on a GenerationJob row so any web worker can answer /api/jobs/<id>.
+Fine-grained progress (text chunks, each image, audio, video) is also published
+to an in-process event log that backs the /api/jobs/<id>/events SSE stream.
+
+Jobs live only in the pool of the process that accepted them, so that process
+heartbeats its queued and running jobs (bumping updated_at). A job whose
+heartbeat stops for JOB_STALE_AFTER seconds lost its process and is marked
+failed the next time anyone looks it up, which also ends its SSE stream.
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from database import db
+from models import GenerationJob, Story
+from story_service import create_story_from_prompt, PIPELINE_STAGES
+
+logger = logging.getLogger(__name__)
+
+# Number of stories generated concurrently by each web process
+JOB_WORKERS = int(os.environ.get('STORY_JOB_WORKERS', 2))
+
+# Seconds a finished job's event history is kept for late SSE subscribers
+JOB_EVENT_RETENTION = int(os.environ.get('JOB_EVENT_RETENTION', 600))
+
+# Seconds between heartbeats of the jobs this process has queued or is running
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get('JOB_HEARTBEAT_INTERVAL', 30))
+# A queued or running job with no heartbeat for this long is failed as abandoned
+JOB_STALE_AFTER = float(os.environ.get('JOB_STALE_AFTER', 180))
+
+_executor = None
+_executor_lock = threading.Lock()
+# Ids of the jobs this process has queued or is running
+_active_jobs = set()
+_heartbeat_thread = None
+
+class JobEventLog:
+    """
+    Append-only history of pipeline events per job with blocking readers.
+
+    Subscribers replay everything published so far and then wait for new
+    events, so a client that connects late still sees the full progression.
+    """
+
+    def __init__(self, retention=JOB_EVENT_RETENTION):
+        self.retention = retention
+        self._events = {}
+        self._closed = {}
+        self._cond = threading.Condition()
+
+    def open(self, job_id):
+        with self._cond:
+            self._expire()
+            self._events.setdefault(job_id, [])
+
+    def publish(self, job_id, event, data):
+        with self._cond:
+            if job_id in self._events:
+                self._events[job_id].append((event, data))
+                self._cond.notify_all()
+
+    def close(self, job_id):
+        with self._cond:
+            self._closed[job_id] = time.monotonic()
+            self._cond.notify_all()
+
+    def has(self, job_id):
+        with self._cond:
+            return job_id in self._events
+
+    def subscribe(self, job_id, heartbeat=15):
+        """Yield (event, data) tuples until the job closes; yields None as a heartbeat while idle"""
+        position = 0
+        while True:
+            with self._cond:
+                events = self._events.get(job_id, [])
+                if position >= len(events) and job_id not in self._closed:
+                    self._cond.wait(timeout=heartbeat)
+                    events = self._events.get(job_id, [])
+                batch = events[position:]
+                position += len(batch)
+                finished = job_id in self._closed or job_id not in self._events
+
+            for item in batch:
+                yield item
+            if finished and not batch:
+                return
+            if not batch:
+                yield None
+
+    def _expire(self):
+        # Caller holds self._cond
+        cutoff = time.monotonic() - self.retention
+        for job_id, closed_at in list(self._closed.items()):
+            if closed_at < cutoff:
+                self._closed.pop(job_id, None)
+                self._events.pop(job_id, None)
+
+job_events = JobEventLog()
+
+def _get_executor():
+    """Create the worker pool lazily so forked gunicorn workers each get their own threads"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='story-job')
+        return _executor
+
+def _start_heartbeat(app):
+    global _heartbeat_thread
+    with _executor_lock:
+        if _heartbeat_thread is None or not _heartbeat_thread.is_alive():
+            _heartbeat_thread = threading.Thread(target=_heartbeat_loop, args=(app,), name='story-job-heartbeat',
+                                                 daemon=True)
+            _heartbeat_thread.start()
+
+def _heartbeat_loop(app):
+    """Keep updated_at fresh on this process's jobs so other processes can tell they are alive"""
+    while True:
+        time.sleep(JOB_HEARTBEAT_INTERVAL)
+        with _executor_lock:
+            job_ids = list(_active_jobs)
+        if not job_ids:
+            continue
+        with app.app_context():
+            try:
+                GenerationJob.query.filter(GenerationJob.id.in_(job_ids),
+                                           GenerationJob.status.in_(('queued', 'running'))).update(
+                    {GenerationJob.updated_at: datetime.utcnow()}, synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Job heartbeat failed: {e}")
+
+def submit_story_job(app, prompt, permit=None):
+    """
+    Record a queued generation job and schedule it on the worker pool.
+
+    Args:
+        app (Flask): Application used to push an app context on the worker thread
+        prompt (str): User-provided story prompt
+        permit (Permit): Optional admission permit; the job waits for its slot
+                         before running and releases it when done
+
+    Returns:
+        GenerationJob: The newly created job record
+    """
+    try:
+        job = GenerationJob(id=uuid.uuid4().hex, prompt=prompt, status='queued')
+        job.set_stages({stage: 'pending' for stage in PIPELINE_STAGES})
+        db.session.add(job)
+        db.session.commit()
+        job_events.open(job.id)
+        logger.info(f"Queued story generation job {job.id}")
+
+        with _executor_lock:
+            _active_jobs.add(job.id)
+        _start_heartbeat(app)
+        _get_executor().submit(_run_story_job, app, job.id, permit)
+    except Exception:
+        if permit is not None:
+            permit.release()
+        raise
+    return job
+
+def get_job(job_id):
+    """Return the job record for job_id, or None if it does not exist; abandoned jobs are failed first"""
+    return fail_if_stale(db.session.get(GenerationJob, job_id))
+
+def fail_if_stale(job):
+    """Mark a queued or running job failed if its heartbeat stopped (its process died); returns job"""
+    if job is None or job.status not in ('queued', 'running'):
+        return job
+    with _executor_lock:
+        if job.id in _active_jobs:
+            return job
+    last_seen = job.updated_at or job.created_at
+    if last_seen and last_seen >= datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER):
+        return job
+    job.status = 'failed'
+    job.error = 'The worker running this job stopped before it finished'
+    db.session.commit()
+    logger.warning(f"Job {job.id} failed as abandoned: no heartbeat since {last_seen}")
+    return job
+
+def _run_story_job(app, job_id, permit=None):
+    """Worker entry point: run the full pipeline and keep the job record up to date"""
+    with app.app_context():
+        job = get_job(job_id)
+        if job is None:
+            logger.error(f"Story generation job {job_id} vanished before it started")
+            if permit is not None:
+                permit.release()
+            with _executor_lock:
+                _active_jobs.discard(job_id)
+            return
+
+        try:
+            # Accepted jobs already passed the queue bound, so they wait as long as it takes
+            if permit is not None:
+                permit.wait()
+
+            job.status = 'running'
+            db.session.commit()
+
+            def progress(stage, status, **detail):
+                # Incremental output only goes to SSE subscribers; it may come from
+                # worker threads, so it must not touch the database session
+                if status == 'partial':
+                    if stage == 'text' and 'attempt' in detail:
+                        job_events.publish(job_id, 'attempt', {'attempt': detail['attempt']})
+                    elif stage == 'text':
+                        job_events.publish(job_id, 'text', {'text': detail.get('text', '')})
+                    elif stage == 'images':
+                        job_events.publish(job_id, 'image', {'index': detail.get('index'), 'path': detail.get('path')})
+                    return
+
+                job_events.publish(job_id, 'stage', {'stage': stage, 'status': status,
+                                                     'story_id': detail.get('story_id')})
+                if status == 'completed' and stage in ('audio', 'video'):
+                    job_events.publish(job_id, stage, {'path': detail.get(f'{stage}_path')})
+
+                stages = job.get_stages()
+                stages[stage] = status
+                job.set_stages(stages)
+                job.stage = stage
+                if detail.get('story_id'):
+                    job.story_id = detail['story_id']
+                db.session.commit()
+
+            story, error_message = create_story_from_prompt(job.prompt, progress=progress)
+
+            if story:
+                job.story_id = story.id
+                job.status = 'completed'
+                logger.info(f"Job {job_id} completed with story {story.id}")
+            else:
+                job.status = 'failed'
+                job.error = error_message
+                logger.warning(f"Job {job_id} failed: {error_message}")
+            db.session.commit()
+
+            if story:
+                job_events.publish(job_id, 'done', {'story': story.to_dict()})
+            else:
+                job_events.publish(job_id, 'failed', {'error': error_message})
+
+        except Exception as e:
+            logger.error(f"Story generation job {job_id} crashed: {e}", exc_info=True)
+            db.session.rollback()
+            job = get_job(job_id)
+            if job is not None:
+                job.status = 'failed'
+                job.error = f"An error occurred while generating the story: {str(e)}"
+                db.session.commit()
+            job_events.publish(job_id, 'failed', {'error': 'An error occurred while generating the story'})
+        finally:
+            if permit is not None:
+                permit.release()
+            with _executor_lock:
+                _active_jobs.discard(job_id)
+            job_events.close(job_id)
+
+def iter_job_events(job_id, poll_interval=1.0, heartbeat=15):
+    """
+    Yield (event, data) progress events for a job, or None as an idle heartbeat.
+
+    Jobs running in this process stream their full event log. Jobs owned by
+    another worker process are followed by polling the GenerationJob row, which
+    gives stage-level events and the final result without text or image detail.
+    """
+    if job_events.has(job_id):
+        yield from job_events.subscribe(job_id, heartbeat=heartbeat)
+        return
+
+    seen = {}
+    idle = 0.0
+    while True:
+        db.session.expire_all()
+        job = get_job(job_id)
+        if job is None:
+            yield 'failed', {'error': 'Job not found'}
+            return
+
+        changed = False
+        for stage, status in job.get_stages().items():
+            if seen.get(stage) != status:
+                seen[stage] = status
+                changed = True
+                yield 'stage', {'stage': stage, 'status': status, 'story_id': job.story_id}
+
+        if job.status == 'completed':
+            story = db.session.get(Story, job.story_id) if job.story_id else None
+            yield 'done', {'story': story.to_dict() if story else None}
+            return
+        if job.status == 'failed':
+            yield 'failed', {'error': job.error}
+            return
+
+        idle = 0.0 if changed else idle + poll_interval
+        if idle >= heartbeat:
+            idle = 0.0
+            yield None
+        time.sleep(poll_interval)
@@ -0,0 +1,133 @@
+"""
+Media Serving - Range-aware, zero-copy delivery of narration audio and videos
+
+Story audio (/static/audio/...) and videos (/static/videos/...) are served by
+media_response() rather than Flask's static handler. Every response carries an
+ETag and Last-Modified, answers If-None-Match/If-Modified-Since with 304 and
+Range requests (seeking in a player) with 206 Partial Content for just the
+requested bytes, so a seek never re-downloads what the browser already has.
+
+How the bytes leave the process depends on MEDIA_SENDFILE:
+
+- unset (default): the file is handed to the WSGI server's wsgi.file_wrapper,
+  which gunicorn sends with sendfile() without copying it through Python. This
+  includes range responses: the file is positioned at the range start and
+  Content-Length bounds the transfer (werkzeug's own range iterator would read
+  it in Python chunks instead).
+- 'x-accel-redirect': the response only names the file and nginx sends it from
+  an internal location, handling ranges and caching headers itself:
+
+      location /_media/ {
+          internal;
+          alias /path/to/mythoscribe/static/;
+      }
+
+- 'x-sendfile': the same for Apache (mod_xsendfile) or lighttpd, by absolute path.
+
+In the proxy modes a worker is busy only for the few microseconds it takes to
+build the headers, whatever the size of the file.
+"""
+
+import os
+import logging
+import mimetypes
+from urllib.parse import quote
+from metrics import MEDIA_RESPONSES
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+# How media bodies are sent: '' (by the WSGI server), 'x-accel-redirect' (nginx) or 'x-sendfile'
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '').lower()
+# Internal nginx location aliased to the static folder, for X-Accel-Redirect
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/_media/')
+# Browser cache lifetime (seconds); 0 makes browsers revalidate, which is cheap with ETags
+MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', 0))
+
+if MEDIA_SENDFILE not in ('', 'x-accel-redirect', 'x-sendfile'):
+    logger.warning(f"Unknown MEDIA_SENDFILE mode {MEDIA_SENDFILE!r}; media is sent by the WSGI server")
+    MEDIA_SENDFILE = ''
+
+def media_path(directory, filename):
+    """Filesystem path of a file in a static media directory, or None if it is outside it or missing"""
+    from werkzeug.security import safe_join
+
+    path = safe_join(os.path.join(STATIC_DIR, directory), filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return path
+
+def media_etag(stat):
+    """
+    Strong ETag of a media file from its inode and size.
+
+    Media files are only ever replaced through a new inode (media_store.link,
+    or a temporary file moved into place), while the modification time of a
+    linked store blob moves whenever the store looks it up, so the usual
+    mtime-based tag would change without the content changing.
+    """
+    return f"{stat.st_ino:x}-{stat.st_size:x}"
+
+def _proxy_response(path, mimetype):
+    """Headers-only response that tells the fronting proxy which file to send"""
+    from flask import current_app
+
+    response = current_app.response_class(mimetype=mimetype)
+    if MEDIA_SENDFILE == 'x-accel-redirect':
+        relative = os.path.relpath(path, STATIC_DIR).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = MEDIA_ACCEL_PREFIX + quote(relative)
+    else:
+        response.headers['X-Sendfile'] = path
+    return response
+
+def _send_range_zero_copy(response, path, stat, environ):
+    """
+    Replace werkzeug's range iterator with the server's file wrapper, positioned
+    at the range start; Content-Length (already the range length) bounds it.
+
+    Returns:
+        bool: Whether the body was replaced
+    """
+    from werkzeug.wsgi import wrap_file
+
+    file = open(path, 'rb')
+    if os.fstat(file.fileno()).st_ino != stat.st_ino:
+        # Replaced since it was checked; keep the body werkzeug already opened
+        file.close()
+        return False
+    file.seek(response.content_range.start)
+    response.response.close()
+    response.response = wrap_file(environ, file)
+    return True
+
+def media_response(path, kind, mimetype=None):
+    """
+    Response for a media file, honouring conditional and Range requests.
+
+    Args:
+        path (str): Filesystem path of the file (from media_path())
+        kind (str): 'audio' or 'video', for metrics
+        mimetype (str): Content type; guessed from the file name when omitted
+
+    Returns:
+        flask.Response: 200, 206 or 304 (416 for unsatisfiable ranges is raised)
+    """
+    from flask import current_app, request
+    from werkzeug.utils import send_file
+
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if MEDIA_SENDFILE:
+        MEDIA_RESPONSES.inc(kind=kind, status='proxy', transfer=MEDIA_SENDFILE)
+        return _proxy_response(os.path.abspath(path), mimetype)
+
+    stat = os.stat(path)
+    response = send_file(path, request.environ, mimetype=mimetype, conditional=True, etag=media_etag(stat),
+                         max_age=MEDIA_MAX_AGE or None, response_class=current_app.response_class)
+    transfer = 'python'
+    if response.status_code == 304:
+        transfer = 'none'
+    elif 'wsgi.file_wrapper' in request.environ:
+        if response.status_code != 206 or _send_range_zero_copy(response, path, stat, request.environ):
+            transfer = 'file_wrapper'
+    MEDIA_RESPONSES.inc(kind=kind, status=str(response.status_code), transfer=transfer)
+    return response
@@ -0,0 +1,200 @@
+"""
+Media Store - Content-addressed storage shared by all stories
+
+Generated media is stored once under MEDIA_STORE_DIR/<kind>/<key>.<ext>, where
+key is a hash of everything that determines the output (narration text plus
+voice settings, scene prompt plus style, ...). A story's own files, such as
+static/images/story_12_scene_1.png, are hard links to these blobs, so:
+
+- identical narrations and scene images exist once on disk, whichever story
+  asked for them first, and are never generated twice;
+- the filesystem link count is the reference count: a blob with no story links
+  left is unreferenced, and deleting a story's files never touches bytes that
+  another story still uses;
+- the paths already saved on Story rows keep working unchanged.
+
+Unreferenced blobs (including narration chunks, which are never linked) are kept
+as a cache and evicted least-recently-used first once the store grows past
+MEDIA_STORE_BUDGET_MB. Referenced blobs are never evicted. Everything is plain
+filesystem operations, so it is safe across threads and worker processes.
+"""
+
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from metrics import MEDIA_STORE_LOOKUPS, MEDIA_STORE_EVICTIONS, BYTES_WRITTEN
+
+logger = logging.getLogger(__name__)
+
+MEDIA_STORE_DIR = os.environ.get('MEDIA_STORE_DIR', os.path.join('static', 'media'))
+# Size budget for the whole store; only unreferenced blobs are evicted to meet it
+MEDIA_STORE_BUDGET_MB = float(os.environ.get('MEDIA_STORE_BUDGET_MB', 1024))
+# Eviction frees space down to this fraction of the budget, so it does not run on every write
+MEDIA_STORE_EVICT_TO = 0.9
+# Blobs written or used this recently are never evicted, so one that a pipeline
+# has just produced cannot vanish before it is linked or concatenated
+MEDIA_STORE_EVICT_GRACE = float(os.environ.get('MEDIA_STORE_EVICT_GRACE', 600))
+
+_lock = threading.Lock()
+_approx_bytes = None
+
+def content_key(*parts):
+    """Hash of the inputs that determine a piece of media"""
+    return hashlib.sha256('\x1f'.join(str(part) for part in parts).encode()).hexdigest()
+
+def blob_path(kind, key, ext):
+    return os.path.join(MEDIA_STORE_DIR, kind, f"{key}.{ext}")
+
+def lookup(kind, key, ext):
+    """
+    Return the path of an existing blob, or None.
+
+    A hit refreshes the blob's modification time, which is what LRU eviction
+    orders by.
+    """
+    path = blob_path(kind, key, ext)
+    try:
+        os.utime(path)
+    except OSError:
+        MEDIA_STORE_LOOKUPS.inc(kind=kind, result='miss')
+        return None
+    MEDIA_STORE_LOOKUPS.inc(kind=kind, result='hit')
+    return path
+
+@contextmanager
+def writing(kind, key, ext):
+    """
+    Yield a temporary path to write a new blob to; it is moved into place when
+    the block succeeds and discarded when it raises.
+    """
+    path = blob_path(kind, key, ext)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Unique temp name, so concurrent writers of the same blob never share a partial file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.{ext}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    size = os.path.getsize(path)
+    BYTES_WRITTEN.inc(size, kind=kind)
+    _account(size)
+
+def put_bytes(kind, key, ext, data):
+    """Store data as a blob (a no-op if it already exists) and return its path"""
+    path = lookup(kind, key, ext)
+    if path:
+        return path
+    with writing(kind, key, ext) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+    return blob_path(kind, key, ext)
+
+def link(blob, dest_path):
+    """
+    Make dest_path refer to blob, replacing whatever dest_path was before.
+
+    Falls back to a copy where hard links are unavailable; the copy still
+    works, it just is not deduplicated.
+    """
+    os.makedirs(os.path.dirname(dest_path) or '.', exist_ok=True)
+    try:
+        if os.path.samefile(blob, dest_path):
+            # Already linked; rename() between two links to one file would leave the temp link behind
+            return dest_path
+    except OSError:
+        pass
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(blob, tmp_path)
+    except OSError:
+        shutil.copyfile(blob, tmp_path)
+    os.replace(tmp_path, dest_path)
+    return dest_path
+
+def refcount(blob):
+    """Number of story files linked to blob"""
+    return os.stat(blob).st_nlink - 1
+
+def _account(size):
+    global _approx_bytes
+    with _lock:
+        if _approx_bytes is None:
+            _approx_bytes = _scan_total()
+        else:
+            _approx_bytes += size
+        over_budget = _approx_bytes > MEDIA_STORE_BUDGET_MB * 1024 * 1024
+    if over_budget:
+        enforce_budget()
+
+def _iter_blobs():
+    """(path, stat) of every blob in the store"""
+    if not os.path.isdir(MEDIA_STORE_DIR):
+        return
+    for kind in os.scandir(MEDIA_STORE_DIR):
+        if not kind.is_dir():
+            continue
+        for entry in os.scandir(kind.path):
+            if entry.is_file() and '.tmp' not in entry.name:
+                try:
+                    yield entry.path, entry.stat()
+                except OSError:
+                    continue
+
+def _scan_total():
+    return sum(st.st_size for _, st in _iter_blobs())
+
+def enforce_budget(budget_mb=None):
+    """
+    Evict unreferenced blobs, least recently used first, until the store fits
+    its budget.
+
+    Returns:
+        int: Number of blobs removed
+    """
+    global _approx_bytes
+    budget = (MEDIA_STORE_BUDGET_MB if budget_mb is None else budget_mb) * 1024 * 1024
+    with _lock:
+        blobs = list(_iter_blobs())
+        total = sum(st.st_size for _, st in blobs)
+        removed = 0
+        if total > budget:
+            target = budget * MEDIA_STORE_EVICT_TO
+            cutoff = time.time() - MEDIA_STORE_EVICT_GRACE
+            unreferenced = sorted((st.st_mtime, path, st.st_size) for path, st in blobs
+                                  if st.st_nlink <= 1 and st.st_mtime < cutoff)
+            for _, path, size in unreferenced:
+                if total <= target:
+                    break
+                try:
+                    # A link made since the scan keeps its bytes alive; only the cache entry goes
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+                MEDIA_STORE_EVICTIONS.inc(kind=os.path.basename(os.path.dirname(path)))
+            if total > budget:
+                logger.warning(f"Media store is {total / 1048576:.0f} MB, over its "
+                               f"{budget / 1048576:.0f} MB budget, but the rest is in use or recently used")
+            logger.info(f"Evicted {removed} unreferenced media blob(s)")
+        _approx_bytes = total
+        return removed
+
+def stats():
+    """Blob counts and sizes for status endpoints"""
+    blobs = list(_iter_blobs())
+    unreferenced = [st for _, st in blobs if st.st_nlink <= 1]
+    return {
+        'blobs': len(blobs),
+        'bytes': sum(st.st_size for _, st in blobs),
+        'unreferenced_blobs': len(unreferenced),
+        'unreferenced_bytes': sum(st.st_size for st in unreferenced),
+        'budget_bytes': int(MEDIA_STORE_BUDGET_MB * 1024 * 1024)
+    }
@@ -0,0 +1,378 @@
+"""
+Metrics - Pipeline counters and histograms exposed in the Prometheus text format
+
+Each process keeps its metrics in memory. When METRICS_DIR is set, every
+process also writes its values to METRICS_DIR/metrics_<pid>.json a few times a
+second while busy, and a scrape of /metrics on any worker merges the files of
+all workers. Set it for gunicorn with more than one worker (otherwise each
+scrape only sees the worker that answered it) and clear the directory when the
+server restarts, as counters of exited workers are kept. Gauges describe the
+present, so only those of running processes are summed.
+
+All pipeline metrics are declared at the bottom of this module so the full set
+is visible in one place.
+"""
+
+import os
+import copy
+import json
+import glob
+import time
+import atexit
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Shared directory for multi-worker aggregation (unset: this process only)
+METRICS_DIR = os.environ.get('METRICS_DIR')
+# Seconds between writes of this process's metrics file
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 2))
+
+# Histogram buckets in seconds, from fast cache paths up to long video renders
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+class MetricsRegistry:
+    """Every declared metric, plus the per-process file used to share them with other workers"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher_pid = None
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def mark_dirty(self):
+        self._dirty = True
+        if METRICS_DIR and self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def _start_flusher(self):
+        # Started lazily and per pid, so forked gunicorn workers each get their own thread
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            if self._dirty:
+                self.flush()
+
+    def snapshot(self):
+        """JSON-serializable values of every metric in this process"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def flush(self):
+        """Write this process's metrics file (no-op without METRICS_DIR)"""
+        if not METRICS_DIR:
+            return
+        self._dirty = False
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, prefix='.metrics_', suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f)
+            # Atomic rename, so readers never see a half-written file
+            os.replace(tmp_path, os.path.join(METRICS_DIR, f"metrics_{os.getpid()}.json"))
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {METRICS_DIR}: {e}")
+
+    def collect(self):
+        """(alive, snapshot) for every worker sharing METRICS_DIR, or for this process only"""
+        if not METRICS_DIR:
+            return [(True, self.snapshot())]
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(METRICS_DIR, 'metrics_*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics file {path}: {e}")
+                continue
+            pid = os.path.basename(path)[len('metrics_'):-len('.json')]
+            snapshots.append((_process_alive(pid), snapshot))
+        return snapshots
+
+    def render(self):
+        """All metrics, merged across workers, in the Prometheus text exposition format"""
+        snapshots = self.collect()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            merged = {}
+            for alive, snapshot in snapshots:
+                if metric.type == 'gauge' and not alive:
+                    continue
+                for labels, value in snapshot.get(metric.name, []):
+                    key = tuple(labels)
+                    merged[key] = metric.merge(merged.get(key), value)
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for key in sorted(merged):
+                lines.extend(metric.render_sample(dict(zip(metric.labelnames, key)), merged[key]))
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+def _process_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        # Exists but belongs to another user
+        return True
+    return True
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        self._registry = registry
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            # Copy, as histogram states keep changing while the snapshot is serialized
+            return [[list(key), copy.deepcopy(value)] for key, value in self._values.items()]
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. retries or bytes written"""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._registry.mark_dirty()
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def merge(self, current, value):
+        return value if current is None else current + value
+
+    def render_sample(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+class Gauge(_Metric):
+    """Current value that goes up and down, e.g. queue depth"""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+        self._registry.mark_dirty()
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def merge(self, current, value):
+        return value if current is None else current + value
+
+    def render_sample(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+class Histogram(_Metric):
+    """Distribution of observed values (seconds) over fixed buckets, with their sum and count"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+        self._registry.mark_dirty()
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def merge(self, current, value):
+        if current is None:
+            return {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']}
+        current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+        current['sum'] += value['sum']
+        current['count'] += value['count']
+        return current
+
+    def render_sample(self, labels, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, value['buckets']):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(dict(labels, le=_format_value(float(bound))))} {cumulative}")
+        lines.append(f"{self.name}_bucket{_format_labels(dict(labels, le='+Inf'))} {value['count']}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(float(value['sum']))}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {value['count']}")
+        return lines
+
+def render_latest():
+    """Text for the /metrics endpoint"""
+    return REGISTRY.render()
+
+# Pipeline metrics
+
+STAGE_DURATION = Histogram(
+    'mythoscribe_stage_duration_seconds',
+    'Duration of each story pipeline stage (text, images, audio, video).',
+    ['stage'])
+STAGE_OUTCOMES = Counter(
+    'mythoscribe_stage_outcomes_total',
+    'Story pipeline stages by final status (completed, failed, skipped, deferred).',
+    ['stage', 'status'])
+PROVIDER_REQUEST_DURATION = Histogram(
+    'mythoscribe_provider_request_seconds',
+    'Latency of calls to the text, image and speech providers.',
+    ['provider', 'outcome'])
+PROVIDER_RETRIES = Counter(
+    'mythoscribe_provider_retries_total',
+    'Provider calls retried, by error type (quota_exceeded, timeout, json_error, ...).',
+    ['provider', 'error_type'])
+PROVIDER_FAILURES = Counter(
+    'mythoscribe_provider_failures_total',
+    'Provider calls that failed after all retries, by error type.',
+    ['provider', 'error_type'])
+IMAGES_CREATED = Counter(
+    'mythoscribe_images_total',
+    'Scene images written, by source (provider, store, placeholder); placeholder / total is the fallback rate.',
+    ['source'])
+CACHE_LOOKUPS = Counter(
+    'mythoscribe_cache_lookups_total',
+    'Story requests by cache result (exact, near, coalesced, miss).',
+    ['result'])
+CIRCUIT_REJECTIONS = Counter(
+    'mythoscribe_circuit_rejections_total',
+    'Provider calls refused because the provider circuit breaker was open.',
+    ['provider'])
+RATE_LIMIT_WAIT = Histogram(
+    'mythoscribe_rate_limit_wait_seconds',
+    'Time provider calls waited for the client-side rate limiter.',
+    ['provider'])
+ADMISSION_ACTIVE = Gauge(
+    'mythoscribe_generations_active',
+    'Story generations currently holding an admission slot.')
+ADMISSION_WAITING = Gauge(
+    'mythoscribe_generations_waiting',
+    'Story generations accepted and waiting for an admission slot (queue depth).')
+ADMISSION_REJECTIONS = Counter(
+    'mythoscribe_admission_rejections_total',
+    'Generation requests turned away, by reason (client_limit, queue_full, queue_timeout).',
+    ['reason'])
+ADMISSION_WAIT = Histogram(
+    'mythoscribe_admission_wait_seconds',
+    'Time generations waited in the admission queue before starting.')
+TTS_CHUNKS = Counter(
+    'mythoscribe_tts_chunks_total',
+    'Narration chunks by result (synthesized, or cached and reused).',
+    ['result'])
+MEDIA_STORE_LOOKUPS = Counter(
+    'mythoscribe_media_store_lookups_total',
+    'Content-addressed media store lookups by kind (image, audio, tts) and result (hit, miss).',
+    ['kind', 'result'])
+MEDIA_STORE_EVICTIONS = Counter(
+    'mythoscribe_media_store_evictions_total',
+    'Unreferenced media blobs evicted to keep the store within its size budget.',
+    ['kind'])
+VIDEO_RENDER_DURATION = Histogram(
+    'mythoscribe_video_render_seconds',
+    'Time spent rendering story videos, by renderer (ffmpeg, moviepy).',
+    ['renderer'])
+RENDER_JOBS = Counter(
+    'mythoscribe_render_jobs_total',
+    'Render farm jobs by kind (video, images) and outcome (ok, failed, timeout, crashed, rejected).',
+    ['kind', 'outcome'])
+RENDER_QUEUE_WAIT = Histogram(
+    'mythoscribe_render_queue_wait_seconds',
+    'Time render jobs waited for a free render worker.',
+    ['kind'])
+RENDER_DURATION = Histogram(
+    'mythoscribe_render_seconds',
+    'Wall time of render jobs on a render worker.',
+    ['kind'])
+RENDER_CPU_SECONDS = Counter(
+    'mythoscribe_render_cpu_seconds_total',
+    'CPU time used by render workers and their encoders, kept apart from request handling.',
+    ['kind'])
+RENDER_BUSY = Gauge(
+    'mythoscribe_render_workers_busy',
+    'Render workers currently running a job.')
+RENDER_QUEUED = Gauge(
+    'mythoscribe_render_jobs_queued',
+    'Render jobs waiting for a render worker.')
+MEDIA_RESPONSES = Counter(
+    'mythoscribe_media_responses_total',
+    'Audio and video responses by status (200, 206, 304, proxy) and how the body was sent '
+    '(file_wrapper, python, none, x-accel-redirect, x-sendfile).',
+    ['kind', 'status', 'transfer'])
+BYTES_WRITTEN = Counter(
+    'mythoscribe_bytes_written_total',
+    'Bytes of new media written to disk, by kind (image, audio, tts, video).',
+    ['kind'])
+
+def record_file_written(kind, filepath):
+    """Count the size of a newly written media file, ignoring files that are missing"""
+    try:
+        BYTES_WRITTEN.inc(os.path.getsize(filepath), kind=kind)
+    except OSError:
+        pass
@@ -1,10 +1,14 @@
 from database import db
 from datetime import datetime
 import json
+from image_variants import image_sources
 
 class Story(db.Model):
     __tablename__ = 'story'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_story_created_at_id', 'created_at', 'id'),  # Keyset pagination (newest first)
+        {'extend_existing': True}
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -17,6 +21,11 @@ class Story(db.Model):
     characters = db.Column(db.Text)  # JSON string of characters
     moral = db.Column(db.Text)  # Moral lesson of the story
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Lightweight projections for list views, computed in SQL so that listing
+    # stories never has to load the full content text
+    content_preview = db.column_property(db.func.substr(content, 1, 200), deferred=True)
+    content_length = db.column_property(db.func.length(content), deferred=True)
     
     def get_images(self):
         """Get list of image paths from JSON string"""
@@ -51,9 +60,84 @@ class Story(db.Model):
             'prompt': self.prompt,
             'content': self.content,
             'images': self.get_images(),
+            # Per image: resized WebP/AVIF <source> sets, empty until the variants exist
+            'image_sources': [image_sources(path) for path in self.get_images()],
             'characters': self.get_characters(),
             'moral': self.moral,
             'audio_path': self.audio_path,
             'video_path': self.video_path,
             'created_at': self.created_at.isoformat()
         }
+
+    def to_summary_dict(self):
+        """Serialize for list views; requires the content_preview/content_length projections"""
+        excerpt = self.content_preview or ''
+        if (self.content_length or 0) > len(excerpt):
+            excerpt += '...'
+        return {
+            'id': self.id,
+            'title': self.title,
+            'prompt': self.prompt,
+            'excerpt': excerpt,
+            'images': self.get_images(),
+            # Card-sized variants of the preview image
+            'thumbnail_sources': image_sources(self.get_images()[0]) if self.get_images() else [],
+            'characters': self.get_characters(),
+            'moral': self.moral,
+            'audio_path': self.audio_path,
+            'video_path': self.video_path,
+            'created_at': self.created_at.isoformat()
+        }
+
+class GenerationJob(db.Model):
+    __tablename__ = 'generation_job'
+    __table_args__ = {'extend_existing': True}
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    prompt = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    stage = db.Column(db.String(20))  # Stage currently being worked on
+    stages = db.Column(db.Text)  # JSON string of stage -> status
+    story_id = db.Column(db.Integer)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def get_stages(self):
+        """Get stage statuses from JSON string"""
+        if self.stages:
+            try:
+                return json.loads(self.stages)
+            except:
+                return {}
+        return {}
+
+    def set_stages(self, stage_dict):
+        """Set stage statuses as JSON string"""
+        self.stages = json.dumps(stage_dict)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'prompt': self.prompt,
+            'status': self.status,
+            'stage': self.stage,
+            'stages': self.get_stages(),
+            'story_id': self.story_id,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class PromptFlight(db.Model):
+    """In-flight generation lease; the primary key makes one worker the leader per prompt"""
+    __tablename__ = 'prompt_flight'
+    __table_args__ = {'extend_existing': True}
+
+    prompt_hash = db.Column(db.String(32), primary_key=True)
+    owner = db.Column(db.String(64), nullable=False)  # host:pid:thread of the leader
+    status = db.Column(db.String(20), nullable=False, default='running')  # running, failed
+    error = db.Column(db.Text)
+    story_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
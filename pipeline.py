@@ -0,0 +1,131 @@
+"""
+Pipeline - Runs story generation stages as a small dependency graph
+
+Each stage declares the stages it requires. Stages whose requirements are met
+run in parallel on a thread pool, so independent work (images and audio) overlaps
+and dependent work (video) starts as soon as its inputs are ready. Every stage's
+result, error and duration is recorded separately.
+"""
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+class Stage:
+    """
+    A single unit of pipeline work.
+
+    Args:
+        name (str): Unique stage name, also used as the keyword for dependents
+        func (callable): Called with one keyword argument per required stage,
+                         bound to that stage's result
+        requires (tuple): Names of stages that must complete first
+        condition (callable): Optional check on the required results; the stage
+                              is skipped when it returns False
+    """
+
+    def __init__(self, name, func, requires=(), condition=None):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.condition = condition
+
+class StageResult:
+    """Outcome of one stage: status is 'completed', 'failed' or 'skipped'"""
+
+    def __init__(self, name, status, result=None, error=None, duration=0.0):
+        self.name = name
+        self.status = status
+        self.result = result
+        self.error = error
+        self.duration = duration
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'error': str(self.error) if self.error else None,
+            'duration': round(self.duration, 3)
+        }
+
+def _timed_call(stage, kwargs):
+    start = time.perf_counter()
+    try:
+        return stage.func(**kwargs), None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+def run_stage_graph(stages, max_workers=None, on_event=None):
+    """
+    Run stages in dependency order, overlapping independent ones.
+
+    on_event(name, status, stage_result) is always invoked on the calling thread,
+    with status 'running' when a stage is submitted and its final status when it
+    finishes, so callers can safely touch thread-bound state such as db.session.
+
+    A stage whose requirement failed or was skipped is itself skipped.
+
+    Returns:
+        dict: Stage name -> StageResult
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for dep in stage.requires:
+            if dep not in by_name:
+                raise ValueError(f"Stage '{stage.name}' requires unknown stage '{dep}'")
+
+    def emit(name, status, stage_result=None):
+        if on_event is None:
+            return
+        try:
+            on_event(name, status, stage_result)
+        except Exception as e:
+            logger.warning(f"Stage event handler failed for {name}: {e}")
+
+    results = {}
+    waiting = list(stages)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages), thread_name_prefix='stage') as pool:
+        while waiting or running:
+            # Schedule or skip every stage whose requirements have all finished
+            for stage in list(waiting):
+                if not all(dep in results for dep in stage.requires):
+                    continue
+                waiting.remove(stage)
+
+                deps = {dep: results[dep] for dep in stage.requires}
+                if any(r.status != 'completed' for r in deps.values()):
+                    results[stage.name] = StageResult(stage.name, 'skipped')
+                    emit(stage.name, 'skipped', results[stage.name])
+                    continue
+
+                kwargs = {dep: r.result for dep, r in deps.items()}
+                if stage.condition is not None and not stage.condition(**kwargs):
+                    results[stage.name] = StageResult(stage.name, 'skipped')
+                    emit(stage.name, 'skipped', results[stage.name])
+                    continue
+
+                running[pool.submit(_timed_call, stage, kwargs)] = stage
+                emit(stage.name, 'running')
+
+            if not running:
+                if waiting:
+                    raise ValueError(f"Stage graph has a cycle: {[s.name for s in waiting]}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                result, error, duration = future.result()
+                if error is None:
+                    results[stage.name] = StageResult(stage.name, 'completed', result, None, duration)
+                    logger.info(f"Stage '{stage.name}' completed in {duration:.2f}s")
+                else:
+                    results[stage.name] = StageResult(stage.name, 'failed', None, error, duration)
+                    logger.error(f"Stage '{stage.name}' failed after {duration:.2f}s: {error}")
+                emit(stage.name, results[stage.name].status, results[stage.name])
+
+    return results
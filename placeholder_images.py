@@ -0,0 +1,155 @@
+"""
+Placeholder Images - Layered renderer for fallback scene illustrations
+
+When the image provider fails or its circuit is open, every scene slot gets a
+drawn placeholder: a landscape (sky, ground, mountain, tree, sun), a figure
+when the scene names a deity or a vanara, and a "Scene N" title. Only the last
+two differ between images, so:
+
+- the landscape is drawn once per size and kept as a base layer;
+- the title is rasterized once per text and stamped through its mask;
+- each placeholder is a copy of the base with the figure and title on top.
+
+Images are drawn in palette mode with one fixed palette (the colours the
+original RGB drawing used), which also makes the PNG encode (the bulk of the
+cost) several times cheaper than RGB. render_placeholders() renders a whole
+batch in one go and create_placeholder_images() stores it: results go into the
+media store, so the same placeholder is never drawn twice, and are linked for
+the story.
+"""
+
+import os
+import logging
+from functools import lru_cache
+import media_store
+from metrics import IMAGES_CREATED
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_SIZE = (512, 384)
+
+# Palette slots used by the drawing code
+SKY, GROUND, MOUNTAIN, FOLIAGE, SUN, INK, VANARA, KRISHNA, RAMA, SKIN = range(10)
+
+# Colour of each palette slot, in slot order
+_COLOURS = ((135, 206, 235), (139, 69, 19), (101, 67, 33), (34, 139, 34), (255, 255, 0), (0, 0, 0),
+            (255, 140, 0), (0, 100, 200), (255, 215, 0), (255, 220, 177))
+_PALETTE = [channel for colour in _COLOURS for channel in colour]
+
+# Scene keywords -> (body slot, head slot, body box, head box), boxes relative to where the figure stands
+_FIGURES = (
+    (('hanuman', 'monkey', 'vanara'), (VANARA, VANARA, (-10, 0, 10, 40), (-8, -15, 8, 5))),
+    (('krishna',), (KRISHNA, SKIN, (-8, 0, 8, 35), (-6, -12, 6, 3))),
+    (('rama', 'lord'), (RAMA, SKIN, (-8, 0, 8, 35), (-6, -12, 6, 3))),
+)
+
+@lru_cache(maxsize=8)
+def _base_layer(size):
+    """The landscape, drawn once per process and size and copied for every placeholder"""
+    from PIL import Image, ImageDraw
+
+    width, height = size
+    image = Image.new('P', size, color=SKY)
+    image.putpalette(_PALETTE)
+    draw = ImageDraw.Draw(image)
+
+    # Ground and mountain
+    draw.rectangle([0, height//2, width, height], fill=GROUND)
+    draw.polygon([(0, height//2), (width//3, height//2 - 60), (2*width//3, height//2 - 40), (width, height//2)],
+                 fill=MOUNTAIN)
+
+    # Tree
+    tree_x = width//4
+    draw.rectangle([tree_x-3, height//2, tree_x+3, height//2 + 30], fill=MOUNTAIN)
+    draw.ellipse([tree_x-15, height//2 - 15, tree_x+15, height//2 + 15], fill=FOLIAGE)
+
+    # Sun
+    draw.ellipse([width-60, 20, width-20, 60], fill=SUN)
+    return image
+
+@lru_cache(maxsize=64)
+def _title_layer(title):
+    """(mask, width) of a title, rasterized once"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    font = ImageFont.load_default()
+    # Measured in mode '1' too: unantialiased glyphs are wider than the anti-aliased ones
+    left, top, right, bottom = ImageDraw.Draw(Image.new('1', (1, 1))).textbbox((0, 0), title, font=font)
+    mask = Image.new('1', (right, bottom))
+    ImageDraw.Draw(mask).text((0, 0), title, fill=1, font=font)
+    return mask, right - left
+
+def _figure(scene):
+    lowered = scene.lower()
+    for keywords, figure in _FIGURES:
+        if any(keyword in lowered for keyword in keywords):
+            return figure
+    return None
+
+def render_placeholder(index, scene, size=PLACEHOLDER_SIZE):
+    """Render one placeholder as a palette-mode PIL image"""
+    from PIL import ImageDraw
+
+    width, height = size
+    image = _base_layer(size).copy()
+
+    figure = _figure(scene)
+    if figure:
+        body, head, body_box, head_box = figure
+        draw = ImageDraw.Draw(image)
+        x, y = width//2, height//2 + 20
+        draw.ellipse([x + body_box[0], y + body_box[1], x + body_box[2], y + body_box[3]], fill=body)
+        draw.ellipse([x + head_box[0], y + head_box[1], x + head_box[2], y + head_box[3]], fill=head)
+
+    mask, title_width = _title_layer(f"Scene {index+1}")
+    image.paste(INK, ((width - title_width) // 2, 10), mask)
+    return image
+
+def render_placeholders(slots, size=PLACEHOLDER_SIZE):
+    """
+    Render a batch of placeholders.
+
+    Args:
+        slots (list): (index, scene, style) per image; placeholders look the same for every style
+        size (tuple): (width, height) of every image
+
+    Returns:
+        list: PIL images, in slot order
+    """
+    return [render_placeholder(index, scene, size) for index, scene, _ in slots]
+
+def placeholder_key(index, scene):
+    """Media store key of a placeholder (bump the version when the drawing changes)"""
+    return media_store.content_key('placeholder-image', 'v3', scene, index)
+
+def create_placeholder_images(images_dir, story_id, slots):
+    """
+    Store and link the placeholders for a story's scene slots, drawing only
+    those that are not stored yet.
+
+    Args:
+        images_dir (str): Directory of the story images
+        story_id (int): Story the images belong to
+        slots (list): (index, scene, style) per missing scene image
+
+    Returns:
+        dict: Scene index -> web path of its image
+    """
+    blobs = {index: media_store.lookup('image', placeholder_key(index, scene), 'png')
+             for index, scene, _ in slots}
+    missing = [slot for slot in slots if not blobs[slot[0]]]
+    for (index, scene, _), image in zip(missing, render_placeholders(missing)):
+        key = placeholder_key(index, scene)
+        with media_store.writing('image', key, 'png') as tmp_path:
+            image.save(tmp_path, format='PNG')
+        blobs[index] = media_store.blob_path('image', key, 'png')
+
+    web_paths = {}
+    for index, _, _ in slots:
+        filename = f"story_{story_id}_scene_{index+1}.png"
+        media_store.link(blobs[index], os.path.join(images_dir, filename))
+        IMAGES_CREATED.inc(source='placeholder')
+        web_paths[index] = f"/static/images/{filename}"
+    if missing:
+        logger.info(f"Drew {len(missing)} of {len(slots)} placeholder image(s) for story {story_id}")
+    return web_paths
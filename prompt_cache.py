@@ -0,0 +1,291 @@
+"""
+Prompt Cache - Canonical prompt keys and near-duplicate lookup of past stories
+
+Prompts are canonicalized before hashing so trivial variations ("Story of
+Hanuman crossing the ocean" / "the story of hanuman crossing the ocean!",
+"Krishna" / "Krsna" / "Kṛṣṇa") share one cache key. An optional MinHash/LSH
+index over past prompts can also serve an existing story when a new prompt is
+similar enough to one already generated.
+"""
+
+import os
+import re
+import time
+import zlib
+import hashlib
+import logging
+import threading
+import unicodedata
+from database import db
+from models import Story
+import single_flight
+
+logger = logging.getLogger(__name__)
+
+# Serve near-duplicate prompts from the cache (off by default)
+NEAR_DUPLICATE_ENABLED = os.environ.get('PROMPT_NEAR_DUPLICATE', 'false').lower() in ('1', 'true', 'yes')
+# Minimum estimated Jaccard similarity of prompt shingles for a near-duplicate hit
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get('PROMPT_NEAR_DUPLICATE_THRESHOLD', 0.8))
+
+# Filler words that do not change which story is wanted. Prepositions ("to" / "from"),
+# possessives ("his" / "her") and other words that can carry direction or relation are
+# kept: "Hanuman flies to Lanka" and "Hanuman flies from Lanka" are different stories
+STOPWORDS = {
+    'a', 'an', 'the', 'of', 'about', 'and', 'is', 'was', 'me', 'us',
+    'please', 'tell', 'write', 'create', 'generate', 'give', 'narrate', 'share',
+    'story', 'stories', 'tale', 'tales', 'legend', 'short', 'vedic'
+}
+
+# Question words ask for different stories ("how did..." / "when did..."), so they are kept,
+# and a near-duplicate must ask the same ones
+QUESTION_WORDS = {'how', 'when', 'who', 'whom', 'whose', 'what', 'why', 'where', 'which'}
+
+# Direction, relation and possessive words; like question words, a near-duplicate must use the same ones
+RELATION_WORDS = {
+    'to', 'from', 'in', 'on', 'into', 'onto', 'at', 'for', 'with', 'without', 'against', 'by',
+    'across', 'over', 'under', 'before', 'after', 'his', 'her', 'hers', 'their', 'its', 'my', 'our'
+}
+
+# Sanskrit and Vedic names and terms whose spelling variants are folded together; any
+# listed spelling works, since words are matched by their folded form. Other words
+# (ordinary English) are left as they are.
+VEDIC_TERMS = '''
+    agni ahalya airavata amrita arjuna ashram ashvamedha ashvatthama asura ayodhya balarama bhagavad bhagiratha
+    bhakti bharata bhima bhishma brahma brahmin chakra chitrakoot dasharatha deva devaki dharma dhritarashtra
+    draupadi drona dronacharya durga duryodhana dushasana dvaraka dwarka ekalavya gandhari ganesha ganga garuda
+    gita gokul guru hanuman hastinapura indra indrajit jambavan janaka jatayu kaikeyi kailash kali kamadhenu
+    kamsa karma karna kartikeya kaurava kausalya krishna kubera kumbhakarna kunti kurukshetra lakshmana lakshmi
+    lanka mahabharata mahadeva mahishasura mandara manthan mantra markandeya mathura meghnad moksha nakula
+    nandi narada narasimha narayana pandava pandu parashurama parvati prahlada purana radha rajasuya rakshasa
+    rama ramayana ravana rishi rukmini sahadeva samudra saraswati sati satyavan savitri shabari shakti shakuni
+    shantanu shesha shiva shri shurpanakha sita subhadra sudama sudarshana sugriva surya tapasya trishula
+    upanishad vali valmiki vamana vanara varaha varuna vasishtha vasudeva vayu veda vibhishana vishnu
+    vishvamitra vrindavan vyasa yajna yama yamuna yashoda yudhishthira
+'''.split()
+
+# Spelling variants common in romanized Sanskrit, applied in order to each word
+TRANSLITERATION_RULES = [
+    (re.compile(r'ksh'), 'ks'),
+    (re.compile(r'([bcdgjkpt])h'), r'\1'),  # Aspirates: bh, dh, kh, ... -> b, d, k
+    (re.compile(r'sh'), 's'),
+    (re.compile(r'aa'), 'a'),
+    (re.compile(r'(ee|ii)'), 'i'),
+    (re.compile(r'(oo|uu)'), 'u'),
+    (re.compile(r'w'), 'v'),
+    (re.compile(r'([^aeiou])ri(?=[^aeiou])'), r'\1r'),  # Krishna -> Krsna (vocalic r)
+    (re.compile(r'(?<=..)a$'), ''),  # Schwa deletion: Rama -> Ram, Shiva -> Shiv
+]
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+_POSSESSIVE = re.compile(r"['’]s\b")
+
+def _fold_word(word):
+    for pattern, replacement in TRANSLITERATION_RULES:
+        word = pattern.sub(replacement, word)
+    return word
+
+_FOLDED_TERMS = {_fold_word(term) for term in VEDIC_TERMS}
+
+def _canonical_word(word):
+    """The folded spelling of a Sanskrit/Vedic term; any other word unchanged"""
+    folded = _fold_word(word)
+    return folded if folded in _FOLDED_TERMS else word
+
+def canonicalize_prompt(prompt):
+    """
+    Reduce a prompt to the words that decide which story is generated.
+
+    Strips diacritics (IAST ā, ṣ, ṛ ...), lowercases, replaces punctuation with
+    spaces, drops stopwords and folds the transliteration variants of the
+    names and terms in VEDIC_TERMS. Word order, question and relation words
+    are kept, since they can change the story ("Rama defeats Ravana",
+    "how" / "when", "to" / "from").
+    """
+    text = unicodedata.normalize('NFKD', prompt)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    text = _POSSESSIVE.sub('', text)
+    words = [w for w in _NON_WORD.split(text) if w and w not in STOPWORDS]
+    if not words:
+        # Prompt was nothing but stopwords; fall back to its plain words
+        words = [w for w in _NON_WORD.split(text) if w]
+    return ' '.join(_canonical_word(w) for w in words)
+
+def prompt_cache_key(prompt):
+    """Cache key stored in Story.prompt_hash"""
+    return hashlib.md5(canonicalize_prompt(prompt).encode()).hexdigest()
+
+def legacy_prompt_cache_key(prompt):
+    """Key used before canonicalization, still found on older stories"""
+    return hashlib.md5(prompt.strip().lower().encode()).hexdigest()
+
+class MinHashLSH:
+    """
+    MinHash signatures over character shingles with banded LSH buckets.
+
+    Candidates sharing any band bucket are verified by their estimated Jaccard
+    similarity, so lookups touch only a few prompts instead of all of them.
+    """
+
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, num_perm=64, bands=16, shingle_size=4):
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        # Fixed seeds keep signatures identical across processes
+        self.params = [(2 * i + 1) * 0x9E3779B97F4A7C15 % self.PRIME or 1 for i in range(num_perm)]
+        self.offsets = [(i + 1) * 0xC2B2AE3D27D4EB4F % self.PRIME for i in range(num_perm)]
+        self.buckets = {}
+        self.signatures = {}
+
+    def _shingles(self, text):
+        padded = f" {text} "
+        if len(padded) <= self.shingle_size:
+            return {padded}
+        return {padded[i:i + self.shingle_size] for i in range(len(padded) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        hashes = [zlib.crc32(s.encode()) for s in self._shingles(text)]
+        return tuple(
+            min((a * h + b) % self.PRIME for h in hashes)
+            for a, b in zip(self.params, self.offsets)
+        )
+
+    def _band_keys(self, sig):
+        return [(band, sig[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def add(self, key, text):
+        sig = self.signature(text)
+        self.signatures[key] = sig
+        for band_key in self._band_keys(sig):
+            self.buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key):
+        sig = self.signatures.pop(key, None)
+        if sig is None:
+            return
+        for band_key in self._band_keys(sig):
+            bucket = self.buckets.get(band_key)
+            if bucket:
+                bucket.discard(key)
+
+    def query(self, text):
+        """Return (key, similarity) candidates, most similar first"""
+        sig = self.signature(text)
+        candidates = set()
+        for band_key in self._band_keys(sig):
+            candidates |= self.buckets.get(band_key, set())
+        scored = []
+        for key in candidates:
+            other = self.signatures[key]
+            similarity = sum(1 for x, y in zip(sig, other) if x == y) / self.num_perm
+            scored.append((key, similarity))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored
+
+class PromptCacheStats:
+    """Hit/miss counters and cumulative lookup latency for the prompt cache"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.lookup_seconds = 0.0
+
+    def record(self, kind, seconds):
+        with self._lock:
+            self.lookups += 1
+            self.lookup_seconds += seconds
+            if kind == 'exact':
+                self.exact_hits += 1
+            elif kind == 'near':
+                self.near_hits += 1
+
+    def to_dict(self):
+        with self._lock:
+            hits = self.exact_hits + self.near_hits
+            return {
+                'lookups': self.lookups,
+                'exact_hits': self.exact_hits,
+                'near_hits': self.near_hits,
+                'misses': self.lookups - hits,
+                'hit_rate': round(hits / self.lookups, 4) if self.lookups else 0.0,
+                'avg_lookup_ms': round(1000 * self.lookup_seconds / self.lookups, 3) if self.lookups else 0.0,
+                'near_duplicate_enabled': NEAR_DUPLICATE_ENABLED,
+                'near_duplicate_threshold': NEAR_DUPLICATE_THRESHOLD
+            }
+
+stats = PromptCacheStats()
+
+_index = MinHashLSH()
+_index_lock = threading.Lock()
+_last_indexed_id = 0
+
+def _refresh_index():
+    """Index stories created since the last refresh, including those made by other workers"""
+    global _last_indexed_id
+    with _index_lock:
+        rows = (db.session.query(Story.id, Story.prompt)
+                .filter(Story.id > _last_indexed_id)
+                .order_by(Story.id)
+                .all())
+        for story_id, prompt in rows:
+            _index.add(story_id, canonicalize_prompt(prompt))
+            _last_indexed_id = story_id
+
+def forget_story(story_id):
+    """Drop a deleted story from the near-duplicate index"""
+    with _index_lock:
+        _index.remove(story_id)
+
+def _deciding_words(prompt):
+    """Question and relation words, which a near-duplicate must share exactly"""
+    return (QUESTION_WORDS | RELATION_WORDS).intersection(canonicalize_prompt(prompt).split())
+
+def _find_near_duplicate(prompt):
+    _refresh_index()
+    with _index_lock:
+        candidates = _index.query(canonicalize_prompt(prompt))
+    for story_id, similarity in candidates:
+        if similarity < NEAR_DUPLICATE_THRESHOLD:
+            break
+        story = db.session.get(Story, story_id)
+        if story is None:
+            forget_story(story_id)
+            continue
+        # A story still being generated is incomplete; never serve it
+        if story.prompt_hash and single_flight.is_in_flight(story.prompt_hash):
+            continue
+        if _deciding_words(story.prompt) != _deciding_words(prompt):
+            continue
+        logger.info(f"Near-duplicate prompt match: story {story_id} (similarity {similarity:.2f})")
+        return story
+    return None
+
+def lookup_story(prompt):
+    """
+    Find a finished story for prompt.
+
+    Tries the canonical key, then the legacy pre-canonicalization key, then (if
+    enabled) the near-duplicate index. Every lookup is counted in stats.
+
+    Returns:
+        (Story, str): The story and 'exact' or 'near', or (None, None) on a miss
+    """
+    start = time.perf_counter()
+    story, kind = None, None
+    try:
+        keys = [prompt_cache_key(prompt), legacy_prompt_cache_key(prompt)]
+        story = Story.query.filter(Story.prompt_hash.in_(keys)).order_by(Story.id).first()
+        if story:
+            kind = 'exact'
+        elif NEAR_DUPLICATE_ENABLED:
+            story = _find_near_duplicate(prompt)
+            kind = 'near' if story else None
+        return story, kind
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.record(kind, elapsed)
+        logger.debug(f"Prompt cache lookup: {kind or 'miss'} in {elapsed * 1000:.2f}ms")
@@ -0,0 +1,476 @@
+"""
+Providers - Pluggable backends for text, image and speech generation
+
+The pipeline talks to three kinds of external service: a text model (Gemini),
+an image service (Pollinations) and a speech synthesizer (gTTS). Each is behind
+a small provider interface so the whole pipeline can also run offline:
+
+- live:   the real services
+- stub:   deterministic local providers with optional injected latency
+- record: the real services, with every response saved to a cassette directory
+- replay: responses served from the cassette directory, optionally with the
+          latencies that were recorded
+
+Select a mode with MYTHOSCRIBE_PROVIDERS (default 'live'); cassettes live in
+PROVIDER_CASSETTE_DIR. Stub latencies are set with PROVIDER_STUB_LATENCY, e.g.
+"text=3.0,image=1.5,speech=2.0" (seconds per call), or a single number for all
+three.
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+import requests
+from pathlib import Path
+from dotenv import load_dotenv
+from resilience import wait_for_gemini_quota, InvalidImageError
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+env_path = Path(__file__).parent / '.env'
+if env_path.exists():
+    load_dotenv(dotenv_path=env_path, override=True)
+
+PROVIDER_MODE = os.environ.get('MYTHOSCRIBE_PROVIDERS', 'live').lower()
+CASSETTE_DIR = os.environ.get('PROVIDER_CASSETTE_DIR', 'cassettes')
+# Replay recorded latencies scaled by this factor (0 replays instantly)
+REPLAY_LATENCY_SCALE = float(os.environ.get('PROVIDER_REPLAY_LATENCY_SCALE', 1.0))
+
+def _parse_latencies(spec):
+    """PROVIDER_STUB_LATENCY as seconds per provider kind: "text=3,image=1.5,speech=2", or "0.5" for all"""
+    latencies = {'text': 0.0, 'image': 0.0, 'speech': 0.0}
+    try:
+        for part in filter(None, (p.strip() for p in spec.split(','))):
+            kind, equals, value = part.partition('=')
+            if not equals:
+                latencies = dict.fromkeys(latencies, float(kind))
+                continue
+            kind = kind.strip()
+            if kind not in latencies:
+                raise ValueError(f"unknown provider kind {kind!r}")
+            latencies[kind] = float(value)
+    except ValueError as e:
+        raise ValueError(f"Invalid PROVIDER_STUB_LATENCY {spec!r} ({e}); expected seconds such as "
+                         f"'text=3.0,image=1.5,speech=2.0' or one number for all kinds") from None
+    return latencies
+
+STUB_LATENCY = _parse_latencies(os.environ.get('PROVIDER_STUB_LATENCY', ''))
+
+class _TextChunk:
+    """Minimal stand-in for a Gemini response or stream chunk"""
+
+    def __init__(self, text):
+        self.text = text
+
+def _sleep_with_jitter(seconds, jitter=0.1):
+    if seconds > 0:
+        time.sleep(seconds * random.uniform(1 - jitter, 1 + jitter))
+
+# Text providers: generate_content(contents, generation_config=None, stream=False)
+# returns an object with .text, or an iterator of such chunks when streaming
+
+class GeminiTextProvider:
+    """Google Gemini, configured on first use so a missing key only fails text generation"""
+
+    name = 'gemini'
+
+    def __init__(self, model_name='gemini-1.5-flash'):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+                api_key = os.getenv("GEMINI_API_KEY")
+                if not api_key:
+                    raise ValueError("GEMINI_API_KEY not found in environment variables")
+                genai.configure(api_key=api_key)
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        model = self._get_model()
+        # Pace requests below the account quota rather than collecting 429s
+        wait_for_gemini_quota()
+        return model.generate_content(contents, generation_config=generation_config, stream=stream)
+
+class StubTextProvider:
+    """
+    Offline stand-in for the Gemini model.
+
+    Returns a canned JSON story (with the requested subject worked into it),
+    either whole or as a stream of small chunks, after an optional delay. The
+    same prompt always yields the same story.
+    """
+
+    name = 'stub'
+
+    def __init__(self, response_text=None, chunk_size=24, chunk_delay=0.0, latency=None):
+        self.response_text = response_text
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.latency = STUB_LATENCY['text'] if latency is None else latency
+
+    def _story_text(self, contents):
+        if self.response_text:
+            return self.response_text
+        subject = str(contents).rsplit('Create a Vedic story about:', 1)[-1].strip()[:80] or 'Hanuman'
+        return json.dumps({
+            "title": f"The Tale of {subject.title()}",
+            "scenes": [
+                f"{subject}: Hanuman standing on Mount Mahendra gazing across the ocean",
+                f"{subject}: Hanuman leaping over the waves with the vanara army below",
+                f"{subject}: Hanuman meeting Sita in the Ashoka grove of Lanka",
+                f"{subject}: Hanuman returning to Rama with Sita's jewel"
+            ],
+            "content": (f"Long ago, in the age of the Vedas, the sages spoke of {subject}. "
+                        "Hanuman, son of Vayu, gathered his strength on the shore of the ocean. "
+                        "With the name of Rama on his lips he leapt across the waves to Lanka. "
+                        "There he found Sita in the Ashoka grove and gave her Rama's ring. ") * 3,
+            "characters": ["Hanuman", "Sita", "Rama"],
+            "moral": "Devotion gives strength beyond one's own measure",
+            "sources": ["Valmiki Ramayana, Sundara Kanda"]
+        }, indent=2)
+
+    def _chunks(self, text):
+        # Spread the configured latency over the stream like real token generation
+        steps = max(1, (len(text) + self.chunk_size - 1) // self.chunk_size)
+        delay = self.chunk_delay or self.latency / steps
+        for start in range(0, len(text), self.chunk_size):
+            if delay:
+                time.sleep(delay)
+            yield _TextChunk(text[start:start + self.chunk_size])
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        text = self._story_text(contents)
+        if stream:
+            return self._chunks(text)
+        _sleep_with_jitter(self.latency)
+        return _TextChunk(text)
+
+# Image providers: fetch(scene, filepath) writes the image to filepath and returns
+# True, or False if none was produced
+
+class PollinationsImageProvider:
+    """
+    Pollinations AI over a pooled keep-alive session.
+
+    The body is streamed to the file in chunks, so memory use does not depend
+    on the image size. A body larger than IMAGE_MAX_BYTES, or shorter than its
+    Content-Length, raises InvalidImageError.
+    """
+
+    name = 'pollinations'
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, timeout=None, pool_size=None, max_bytes=None):
+        self.timeout = timeout or float(os.environ.get('IMAGE_FETCH_TIMEOUT', 30))
+        pool_size = pool_size or int(os.environ.get('IMAGE_FETCH_POOL_SIZE', 8))
+        # Largest image body accepted from the service
+        self.max_bytes = max_bytes or int(os.environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+        # Shared HTTP session so scene fetches reuse pooled keep-alive connections
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size
+        ))
+
+    def fetch(self, scene, filepath):
+        # Create optimized prompt for Pollinations AI
+        visual_prompt = f"Indian mythology {scene[:50]} traditional art colorful divine"
+        encoded_prompt = visual_prompt.replace(' ', '%20').replace(',', '%2C')
+        API_URL = f"https://image.pollinations.ai/prompt/{encoded_prompt}?width=512&height=384&nologo=true&model=flux"
+
+        with self.session.get(API_URL, timeout=self.timeout, stream=True) as response:
+            if response.status_code != 200 or 'image' not in response.headers.get('content-type', ''):
+                logger.warning(f"Pollinations AI failed with status {response.status_code}, creating visual placeholder")
+                return False
+
+            expected = int(response.headers.get('content-length') or 0)
+            if expected > self.max_bytes:
+                raise InvalidImageError(f"Image of {expected} bytes exceeds the {self.max_bytes} byte limit")
+            received = 0
+            with open(filepath, 'wb') as f:
+                try:
+                    for chunk in response.iter_content(self.CHUNK_SIZE):
+                        received += len(chunk)
+                        if received > self.max_bytes:
+                            raise InvalidImageError(f"Image body exceeds the {self.max_bytes} byte limit")
+                        f.write(chunk)
+                except requests.exceptions.ChunkedEncodingError as e:
+                    raise InvalidImageError(f"Image body truncated after {received} bytes") from e
+            if expected and received != expected:
+                raise InvalidImageError(f"Image body truncated at {received} of {expected} bytes")
+        return True
+
+class StubImageProvider:
+    """Deterministic local images: a colour gradient seeded by the scene text"""
+
+    name = 'stub'
+
+    def __init__(self, latency=None, size=(512, 384)):
+        self.latency = STUB_LATENCY['image'] if latency is None else latency
+        self.size = size
+
+    def fetch(self, scene, filepath):
+        from PIL import Image
+
+        _sleep_with_jitter(self.latency)
+        seed = hashlib.sha256(scene.encode()).digest()
+        top, bottom = seed[:3], seed[3:6]
+        width, height = self.size
+        gradient = Image.linear_gradient('L').resize((width, height))
+        image = Image.composite(Image.new('RGB', self.size, tuple(bottom)),
+                                Image.new('RGB', self.size, tuple(top)), gradient)
+        image.save(filepath, format='PNG')
+        return True
+
+# Speech providers: synthesize(text, filepath) writes an MP3 file
+
+class GTTSSpeechProvider:
+    """Google Translate TTS via gTTS"""
+
+    name = 'gtts'
+
+    def __init__(self, lang='en', slow=False):
+        self.lang = lang
+        self.slow = slow
+
+    def synthesize(self, text, filepath):
+        from gtts import gTTS
+        tts = gTTS(text=text, lang=self.lang, slow=self.slow, lang_check=False)
+        tts.save(filepath)
+
+class StubSpeechProvider:
+    """
+    Writes silent but valid MP3 audio whose length follows the text, at about
+    15 characters per second like real narration.
+    """
+
+    name = 'stub'
+
+    # MPEG-1 Layer III, 128 kbps, 44.1 kHz, no padding: 417-byte frames of 1152 samples
+    FRAME = b'\xff\xfb\x90\x04' + b'\x00' * 413
+    FRAME_SECONDS = 1152 / 44100
+    CHARS_PER_SECOND = 15
+
+    def __init__(self, latency=None):
+        self.latency = STUB_LATENCY['speech'] if latency is None else latency
+
+    def synthesize(self, text, filepath):
+        _sleep_with_jitter(self.latency)
+        seconds = max(1.0, len(text) / self.CHARS_PER_SECOND)
+        with open(filepath, 'wb') as f:
+            f.write(self.FRAME * int(seconds / self.FRAME_SECONDS))
+
+# Record / replay
+
+class CassetteStore:
+    """
+    Recorded provider responses on disk, keyed by a hash of the request.
+
+    Each entry is a JSON metadata file (kind, request summary, latency) next to
+    a binary body file, under <directory>/<kind>/.
+    """
+
+    def __init__(self, directory=CASSETTE_DIR):
+        self.directory = directory
+
+    @staticmethod
+    def key(kind, request):
+        return hashlib.sha256(f"{kind}\0{request}".encode()).hexdigest()
+
+    def _paths(self, kind, key):
+        base = os.path.join(self.directory, kind, key)
+        return base + '.json', base + '.bin'
+
+    def save(self, kind, request, body, latency):
+        key = self.key(kind, request)
+        meta_path, body_path = self._paths(kind, key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with open(body_path, 'wb') as f:
+            f.write(body)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'kind': kind, 'request': request[:500], 'latency': latency,
+                       'recorded_at': time.time()}, f)
+
+    def load(self, kind, request):
+        """Return (body, latency) or None if the request was never recorded"""
+        meta_path, body_path = self._paths(kind, self.key(kind, request))
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(body_path, 'rb') as f:
+            return f.read(), meta.get('latency', 0.0)
+
+def _text_request(contents, generation_config):
+    return json.dumps({'contents': str(contents), 'config': generation_config}, sort_keys=True, default=str)
+
+class RecordingTextProvider:
+    name = 'record'
+
+    def __init__(self, inner, store):
+        self.inner = inner
+        self.store = store
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        request = _text_request(contents, generation_config)
+        start = time.perf_counter()
+        result = self.inner.generate_content(contents, generation_config=generation_config, stream=stream)
+        if not stream:
+            self.store.save('text', request, result.text.encode(), time.perf_counter() - start)
+            return result
+
+        def record_stream():
+            parts = []
+            for chunk in result:
+                parts.append(chunk.text)
+                yield chunk
+            self.store.save('text', request, ''.join(parts).encode(), time.perf_counter() - start)
+        return record_stream()
+
+class ReplayTextProvider:
+    name = 'replay'
+
+    def __init__(self, store, latency_scale=REPLAY_LATENCY_SCALE):
+        self.store = store
+        self.latency_scale = latency_scale
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        entry = self.store.load('text', _text_request(contents, generation_config))
+        if entry is None:
+            raise LookupError("No recorded text response for this prompt")
+        body, latency = entry
+        return StubTextProvider(response_text=body.decode(), latency=latency * self.latency_scale) \
+            .generate_content(contents, stream=stream)
+
+class RecordingImageProvider:
+    name = 'record'
+
+    def __init__(self, inner, store):
+        self.inner = inner
+        self.store = store
+
+    def fetch(self, scene, filepath):
+        start = time.perf_counter()
+        fetched = self.inner.fetch(scene, filepath)
+        if fetched:
+            with open(filepath, 'rb') as f:
+                self.store.save('image', scene, f.read(), time.perf_counter() - start)
+        return fetched
+
+class ReplayImageProvider:
+    name = 'replay'
+
+    def __init__(self, store, latency_scale=REPLAY_LATENCY_SCALE):
+        self.store = store
+        self.latency_scale = latency_scale
+
+    def fetch(self, scene, filepath):
+        entry = self.store.load('image', scene)
+        if entry is None:
+            logger.warning(f"No recorded image for scene: {scene[:60]}")
+            return False
+        body, latency = entry
+        time.sleep(latency * self.latency_scale)
+        with open(filepath, 'wb') as f:
+            f.write(body)
+        return True
+
+class RecordingSpeechProvider:
+    name = 'record'
+
+    def __init__(self, inner, store):
+        self.inner = inner
+        self.store = store
+
+    def synthesize(self, text, filepath):
+        start = time.perf_counter()
+        self.inner.synthesize(text, filepath)
+        with open(filepath, 'rb') as f:
+            self.store.save('speech', text, f.read(), time.perf_counter() - start)
+
+class ReplaySpeechProvider:
+    name = 'replay'
+
+    def __init__(self, store, latency_scale=REPLAY_LATENCY_SCALE):
+        self.store = store
+        self.latency_scale = latency_scale
+
+    def synthesize(self, text, filepath):
+        entry = self.store.load('speech', text)
+        if entry is None:
+            raise LookupError("No recorded narration for this text")
+        body, latency = entry
+        time.sleep(latency * self.latency_scale)
+        with open(filepath, 'wb') as f:
+            f.write(body)
+
+# Registry
+
+_providers = {}
+_registry_lock = threading.Lock()
+
+def _build_providers(mode):
+    live = {'text': GeminiTextProvider(), 'image': PollinationsImageProvider(), 'speech': GTTSSpeechProvider()}
+    if mode == 'live':
+        return live
+    if mode == 'stub':
+        return {'text': StubTextProvider(), 'image': StubImageProvider(), 'speech': StubSpeechProvider()}
+
+    store = CassetteStore()
+    if mode == 'record':
+        return {
+            'text': RecordingTextProvider(live['text'], store),
+            'image': RecordingImageProvider(live['image'], store),
+            'speech': RecordingSpeechProvider(live['speech'], store)
+        }
+    if mode == 'replay':
+        return {
+            'text': ReplayTextProvider(store),
+            'image': ReplayImageProvider(store),
+            'speech': ReplaySpeechProvider(store)
+        }
+    raise ValueError(f"Unknown provider mode: {mode}")
+
+def _get(kind):
+    with _registry_lock:
+        if not _providers:
+            logger.info(f"Using '{PROVIDER_MODE}' providers")
+            _providers.update(_build_providers(PROVIDER_MODE))
+        return _providers[kind]
+
+def get_text_provider():
+    return _get('text')
+
+def get_image_provider():
+    return _get('image')
+
+def get_speech_provider():
+    return _get('speech')
+
+def set_providers(mode=None, text=None, image=None, speech=None):
+    """
+    Swap providers at runtime, e.g. from benchmarks or tests.
+
+    mode rebuilds all three for a mode name; text/image/speech then override
+    individual providers.
+    """
+    with _registry_lock:
+        if mode is not None:
+            _providers.clear()
+            _providers.update(_build_providers(mode))
+        elif not _providers:
+            _providers.update(_build_providers(PROVIDER_MODE))
+        for kind, provider in (('text', text), ('image', image), ('speech', speech)):
+            if provider is not None:
+                _providers[kind] = provider
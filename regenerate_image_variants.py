@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Script to create the resized WebP/AVIF variants of existing story images
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import app, initialize_app
+from models import Story
+from image_variants import generate_story_variants
+from render_farm import farm, RenderError
+
+def regenerate_image_variants():
+    """Create the missing image variants of every story (already stored encodes are only linked)"""
+    with app.app_context():
+        try:
+            stories = Story.query.filter(Story.images.isnot(None)).all()
+
+            print(f"Found {len(stories)} stories with images")
+
+            # Queue every story first so the render farm works on several at once
+            jobs = []
+            for story in stories:
+                image_paths = [path for path in story.get_images() if os.path.exists(path.lstrip('/'))]
+                if not image_paths:
+                    print(f"  No image files found for story {story.id}")
+                    continue
+                jobs.append((story, farm.submit('images', generate_story_variants, image_paths, block=True)))
+
+            encoded = 0
+            for story, job in jobs:
+                try:
+                    count = job.wait()
+                    encoded += count
+                    print(f"  ✅ Story {story.id}: {count} variant(s) encoded")
+                except RenderError as e:
+                    print(f"  ❌ Error creating variants for story {story.id}: {str(e)}")
+                    continue
+
+            print(f"\n🖼️ Image variants completed: {encoded} encoded for {len(jobs)} stories")
+
+        except Exception as e:
+            print(f"❌ Error during image variant generation: {str(e)}")
+
+if __name__ == "__main__":
+    initialize_app()
+    regenerate_image_variants()
@@ -10,10 +10,12 @@ from pathlib import Path
 # Add the current directory to Python path
 sys.path.insert(0, os.path.dirname(__file__))
 
-from app import app, db
+from app import app, db, initialize_app
 from models import Story
-from image_generator import generate_story_images
+from image_generator import generate_story_images, create_missing_scene_images
 from video_generator import generate_story_video_from_paths
+from image_variants import generate_story_variants
+from render_farm import farm
 
 def regenerate_missing_images():
     """Regenerate missing images for stories with fewer than 4 images"""
@@ -40,9 +42,6 @@ def regenerate_missing_images():
                         # Since we don't have the original story data, we'll need to recreate it
 
                         # For now, let's create placeholder images for missing scenes
-                        from image_generator import create_visual_scene_image
-                        import json
-
                         images_dir = os.path.join('static', 'images')
                         os.makedirs(images_dir, exist_ok=True)
 
@@ -53,48 +52,28 @@ def regenerate_missing_images():
                             if i < 4:  # Only keep up to 4 images
                                 new_image_paths.append(img_path)
 
-                        # Generate missing images
-                        for i in range(len(current_images), 4):
-                            print(f"  Generating missing image {i+1} for story {story.id}")
-                            filename = f"story_{story.id}_scene_{i+1}.png"
-                            filepath = os.path.join(images_dir, filename)
-
-                            # Create a placeholder image
-                            from PIL import Image, ImageDraw, ImageFont
-                            width, height = 512, 384
-                            image = Image.new('RGB', (width, height), color=(135, 206, 235))
-                            draw = ImageDraw.Draw(image)
-
-                            # Simple ground
-                            draw.rectangle([0, height//2, width, height], fill=(139, 69, 19))
-
-                            # Simple mountain
-                            mountain_points = [(0, height//2), (width//3, height//2 - 60), (2*width//3, height//2 - 40), (width, height//2)]
-                            draw.polygon(mountain_points, fill=(101, 67, 33))
-
-                            # Title
-                            font = ImageFont.load_default()
-                            title = f"Scene {i+1}"
-                            title_bbox = draw.textbbox((0, 0), title, font=font)
-                            title_width = title_bbox[2] - title_bbox[0]
-                            title_x = (width - title_width) // 2
-                            draw.text((title_x, 10), title, fill=(0, 0, 0), font=font)
-
-                            # Save the image
-                            image.save(filepath)
-                            web_path = f"/static/images/{filename}"
+                        # Generate missing images on the render farm, all scenes in one batch
+                        missing = list(range(len(current_images), 4))
+                        print(f"  Generating missing images {[i + 1 for i in missing]} for story {story.id}")
+                        for web_path in farm.render('images', create_missing_scene_images, images_dir, story.id,
+                                                    missing, block=True):
                             new_image_paths.append(web_path)
-                            print(f"  SUCCESS: Created placeholder image: {filepath}")
+                            print(f"  SUCCESS: Created placeholder image: {web_path.lstrip('/')}")
 
                         # Update story with new images
                         story.set_images(new_image_paths)
                         db.session.commit()
                         print(f"  SUCCESS: Updated story {story.id} with {len(new_image_paths)} images")
 
+                        # Resized variants for the library card and story page
+                        farm.render('images', generate_story_variants, new_image_paths, block=True)
+
                         # Regenerate video with all images
                         if story.audio_path:
                             print(f"  Regenerating video for story {story.id}")
-                            video_path = generate_story_video_from_paths(
+                            video_path = farm.render(
+                                'video',
+                                generate_story_video_from_paths,
                                 new_image_paths,
                                 story.audio_path,
                                 story.title,
@@ -124,4 +103,5 @@ def regenerate_missing_images():
             print(f"ERROR: Error during image regeneration: {str(e)}")
 
 if __name__ == "__main__":
+    initialize_app()
     regenerate_missing_images()
\ No newline at end of file
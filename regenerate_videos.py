@@ -10,9 +10,10 @@ from pathlib import Path
 # Add the current directory to Python path
 sys.path.insert(0, os.path.dirname(__file__))
 
-from app import app, db
+from app import app, db, initialize_app
 from models import Story
 from video_generator import generate_story_video_from_paths
+from render_farm import farm, RenderError
 
 def regenerate_videos():
     """Regenerate videos for all existing stories that have images and audio"""
@@ -26,9 +27,11 @@ def regenerate_videos():
 
             print(f"Found {len(stories)} stories with images and audio")
 
+            # Queue every render first so the render farm works on several stories at once
+            jobs = []
             for story in stories:
                 try:
-                    print(f"\nProcessing story ID {story.id}: {story.title}")
+                    print(f"\nQueueing story ID {story.id}: {story.title}")
 
                     # Get image paths
                     image_paths = story.get_images()
@@ -39,23 +42,35 @@ def regenerate_videos():
                     print(f"  Found {len(image_paths)} images")
 
                     # Regenerate video with sequence
-                    video_path = generate_story_video_from_paths(
+                    job = farm.submit(
+                        'video',
+                        generate_story_video_from_paths,
                         image_paths,
                         story.audio_path,
                         story.title,
                         story.content,
-                        story.id
+                        story.id,
+                        block=True
                     )
+                    jobs.append((story, job))
+
+                except Exception as e:
+                    print(f"  ❌ Error processing story {story.id}: {str(e)}")
+                    continue
+
+            for story, job in jobs:
+                try:
+                    video_path = job.wait()
 
                     if video_path:
                         story.video_path = video_path
                         db.session.commit()
-                        print(f"  ✅ Successfully regenerated video: {video_path}")
+                        print(f"  ✅ Story {story.id}: successfully regenerated video: {video_path}")
                     else:
                         print(f"  ❌ Failed to regenerate video for story {story.id}")
 
-                except Exception as e:
-                    print(f"  ❌ Error processing story {story.id}: {str(e)}")
+                except RenderError as e:
+                    print(f"  ❌ Error rendering story {story.id}: {str(e)}")
                     continue
 
             print(f"\n🎬 Video regeneration completed!")
@@ -64,4 +79,5 @@ def regenerate_videos():
             print(f"❌ Error during video regeneration: {str(e)}")
 
 if __name__ == "__main__":
+    initialize_app()
     regenerate_videos()
\ No newline at end of file
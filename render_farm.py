@@ -0,0 +1,348 @@
+"""
+Render Farm - Dedicated worker processes for video and image rendering
+
+Rendering is CPU-bound and used to run on the request threads, where a few
+simultaneous stories could starve the web workers. Render jobs now go to a
+pool of RENDER_WORKERS separate processes (one per core by default):
+
+- At most RENDER_QUEUE_SIZE jobs wait for a worker; further submissions are
+  rejected with RenderQueueFull (or block, for batch scripts).
+- A job running longer than RENDER_JOB_TIMEOUT seconds is killed together with
+  any encoder it started, and fails with RenderTimeout.
+- A worker that crashes (segfault, out of memory, ...) fails only its own job
+  with RenderCrashed; a fresh worker takes its place.
+
+Jobs are module-level functions with picklable arguments, run in a process
+started with 'spawn' so it shares no threads or DB connections with the web
+process. Queue depth, wait, render time and worker CPU time are exported as
+render metrics, separate from request handling. The farm is per web process;
+with several gunicorn workers, lower RENDER_WORKERS accordingly.
+"""
+
+import os
+import time
+import atexit
+import signal
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from metrics import (RENDER_JOBS, RENDER_QUEUE_WAIT, RENDER_DURATION, RENDER_CPU_SECONDS,
+                     RENDER_BUSY, RENDER_QUEUED)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Render worker processes (0 renders inline in the submitting thread)
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', os.cpu_count() or 1))
+# Jobs allowed to wait for a free worker
+RENDER_QUEUE_SIZE = int(os.environ.get('RENDER_QUEUE_SIZE', 8))
+# Seconds a single job may run before its worker is killed
+RENDER_JOB_TIMEOUT = float(os.environ.get('RENDER_JOB_TIMEOUT', 600))
+
+class RenderError(Exception):
+    """A render job that did not produce a result"""
+
+class RenderQueueFull(RenderError):
+    """Raised by submit() when RENDER_QUEUE_SIZE jobs are already waiting"""
+
+class RenderTimeout(RenderError):
+    """The job ran past its timeout and its worker was killed"""
+
+class RenderCrashed(RenderError):
+    """The worker process died while running the job"""
+
+def _cpu_seconds():
+    """CPU time of this process plus its finished child processes (ffmpeg)"""
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def _worker_main(conn, log_level):
+    """Loop of a render worker process: receive (func, args), send back (ok, result, cpu_seconds)"""
+    if hasattr(os, 'setsid'):
+        # Own process group, so a timeout kill also reaches encoders started by the job
+        os.setsid()
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if job is None:
+            return
+        func, args = job
+        cpu_before = _cpu_seconds()
+        try:
+            result = (True, func(*args))
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Render job {func.__name__} failed: {e}", exc_info=True)
+            result = (False, f"{type(e).__name__}: {e}")
+        conn.send(result + (_cpu_seconds() - cpu_before,))
+
+class RenderJob:
+    """A submitted job; wait() for its result"""
+
+    def __init__(self, kind, func, args, timeout):
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.timeout = timeout
+        self.submitted = time.monotonic()
+        self.started = None
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def _finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the job has finished.
+
+        Returns:
+            The job function's return value
+
+        Raises:
+            RenderError: The job failed, timed out or crashed its worker
+        """
+        if not self._done.wait(timeout):
+            raise RenderTimeout(f"{self.kind} render did not finish within {timeout}s")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class _Worker:
+    """One render process and the pipe to it; restarted after a crash or timeout"""
+
+    def __init__(self, name):
+        self.name = name
+        self.process = None
+        self.conn = None
+
+    def ensure_running(self):
+        if self.process is not None and self.process.is_alive():
+            return
+        self.stop()
+        ctx = multiprocessing.get_context('spawn')
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, logging.getLogger().level),
+                                   name=self.name, daemon=True)
+        self.process.start()
+        child_conn.close()
+        logger.info(f"Started render worker {self.name} (pid {self.process.pid})")
+
+    def kill(self):
+        if self.process is None:
+            return
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.process.join(5)
+        self.stop()
+
+    def stop(self):
+        if self.conn is not None:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+            self.conn.close()
+        if self.process is not None:
+            self.process.join(1)
+            if self.process.is_alive():
+                self.process.kill()
+        self.process = None
+        self.conn = None
+
+class RenderFarm:
+    """Bounded queue of render jobs served by a fixed set of worker processes"""
+
+    def __init__(self, workers=RENDER_WORKERS, queue_size=RENDER_QUEUE_SIZE, job_timeout=RENDER_JOB_TIMEOUT):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.job_timeout = job_timeout
+        self.busy = 0
+        self.counts = {'ok': 0, 'failed': 0, 'timeout': 0, 'crashed': 0, 'rejected': 0}
+        self.render_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._workers = []
+        self._closed = False
+
+    def _start(self):
+        # Caller holds self._cond
+        if self._threads:
+            return
+        for i in range(self.workers):
+            worker = _Worker(f"render-{i + 1}")
+            thread = threading.Thread(target=self._serve, args=(worker,), name=f"render-dispatch-{i + 1}",
+                                      daemon=True)
+            self._workers.append(worker)
+            self._threads.append(thread)
+            thread.start()
+
+    def _publish(self):
+        RENDER_BUSY.set(self.busy)
+        RENDER_QUEUED.set(len(self._queue))
+
+    def submit(self, kind, func, *args, timeout=None, block=False):
+        """
+        Queue func(*args) to run on a render worker.
+
+        Args:
+            kind (str): Job kind for accounting ('video', 'images')
+            func (callable): Module-level function; it and args must be picklable
+            timeout (float): Seconds the job may run, defaults to the farm's job timeout
+            block (bool): Wait for room in the queue instead of raising RenderQueueFull
+
+        Returns:
+            RenderJob: Handle to wait() on
+        """
+        job = RenderJob(kind, func, args, timeout or self.job_timeout)
+        if self.workers <= 0:
+            self._run_inline(job)
+            return job
+        with self._cond:
+            while len(self._queue) >= self.queue_size:
+                if not block:
+                    self.counts['rejected'] += 1
+                    RENDER_JOBS.inc(kind=kind, outcome='rejected')
+                    raise RenderQueueFull(f"Render queue is full ({self.queue_size} jobs waiting)")
+                self._cond.wait()
+            self._start()
+            self._queue.append(job)
+            self._publish()
+            self._cond.notify_all()
+        return job
+
+    def render(self, kind, func, *args, block=False):
+        """Submit a job and wait for its result"""
+        return self.submit(kind, func, *args, block=block).wait()
+
+    def _run_inline(self, job):
+        job.started = time.monotonic()
+        try:
+            result = job.func(*job.args)
+        except Exception as e:
+            self._record(job, 'failed', 0.0)
+            job._finish(error=RenderError(f"{type(e).__name__}: {e}"))
+            return
+        self._record(job, 'ok', 0.0)
+        job._finish(result=result)
+
+    def _next_job(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return None
+            job = self._queue.popleft()
+            self.busy += 1
+            self._publish()
+            # Room in the queue for a blocked submitter
+            self._cond.notify_all()
+            return job
+
+    def _serve(self, worker):
+        """Dispatch thread owning one worker process"""
+        while True:
+            job = self._next_job()
+            if job is None:
+                worker.stop()
+                return
+            job.started = time.monotonic()
+            RENDER_QUEUE_WAIT.observe(job.started - job.submitted, kind=job.kind)
+            try:
+                self._dispatch(worker, job)
+            finally:
+                with self._cond:
+                    self.busy -= 1
+                    self._publish()
+
+    def _dispatch(self, worker, job):
+        try:
+            worker.ensure_running()
+            worker.conn.send((job.func, job.args))
+            finished = worker.conn.poll(job.timeout)
+            if not finished:
+                logger.error(f"Render job {job.kind} timed out after {job.timeout:g}s, killing {worker.name}")
+                worker.kill()
+                self._record(job, 'timeout', 0.0)
+                job._finish(error=RenderTimeout(f"{job.kind} render timed out after {job.timeout:g}s"))
+                return
+            ok, value, cpu = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            logger.error(f"Render worker {worker.name} died during a {job.kind} job: {e}")
+            worker.kill()
+            self._record(job, 'crashed', 0.0)
+            job._finish(error=RenderCrashed(f"{job.kind} render worker crashed"))
+            return
+        except Exception as e:
+            # The job could not be sent (unpicklable arguments, ...); the worker is untouched
+            self._record(job, 'failed', 0.0)
+            job._finish(error=RenderError(f"{type(e).__name__}: {e}"))
+            return
+        if ok:
+            self._record(job, 'ok', cpu)
+            job._finish(result=value)
+        else:
+            self._record(job, 'failed', cpu)
+            job._finish(error=RenderError(value))
+
+    def _record(self, job, outcome, cpu):
+        elapsed = time.monotonic() - job.started
+        RENDER_JOBS.inc(kind=job.kind, outcome=outcome)
+        RENDER_DURATION.observe(elapsed, kind=job.kind)
+        if cpu:
+            RENDER_CPU_SECONDS.inc(cpu, kind=job.kind)
+        with self._cond:
+            self.counts[outcome] += 1
+            self.render_seconds += elapsed
+            self.cpu_seconds += cpu
+        logger.info(f"Render job {job.kind} {outcome} in {elapsed:.2f}s ({cpu:.2f}s CPU)")
+
+    def shutdown(self):
+        """Stop the workers; queued jobs are abandoned"""
+        with self._cond:
+            self._closed = True
+            for job in self._queue:
+                job._finish(error=RenderError("Render farm shut down"))
+            self._queue.clear()
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(2)
+
+    def to_dict(self):
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'busy': self.busy,
+                'queued': len(self._queue),
+                'queue_size': self.queue_size,
+                'job_timeout': self.job_timeout,
+                'jobs': dict(self.counts),
+                'render_seconds': round(self.render_seconds, 2),
+                'cpu_seconds': round(self.cpu_seconds, 2)
+            }
+
+farm = RenderFarm()
+atexit.register(farm.shutdown)
@@ -0,0 +1,259 @@
+"""
+Resilience - Retries, circuit breakers and rate limiting for external providers
+
+Every call to Gemini, Pollinations or gTTS goes through call_with_retry():
+
+- Retryable failures are retried with exponential backoff and full jitter, so
+  stories that hit a blip at the same moment do not retry in lockstep.
+- Each provider has a circuit breaker. After CIRCUIT_FAILURE_THRESHOLD
+  consecutive failures it opens and calls fail at once with CircuitOpenError
+  (images then go straight to a placeholder) until CIRCUIT_RESET_TIMEOUT has
+  passed and a single trial call succeeds.
+- A token bucket paces Gemini requests below the account quota so we wait a
+  little instead of collecting 429s. A request that waits too long fails with
+  RateLimitWaitError, which is not a provider failure and never trips a breaker.
+
+Breakers and buckets are per process; with several gunicorn workers divide
+GEMINI_REQUESTS_PER_MINUTE by the number of workers.
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+from metrics import PROVIDER_RETRIES, CIRCUIT_REJECTIONS, RATE_LIMIT_WAIT
+
+logger = logging.getLogger(__name__)
+
+# Backoff before retry n (from 0) is uniform in [0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**n)]
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', 1.0))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', 10.0))
+
+# Consecutive failures that open a provider's circuit, and seconds before a trial call
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get('CIRCUIT_RESET_TIMEOUT', 60))
+
+# Gemini request budget of this process (0 disables the limiter)
+GEMINI_REQUESTS_PER_MINUTE = float(os.environ.get('GEMINI_REQUESTS_PER_MINUTE', 15))
+GEMINI_RATE_BURST = int(os.environ.get('GEMINI_RATE_BURST', 3))
+# Longest a request waits for a token before failing as rate_limited
+GEMINI_RATE_LIMIT_WAIT = float(os.environ.get('GEMINI_RATE_LIMIT_WAIT', 60))
+
+# Error types that say nothing about provider health, so they never trip a breaker
+NON_CIRCUIT_ERRORS = {'json_error'}
+# Error types of calls that never reached the provider, so they leave its breaker untouched
+NOT_CALLED_ERRORS = {'rate_limited'}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open"""
+
+class RateLimitWaitError(Exception):
+    """Raised when our own rate limiter grants no request in time; the provider was never called"""
+
+class EmptyResponseError(Exception):
+    """A provider answered but produced nothing usable"""
+
+class InvalidImageError(EmptyResponseError):
+    """An image body that is oversized, truncated, corrupt or of an unexpected format or size"""
+
+def classify_error(error):
+    """
+    Map a provider exception to the error types used throughout the pipeline.
+
+    Returns:
+        str: 'json_error', 'quota_exceeded', 'permission_denied', 'timeout',
+             'circuit_open', 'rate_limited' or 'unknown_error'
+    """
+    if isinstance(error, json.JSONDecodeError):
+        return 'json_error'
+    if isinstance(error, CircuitOpenError):
+        return 'circuit_open'
+    if isinstance(error, RateLimitWaitError):
+        return 'rate_limited'
+    error_str = str(error).lower()
+    if "429" in error_str or "quota" in error_str or "exceeded" in error_str:
+        return 'quota_exceeded'
+    if "403" in error_str or "permission" in error_str:
+        return 'permission_denied'
+    if "timeout" in error_str or "timed out" in error_str or "deadline" in error_str:
+        return 'timeout'
+    return 'unknown_error'
+
+def backoff_delay(attempt, base=None, cap=None):
+    """Full-jitter exponential backoff before retry number attempt (0 for the first retry)"""
+    base = RETRY_BASE_DELAY if base is None else base
+    cap = RETRY_MAX_DELAY if cap is None else cap
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed: calls pass, failures are counted. open: calls are rejected until
+    reset_timeout has passed. half_open: one trial call is let through; its
+    success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go ahead now"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._trial_in_flight = False
+                logger.info(f"Circuit for {self.name} is half-open, allowing a trial call")
+            if self.state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info(f"Circuit for {self.name} closed again")
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_skipped(self):
+        """The allowed call never reached the provider: free a half-open trial, change nothing else"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def to_dict(self):
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self.failures}
+
+class TokenBucket:
+    """Allows rate requests per second on average with bursts of up to capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        # Caller holds self._lock
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, timeout=None):
+        """
+        Take one token, sleeping until one is available.
+
+        Returns:
+            bool: False if no token could be had within timeout seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(provider):
+    """The shared breaker for a provider kind ('text', 'image' or 'speech')"""
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider)
+        return _breakers[provider]
+
+def circuit_states():
+    """Breaker state of every provider used so far, for status endpoints"""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {provider: breaker.to_dict() for provider, breaker in breakers.items()}
+
+gemini_rate_limiter = (TokenBucket(GEMINI_REQUESTS_PER_MINUTE / 60.0, GEMINI_RATE_BURST)
+                       if GEMINI_REQUESTS_PER_MINUTE > 0 else None)
+
+def wait_for_gemini_quota():
+    """Block until the Gemini token bucket grants a request; raises RateLimitWaitError after GEMINI_RATE_LIMIT_WAIT"""
+    if gemini_rate_limiter is None:
+        return
+    started = time.perf_counter()
+    granted = gemini_rate_limiter.acquire(timeout=GEMINI_RATE_LIMIT_WAIT)
+    RATE_LIMIT_WAIT.observe(time.perf_counter() - started, provider='text')
+    if not granted:
+        raise RateLimitWaitError(f"No Gemini request slot within {GEMINI_RATE_LIMIT_WAIT:g}s "
+                                 f"({GEMINI_REQUESTS_PER_MINUTE:g} requests/minute)")
+
+def call_with_retry(func, provider, attempts, retry_on=('timeout', 'unknown_error'), deadline=None):
+    """
+    Call func() through the provider's circuit breaker, retrying with backoff.
+
+    Args:
+        func (callable): The provider call; raise to signal failure
+        provider (str): Provider kind, selects the circuit breaker and metric labels
+        attempts (int): Maximum number of calls
+        retry_on (tuple): Error types (see classify_error) worth another attempt
+        deadline (float): Optional time.monotonic() value after which no retry is started
+
+    Returns:
+        The result of the first successful call
+
+    Raises:
+        CircuitOpenError: If the circuit is open
+        Exception: The last error once retries are exhausted or not allowed
+    """
+    breaker = get_circuit_breaker(provider)
+    for attempt in range(attempts):
+        if not breaker.allow():
+            CIRCUIT_REJECTIONS.inc(provider=provider)
+            raise CircuitOpenError(f"{provider} provider is temporarily unavailable (circuit open)")
+        try:
+            result = func()
+        except Exception as e:
+            error_type = classify_error(e)
+            if error_type in NOT_CALLED_ERRORS:
+                breaker.record_skipped()
+            elif error_type not in NON_CIRCUIT_ERRORS:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if error_type not in retry_on or attempt + 1 >= attempts:
+                raise
+            delay = backoff_delay(attempt)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            PROVIDER_RETRIES.inc(provider=provider, error_type=error_type)
+            logger.info(f"Retrying {provider} provider after {error_type} in {delay:.2f}s "
+                        f"(attempt {attempt + 2} of {attempts})")
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
@@ -1,16 +1,46 @@
-from flask import render_template, request, jsonify, send_file, flash, redirect, url_for
+from flask import render_template, request, jsonify, send_file, flash, redirect, url_for, Response, stream_with_context
 from app import app
 from database import db
 from models import Story
-from story_service import create_story_from_prompt, delete_story_files, create_story_download_text
+from story_service import (create_story_from_prompt, delete_story_files, create_story_download_text, list_stories,
+                           ensure_story_video)
+from job_queue import submit_story_job, get_job, iter_job_events
+import prompt_cache
+import metrics
+import admission
+import media_store
+import render_farm
+from image_variants import image_sources
+from static_assets import asset_url, asset_response
+from media_serving import media_path, media_response
 import os
+import json
 import logging
 
+# Templates build <picture> elements from the resized variants of story images
+app.add_template_global(image_sources, 'image_sources')
+# ... and link CSS/JS through their fingerprinted, precompressed builds
+app.add_template_global(asset_url, 'asset_url')
+
 @app.route('/')
 def index():
     """Main page for story generation"""
     return render_template('index.html')
 
+def _parse_flag(value, default):
+    """Boolean request option: a JSON bool or 'true'/'false'-style string; None if it is neither"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ('true', '1', 'yes', 'on'):
+            return True
+        if lowered in ('false', '0', 'no', 'off', ''):
+            return False
+    return None
+
 @app.route('/generate_story', methods=['POST'])
 def generate_story():
     """Generate a new Vedic mythology story"""
@@ -21,8 +51,26 @@ def generate_story():
         if not prompt:
             return jsonify({'error': 'Please provide a prompt'}), 400
 
+        # Admission control: per-client and global limits with a bounded queue
+        client_id = admission.client_id_for(request)
+
+        # Job mode: queue the pipeline and let the client poll /api/jobs/<id>
+        async_mode = _parse_flag(data.get('async'), app.config['STORY_GENERATION_MODE'] == 'async')
+        if async_mode is None:
+            return jsonify({'error': "'async' must be true or false"}), 400
+        if async_mode:
+            permit = admission.controller.reserve(client_id)
+            job = submit_story_job(app, prompt, permit=permit)
+            return jsonify({
+                'success': True,
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': url_for('api_job', job_id=job.id)
+            }), 202
+
         # Use the story service to handle the complete workflow
-        story, error_message = create_story_from_prompt(prompt)
+        with admission.controller.slot(client_id):
+            story, error_message = create_story_from_prompt(prompt)
 
         if story:
             return jsonify({
@@ -32,6 +80,8 @@ def generate_story():
         else:
             return jsonify({'error': error_message}), 500
 
+    except admission.AdmissionRejected as e:
+        return jsonify({'error': e.message, 'retry_after': e.retry_after}), e.status, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logging.error(f"Story generation error: {e}")
         return jsonify({'error': 'An error occurred while generating the story'}), 500
@@ -44,15 +94,25 @@ def view_story(story_id):
 
 @app.route('/library')
 def library():
-    """View all generated stories"""
-    stories = Story.query.order_by(Story.created_at.desc()).all()
-    return render_template('library.html', stories=stories)
+    """View generated stories, one page at a time"""
+    try:
+        stories, next_cursor = list_stories(request.args.get('cursor'))
+    except ValueError:
+        return redirect(url_for('library'))
+    return render_template('library.html', stories=stories, next_cursor=next_cursor,
+                           is_first_page=not request.args.get('cursor'))
 
 @app.route('/api/stories')
 def api_stories():
-    """API endpoint to get all stories"""
-    stories = Story.query.order_by(Story.created_at.desc()).all()
-    return jsonify([story.to_dict() for story in stories])
+    """API endpoint to get a page of stories (pass next_cursor back as ?cursor= for the next page)"""
+    try:
+        stories, next_cursor = list_stories(request.args.get('cursor'), request.args.get('limit', type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'stories': [story.to_summary_dict() for story in stories],
+        'next_cursor': next_cursor
+    })
 
 @app.route('/api/story/<int:story_id>')
 def api_story(story_id):
@@ -60,6 +120,121 @@ def api_story(story_id):
     story = Story.query.get_or_404(story_id)
     return jsonify(story.to_dict())
 
+def _story_video_or_error(story):
+    """(video_path, None) or (None, error response) for a story's on-demand video"""
+    try:
+        video_path = ensure_story_video(story)
+    except render_farm.RenderQueueFull as e:
+        return None, (jsonify({'error': str(e), 'retry_after': 30}), 503, {'Retry-After': '30'})
+    except render_farm.RenderError as e:
+        logging.error(f"On-demand video for story {story.id} failed: {e}")
+        return None, (jsonify({'error': f"Video rendering failed: {e}"}), 500)
+    if not video_path:
+        return None, (jsonify({'error': 'This story has no images or narration to make a video from'}), 404)
+    if story.video_path != video_path:
+        story.video_path = video_path
+        db.session.commit()
+    return video_path, None
+
+@app.route('/api/story/<int:story_id>/video', methods=['GET', 'POST'])
+def api_story_video(story_id):
+    """API endpoint returning the story's video path, rendering the video first if needed"""
+    story = Story.query.get_or_404(story_id)
+    video_path, error = _story_video_or_error(story)
+    if error:
+        return error
+    return jsonify({'video_path': video_path})
+
+@app.route('/static/videos/story_<int:story_id>_video.mp4')
+def story_video_file(story_id):
+    """Serve a story video, rendering it on the first request (VIDEO_POLICY=lazy, or a missing file)"""
+    path = media_path('videos', f"story_{story_id}_video.mp4")
+    if path is not None:
+        # Rendered already: no database or render-farm work on (range) requests
+        return media_response(path, 'video', mimetype='video/mp4')
+    story = Story.query.get_or_404(story_id)
+    video_path, error = _story_video_or_error(story)
+    if error:
+        return error
+    return media_response(os.path.abspath(video_path.lstrip('/')), 'video', mimetype='video/mp4')
+
+@app.route('/static/videos/<path:filename>')
+def video_file(filename):
+    """Serve a video file with Range (seeking) and conditional request support"""
+    path = media_path('videos', filename)
+    if path is None:
+        return jsonify({'error': 'Video not found'}), 404
+    return media_response(path, 'video')
+
+@app.route('/static/audio/<path:filename>')
+def audio_file(filename):
+    """Serve a narration file with Range (seeking) and conditional request support"""
+    path = media_path('audio', filename)
+    if path is None:
+        return jsonify({'error': 'Audio not found'}), 404
+    return media_response(path, 'audio')
+
+@app.route('/static/dist/<path:filename>')
+def static_asset(filename):
+    """Serve a fingerprinted CSS/JS build, precompressed to suit Accept-Encoding and cacheable forever"""
+    response = asset_response(filename, request.accept_encodings)
+    if response is None:
+        return jsonify({'error': 'Asset not found'}), 404
+    return response
+
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    """API endpoint to poll the status of a story generation job"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    result = job.to_dict()
+    if job.status == 'completed' and job.story_id:
+        story = db.session.get(Story, job.story_id)
+        result['story'] = story.to_dict() if story else None
+    return jsonify(result)
+
+@app.route('/api/jobs/<job_id>/events')
+def api_job_events(job_id):
+    """Server-Sent Events stream of a story generation job's progress"""
+    if get_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def generate():
+        for item in iter_job_events(job_id):
+            if item is None:
+                # Comment line keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+                continue
+            event, data = item
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Disable nginx response buffering
+    })
+
+@app.route('/api/cache/stats')
+def api_cache_stats():
+    """API endpoint reporting prompt cache hit rate and lookup latency, and media store usage"""
+    return jsonify(dict(prompt_cache.stats.to_dict(), media=media_store.stats()))
+
+@app.route('/api/admission/stats')
+def api_admission_stats():
+    """API endpoint reporting running and queued generations and rejection counts"""
+    return jsonify(admission.controller.to_dict())
+
+@app.route('/api/render/stats')
+def api_render_stats():
+    """API endpoint reporting render farm workers, queue depth and render time spent"""
+    return jsonify(render_farm.farm.to_dict())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint: pipeline metrics merged across all workers"""
+    return Response(metrics.render_latest(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/download_story/<int:story_id>')
 def download_story(story_id):
     """Download story as text file"""
@@ -82,6 +257,7 @@ def delete_story(story_id):
         # Delete the story record
         db.session.delete(story)
         db.session.commit()
+        prompt_cache.forget_story(story_id)
 
         flash('Story deleted successfully', 'success')
         return redirect(url_for('library'))
@@ -0,0 +1,177 @@
+"""
+Single Flight - Coalesces concurrent generations of the same prompt
+
+The first request for a prompt hash inserts a PromptFlight row and becomes the
+leader; the table's primary key guarantees only one insert can win, across
+threads, gunicorn workers and hosts sharing the database. Everyone else waits
+for the leader to finish and then serves its story instead of paying for
+Gemini, images, TTS and video again.
+
+While the leader works, a heartbeat thread pushes the lease's expiry forward
+every LEASE_TTL / 3 seconds, so a slow generation never loses its lease; only
+a leader that stopped heartbeating (its process died) is taken over.
+"""
+
+import os
+import time
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.util import identity_key
+from database import db
+from models import PromptFlight, Story
+
+logger = logging.getLogger(__name__)
+
+# A leader whose lease has not been renewed for this many seconds is presumed dead
+LEASE_TTL = int(os.environ.get('SINGLE_FLIGHT_LEASE_TTL', 120))
+# How long a failed generation is reported to followers before it may be retried
+FAILED_TTL = int(os.environ.get('SINGLE_FLIGHT_FAILED_TTL', 10))
+# Longest a follower waits for the leader's result
+WAIT_TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_WAIT_TIMEOUT', 900))
+POLL_INTERVAL = float(os.environ.get('SINGLE_FLIGHT_POLL_INTERVAL', 0.5))
+
+# Prompt hash -> Event that stops the heartbeat of a lease this process holds
+_heartbeats = {}
+_heartbeats_lock = threading.Lock()
+
+def _owner_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"[:64]
+
+def _start_heartbeat(prompt_hash, owner):
+    from flask import current_app
+
+    stop = threading.Event()
+    with _heartbeats_lock:
+        _heartbeats[prompt_hash] = stop
+    threading.Thread(target=_heartbeat, args=(current_app._get_current_object(), prompt_hash, owner, stop),
+                     name='single-flight-heartbeat', daemon=True).start()
+
+def _stop_heartbeat(prompt_hash):
+    with _heartbeats_lock:
+        stop = _heartbeats.pop(prompt_hash, None)
+    if stop is not None:
+        stop.set()
+
+def _heartbeat(app, prompt_hash, owner, stop):
+    """Renew a held lease until release() stops it or the lease is lost"""
+    with app.app_context():
+        while not stop.wait(LEASE_TTL / 3):
+            try:
+                renewed = PromptFlight.query.filter_by(prompt_hash=prompt_hash, owner=owner, status='running').update(
+                    {PromptFlight.expires_at: datetime.utcnow() + timedelta(seconds=LEASE_TTL)})
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Could not renew generation lease for {prompt_hash}: {e}")
+                continue
+            if not renewed:
+                logger.warning(f"Generation lease for {prompt_hash} was lost; no longer renewing it")
+                return
+
+def is_in_flight(prompt_hash):
+    """True if some worker currently holds an unexpired lease for prompt_hash"""
+    flight = db.session.get(PromptFlight, prompt_hash)
+    return flight is not None and flight.status == 'running' and flight.expires_at > datetime.utcnow()
+
+def acquire(prompt_hash):
+    """
+    Try to become the leader for prompt_hash.
+
+    Stale leases (expired, or failed past FAILED_TTL) are removed and the
+    insert is retried.
+
+    Returns:
+        bool: True if this caller is now the leader and must call release()
+    """
+    owner = _owner_id()
+    while True:
+        # A lease this session loaded earlier (e.g. while following) would clash with the new row
+        cached = db.session.identity_map.get(identity_key(PromptFlight, prompt_hash))
+        if cached is not None:
+            db.session.expunge(cached)
+        flight = PromptFlight(
+            prompt_hash=prompt_hash,
+            owner=owner,
+            status='running',
+            expires_at=datetime.utcnow() + timedelta(seconds=LEASE_TTL)
+        )
+        db.session.add(flight)
+        try:
+            db.session.commit()
+            logger.info(f"Acquired generation lease for prompt hash {prompt_hash}")
+            _start_heartbeat(prompt_hash, owner)
+            return True
+        except IntegrityError:
+            db.session.rollback()
+
+        existing = db.session.get(PromptFlight, prompt_hash)
+        if existing is None:
+            # Released between our insert and lookup; try again
+            continue
+        if existing.expires_at > datetime.utcnow():
+            return False
+
+        # Delete only the exact lease we saw, so two callers cannot both clear it
+        logger.warning(f"Removing stale generation lease for {prompt_hash} held by {existing.owner}")
+        PromptFlight.query.filter_by(prompt_hash=prompt_hash, expires_at=existing.expires_at).delete()
+        db.session.commit()
+
+def release(prompt_hash, error_message=None):
+    """
+    Give up leadership. On success the lease is removed so followers load the
+    committed story; on failure the error is kept for FAILED_TTL seconds so
+    current followers receive it instead of all retrying at once.
+    """
+    _stop_heartbeat(prompt_hash)
+    try:
+        db.session.rollback()
+        flight = db.session.get(PromptFlight, prompt_hash)
+        if flight is None:
+            return
+        if error_message:
+            flight.status = 'failed'
+            flight.error = error_message
+            flight.expires_at = datetime.utcnow() + timedelta(seconds=FAILED_TTL)
+        else:
+            db.session.delete(flight)
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Failed to release generation lease for {prompt_hash}: {e}")
+        db.session.rollback()
+
+def wait_for_leader(prompt_hash):
+    """
+    Block until the leader for prompt_hash finishes.
+
+    Returns:
+        (story, error_message, retry): retry is True when the lease vanished
+        without a story (e.g. it expired), meaning the caller should try to
+        acquire leadership itself
+    """
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    logger.info(f"Waiting for in-flight generation of prompt hash {prompt_hash}")
+
+    while time.monotonic() < deadline:
+        db.session.expire_all()
+        flight = db.session.get(PromptFlight, prompt_hash)
+
+        if flight is None:
+            story = Story.query.filter_by(prompt_hash=prompt_hash).order_by(Story.id).first()
+            if story:
+                logger.info(f"Coalesced onto story {story.id} for prompt hash {prompt_hash}")
+                return story, None, False
+            return None, None, True
+
+        if flight.expires_at <= datetime.utcnow():
+            return None, None, True
+        if flight.status == 'failed':
+            return None, flight.error or "Story generation failed", False
+
+        # End the read transaction so the next poll sees fresh data
+        db.session.rollback()
+        time.sleep(POLL_INTERVAL)
+
+    return None, "Story generation is taking longer than expected. Please try again shortly.", False
@@ -33,45 +33,24 @@ async function handleStoryGeneration(event) {
     generateBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>Generating...';
     loadingSection.style.display = 'block';
     storyResult.style.display = 'none';
+    setLoadingText('Generating story content...');
     
     try {
-        // Update loading text periodically
-        updateLoadingText();
-        
+        // Ask for job mode so the server answers at once and streams real progress
         const response = await fetch('/generate_story', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ prompt: prompt })
+            body: JSON.stringify({ prompt: prompt, async: true })
         });
         
-        const data = await response.json();
-
-        if (data.success) {
-            displayStory(data.story);
-            currentStoryId = data.story.id;
-        } else {
-            // Handle specific error types with better messages
-            let errorMessage = data.error || 'Failed to generate story';
-            let alertType = 'danger';
-
-            if (data.error === 'AI Service Quota Exceeded') {
-                errorMessage = 'AI Service Limit Reached. The daily quota has been exceeded. If you have a Pro API key, please check:\n\n1. Verify your API key is correct in .env file\n2. Ensure your Google Cloud project has billing enabled\n3. Check if your Pro subscription is active\n4. Try refreshing your API quota in Google AI Studio\n\nPlease try again tomorrow or contact support for increased limits.';
-                alertType = 'warning';
-            } else if (data.error === 'AI Service Access Denied') {
-                errorMessage = 'Service Configuration Issue. Please contact support to resolve the access problem.';
-                alertType = 'warning';
-            } else if (data.error === 'AI Service Timeout') {
-                errorMessage = 'Service Timeout. The AI service is taking too long to respond. Please try again.';
-                alertType = 'warning';
-            } else if (data.message) {
-                // Use the more detailed message if available
-                errorMessage = data.message;
-            }
-
-            showAlert(errorMessage, alertType);
+        let data = await response.json();
+        if (response.status === 202 && data.job_id) {
+            data = await followStoryJob(data.job_id);
         }
+
+        handleGenerationResult(data);
         
     } catch (error) {
         console.error('Story generation error:', error);
@@ -84,18 +63,212 @@ async function handleStoryGeneration(event) {
     }
 }
 
-// Display generated story
-function displayStory(story) {
+// Show the final story or a helpful error message
+function handleGenerationResult(data) {
+    if (data.success) {
+        displayStory(data.story, !data.progressive);
+        currentStoryId = data.story.id;
+        return;
+    }
+
+    // Handle specific error types with better messages
+    let errorMessage = data.error || 'Failed to generate story';
+    let alertType = 'danger';
+
+    if (data.error === 'AI Service Quota Exceeded') {
+        errorMessage = 'AI Service Limit Reached. The daily quota has been exceeded. If you have a Pro API key, please check:\n\n1. Verify your API key is correct in .env file\n2. Ensure your Google Cloud project has billing enabled\n3. Check if your Pro subscription is active\n4. Try refreshing your API quota in Google AI Studio\n\nPlease try again tomorrow or contact support for increased limits.';
+        alertType = 'warning';
+    } else if (data.error === 'AI Service Access Denied') {
+        errorMessage = 'Service Configuration Issue. Please contact support to resolve the access problem.';
+        alertType = 'warning';
+    } else if (data.error === 'AI Service Timeout') {
+        errorMessage = 'Service Timeout. The AI service is taking too long to respond. Please try again.';
+        alertType = 'warning';
+    } else if (data.retry_after) {
+        // Server is at capacity (429/503): say when it is worth trying again
+        errorMessage = `${data.error} You can try again in about ${data.retry_after} seconds.`;
+        alertType = 'warning';
+    } else if (data.message) {
+        // Use the more detailed message if available
+        errorMessage = data.message;
+    }
+
+    showAlert(errorMessage, alertType);
+}
+
+// Follow a generation job until it finishes, rendering partial results on the way.
+// Resolves with the same shape as the synchronous /generate_story response.
+function followStoryJob(jobId) {
+    if (!window.EventSource) {
+        return pollStoryJob(jobId);
+    }
+
+    // Partial results are merged into the result area, so start from an empty one
+    resetStoryResult();
+
+    return new Promise((resolve) => {
+        const source = new EventSource(`/api/jobs/${jobId}/events`);
+        const progress = { storyShown: false, streamedText: '' };
+
+        source.addEventListener('stage', (e) => {
+            const data = JSON.parse(e.data);
+            setLoadingText(stageMessage(data.stage, data.status));
+
+            // The story text is saved before media starts: show it right away
+            if (data.stage === 'text' && data.status === 'completed' && data.story_id && !progress.storyShown) {
+                progress.storyShown = true;
+                fetch(`/api/story/${data.story_id}`)
+                    .then(response => response.json())
+                    .then(story => {
+                        // Keep the illustrations and narration that arrived while this was loading
+                        displayStory(story, true, true);
+                        currentStoryId = story.id;
+                    })
+                    .catch(error => console.error('Failed to load partial story:', error));
+            }
+        });
+
+        // A new attempt (the text request was retried) streams the story from the start
+        source.addEventListener('attempt', () => {
+            progress.streamedText = '';
+            setLoadingText(stageMessage('text', 'running'));
+            if (!progress.storyShown) {
+                showStreamedStory('');
+            }
+        });
+
+        // Render the story text into the page as it is written
+        source.addEventListener('text', (e) => {
+            progress.streamedText += JSON.parse(e.data).text;
+            setLoadingText(streamedStoryPreview(progress.streamedText));
+            if (!progress.storyShown) {
+                showStreamedStory(progress.streamedText);
+            }
+        });
+
+        source.addEventListener('image', (e) => {
+            const data = JSON.parse(e.data);
+            addStoryImage(data.path, data.index);
+        });
+
+        source.addEventListener('audio', (e) => {
+            setStoryAudio(JSON.parse(e.data).path);
+        });
+
+        source.addEventListener('video', () => {
+            setLoadingText('Your story video is ready!');
+        });
+
+        source.addEventListener('done', (e) => {
+            source.close();
+            resolve({ success: true, story: JSON.parse(e.data).story, progressive: progress.storyShown });
+        });
+
+        source.addEventListener('failed', (e) => {
+            source.close();
+            resolve({ success: false, error: JSON.parse(e.data).error });
+        });
+
+        // Connection dropped: stop the automatic reconnect (which would replay
+        // every event) and finish by polling instead
+        source.onerror = () => {
+            source.close();
+            pollStoryJob(jobId).then(resolve);
+        };
+    });
+}
+
+// Fallback for browsers without EventSource or when the stream drops
+async function pollStoryJob(jobId) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        const job = await response.json();
+
+        if (job.status === 'completed') {
+            return { success: true, story: job.story };
+        }
+        if (job.status === 'failed' || response.status === 404) {
+            return { success: false, error: job.error || 'Failed to generate story' };
+        }
+
+        if (job.stage) {
+            setLoadingText(stageMessage(job.stage, job.stages[job.stage]));
+        }
+        await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+}
+
+// Human-readable loading message for a pipeline stage update
+function stageMessage(stage, status) {
+    const messages = {
+        text: 'Generating story content...',
+        images: 'Creating beautiful illustrations...',
+        audio: 'Preparing audio narration...',
+        video: 'Crafting divine video narration...'
+    };
+    if (status === 'completed' && stage === 'video') {
+        return 'Finalizing your Vedic story...';
+    }
+    return messages[stage] || 'Finalizing your Vedic story...';
+}
+
+// Show the tail of the story text while it is still being written
+function streamedStoryPreview(streamedText) {
+    const text = streamedText.replace(/\s+/g, ' ').trim();
+    if (!text) {
+        return 'Generating story content...';
+    }
+    return text.length > 160 ? '...' + text.slice(-160) : text;
+}
+
+// Story text rendered as HTML, keeping its line breaks
+function storyTextHtml(text) {
+    const escaped = document.createElement('div');
+    escaped.textContent = text;
+    return escaped.innerHTML.replace(/\n/g, '<br>');
+}
+
+// Show the story text streamed so far, before the story is saved
+function showStreamedStory(streamedText) {
+    const storyResult = document.getElementById('storyResult');
+    const storyContent = document.getElementById('storyContent');
+    if (!storyResult || !storyContent) return;
+
+    storyContent.innerHTML = storyTextHtml(streamedText.trim());
+    if (streamedText.trim()) {
+        storyResult.style.display = 'block';
+    }
+}
+
+// Clear the previous story before a new one is rendered piece by piece
+function resetStoryResult() {
+    ['storyTitle', 'storyContent', 'storyImages', 'storyCharacters', 'storyMoral'].forEach(id => {
+        const element = document.getElementById(id);
+        if (element) {
+            element.innerHTML = '';
+        }
+    });
+    setStoryAudio(null);
+}
+
+function setLoadingText(text) {
+    const loadingText = document.getElementById('loadingText');
+    if (loadingText) {
+        loadingText.textContent = text;
+    }
+}
+
+// Display generated story. A partial render (the saved text while media is still
+// being made) merges into the image slots and narration already shown instead of
+// replacing them.
+function displayStory(story, scroll = true, partial = false) {
     const storyResult = document.getElementById('storyResult');
     const storyTitle = document.getElementById('storyTitle');
     const storyContent = document.getElementById('storyContent');
     const storyImages = document.getElementById('storyImages');
-    const audioSection = document.getElementById('audioSection');
-    const storyAudio = document.getElementById('storyAudio');
     const storyCharacters = document.getElementById('storyCharacters');
     const storyMoral = document.getElementById('storyMoral');
     const downloadBtn = document.getElementById('downloadBtn');
-    const playAudioBtn = document.getElementById('playAudioBtn');
     
     // Set story content
     storyTitle.textContent = story.title;
@@ -112,34 +285,17 @@ function displayStory(story) {
     }
     
     // Display images
-    if (story.images && story.images.length > 0) {
+    if (!partial) {
         storyImages.innerHTML = '';
-        story.images.forEach((imagePath, index) => {
-            const imageDiv = document.createElement('div');
-            imageDiv.className = 'col-md-4';
-            imageDiv.innerHTML = `
-                <div class="position-relative">
-                    <img src="${imagePath}" 
-                         class="img-fluid rounded shadow-sm story-image" 
-                         alt="Story illustration ${index + 1}"
-                         onclick="openImageModal('${imagePath}')">
-                    <button class="btn btn-sm btn-primary position-absolute top-0 end-0 m-2" 
-                            onclick="openImageModal('${imagePath}')">
-                        <i class="fas fa-expand"></i>
-                    </button>
-                </div>
-            `;
-            storyImages.appendChild(imageDiv);
-        });
+    }
+    if (story.images && story.images.length > 0) {
+        const sources = story.image_sources || [];
+        story.images.forEach((imagePath, index) => addStoryImage(imagePath, index, sources[index]));
     }
     
     // Setup audio
-    if (story.audio_path) {
-        storyAudio.src = story.audio_path;
-        playAudioBtn.style.display = 'block';
-        setupAudioControls();
-    } else {
-        playAudioBtn.style.display = 'none';
+    if (!partial || story.audio_path) {
+        setStoryAudio(story.audio_path);
     }
     
     // Setup download button
@@ -151,7 +307,65 @@ function displayStory(story) {
     
     // Show the result
     storyResult.style.display = 'block';
-    storyResult.scrollIntoView({ behavior: 'smooth' });
+    if (scroll) {
+        storyResult.scrollIntoView({ behavior: 'smooth' });
+    }
+}
+
+// Add (or replace) the illustration for one scene slot; sources lists its resized
+// WebP/AVIF variants (image_sources in the story JSON), if they exist yet
+function addStoryImage(imagePath, index, sources) {
+    const storyImages = document.getElementById('storyImages');
+    if (!storyImages || !imagePath) return;
+
+    let imageDiv = storyImages.querySelector(`[data-scene-index="${index}"]`);
+    if (!imageDiv) {
+        imageDiv = document.createElement('div');
+        imageDiv.className = 'col-md-4';
+        imageDiv.dataset.sceneIndex = index;
+
+        // Keep scene order even when images land out of order
+        const next = Array.from(storyImages.children).find(el => Number(el.dataset.sceneIndex) > index);
+        storyImages.insertBefore(imageDiv, next || null);
+    }
+    const sourceTags = (sources || []).map(source =>
+        `<source type="${source.type}" srcset="${source.srcset}" sizes="(max-width: 768px) 100vw, 400px">`
+    ).join('');
+    imageDiv.innerHTML = `
+        <div class="position-relative">
+            <picture>
+                ${sourceTags}
+                <img src="${imagePath}" 
+                     class="img-fluid rounded shadow-sm story-image" 
+                     alt="Story illustration ${index + 1}"
+                     onclick="openImageModal('${imagePath}')">
+            </picture>
+            <button class="btn btn-sm btn-primary position-absolute top-0 end-0 m-2" 
+                    onclick="openImageModal('${imagePath}')">
+                <i class="fas fa-expand"></i>
+            </button>
+        </div>
+    `;
+}
+
+// Attach narration audio once it is available
+function setStoryAudio(audioPath) {
+    const storyAudio = document.getElementById('storyAudio');
+    const playAudioBtn = document.getElementById('playAudioBtn');
+    if (!storyAudio || !playAudioBtn) return;
+
+    if (audioPath) {
+        if (storyAudio.getAttribute('src') !== audioPath) {
+            storyAudio.src = audioPath;
+        }
+        playAudioBtn.style.display = 'block';
+        if (!playAudioBtn.dataset.bound) {
+            playAudioBtn.dataset.bound = 'true';
+            setupAudioControls();
+        }
+    } else {
+        playAudioBtn.style.display = 'none';
+    }
 }
 
 // Setup audio controls
@@ -186,31 +400,6 @@ function setupAudioControls() {
     });
 }
 
-// Update loading text with different phases
-function updateLoadingText() {
-    const loadingText = document.getElementById('loadingText');
-    if (!loadingText) return;
-
-    const phases = [
-        'Generating story content...',
-        'Creating beautiful illustrations...',
-        'Preparing audio narration...',
-        'Crafting divine video narration...',
-        'Finalizing your Vedic story...'
-    ];
-
-    let currentPhase = 0;
-    const interval = setInterval(() => {
-        if (loadingText.closest('#loadingSection').style.display === 'none') {
-            clearInterval(interval);
-            return;
-        }
-
-        loadingText.textContent = phases[currentPhase];
-        currentPhase = (currentPhase + 1) % phases.length;
-    }, 3000);
-}
-
 // Open image in modal
 function openImageModal(imageSrc) {
     // Create modal if it doesn't exist
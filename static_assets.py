@@ -0,0 +1,289 @@
+"""
+Static Assets - Minified, precompressed and fingerprinted CSS and JavaScript
+
+At startup (or ahead of time with `python static_assets.py`) every file in
+ASSETS is minified and written under static/dist/ with a hash of its content in
+the name, next to gzip and, when the brotli package is installed, brotli
+copies:
+
+    static/dist/css/style.3f9c0a1b2d4e.css
+    static/dist/css/style.3f9c0a1b2d4e.css.gz
+    static/dist/css/style.3f9c0a1b2d4e.css.br
+
+Templates link assets with asset_url('css/style.css'), which returns the
+hashed URL. Since a changed file gets a new URL, responses for hashed files can
+be cached by browsers forever (Cache-Control: immutable); asset_response()
+sends the precompressed copy that matches the request's Accept-Encoding, so
+nothing is compressed per request. If the build fails, asset_url() falls back
+to the original file and the page still works.
+
+Output names depend only on content, so building is idempotent and several
+worker processes starting at once write identical files.
+"""
+
+import os
+import re
+import sys
+import gzip
+import uuid
+import hashlib
+import logging
+import mimetypes
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = 'dist'
+# Files under static/ that are built, relative to it
+ASSETS = ('css/style.css', 'js/app.js')
+# Browsers may keep a hashed asset this long (seconds) without revalidating
+ASSET_MAX_AGE = int(os.environ.get('ASSET_MAX_AGE', 365 * 24 * 3600))
+
+# Precompressed variants, in order of preference: (Accept-Encoding token, file suffix)
+_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Logical name -> path of the built file relative to static/
+_manifest = {}
+
+# Minification
+
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE_AROUND = re.compile(r'\s*([{};,>])\s*')
+_CSS_SPACE_AFTER_COLON = re.compile(r':\s+')
+
+def minify_css(source):
+    """Drop comments and insignificant whitespace (string contents are never touched)"""
+    parts = re.split(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', source)
+    for i in range(0, len(parts), 2):
+        code = _CSS_COMMENT.sub('', parts[i])
+        code = ' '.join(code.split())
+        code = _CSS_SPACE_AROUND.sub(r'\1', code)
+        # Only after a colon: before one it may be a descendant combinator (".a :hover")
+        code = _CSS_SPACE_AFTER_COLON.sub(':', code)
+        parts[i] = code.replace(';}', '}')
+    return ''.join(parts).strip()
+
+# After these characters a '/' starts a regular expression rather than a division
+_REGEX_PRECEDERS = set('(,=:[!&|?{};~+-*%<>^')
+_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'delete', 'void', 'throw', 'new'}
+_LAST_WORD = re.compile(r'[\w$]+$')
+
+def _is_word_char(char):
+    return char.isalnum() or char in '_$\\' or ord(char) > 127
+
+def minify_js(source):
+    """
+    Drop comments, indentation and blank lines from JavaScript.
+
+    Deliberately conservative: strings, template literals and regular
+    expressions are copied verbatim, line breaks are kept (so automatic
+    semicolon insertion behaves exactly as before), and runs of spaces within
+    a line shrink to one space or none where no two word characters meet.
+    """
+    out = []
+    i, length = 0, len(source)
+    # Brace depth of each open template literal's current ${ } expression
+    template_stack = []
+
+    def last_significant():
+        for chunk in reversed(out):
+            stripped = chunk.rstrip()
+            if stripped:
+                return stripped
+        return ''
+
+    while i < length:
+        char = source[i]
+        nxt = source[i + 1] if i + 1 < length else ''
+
+        if char == '`' or (char == '}' and template_stack and template_stack[-1] == 0):
+            # Template literal text, up to its end or the next ${
+            if char == '}':
+                template_stack.pop()
+            j = i + 1
+            while j < length:
+                if source[j] == '\\':
+                    j += 2
+                    continue
+                if source[j] == '`':
+                    j += 1
+                    break
+                if source[j] == '$' and source[j + 1:j + 2] == '{':
+                    j += 2
+                    template_stack.append(0)
+                    break
+                j += 1
+            out.append(source[i:j])
+            i = j
+        elif char in '"\'':
+            j = i + 1
+            while j < length and source[j] != char:
+                j += 2 if source[j] == '\\' else 1
+            out.append(source[i:j + 1])
+            i = j + 1
+        elif char == '/' and nxt == '/':
+            while i < length and source[i] != '\n':
+                i += 1
+        elif char == '/' and nxt == '*':
+            end = source.find('*/', i + 2)
+            end = length if end == -1 else end + 2
+            out.append('\n' if '\n' in source[i:end] else ' ')
+            i = end
+        elif char == '/':
+            previous = last_significant()
+            word = _LAST_WORD.search(previous)
+            if not previous or previous[-1] in _REGEX_PRECEDERS or (word and word.group() in _REGEX_KEYWORDS):
+                j, in_class = i + 1, False
+                while j < length and source[j] != '\n':
+                    if source[j] == '\\':
+                        j += 2
+                        continue
+                    if source[j] == '[':
+                        in_class = True
+                    elif source[j] == ']':
+                        in_class = False
+                    elif source[j] == '/' and not in_class:
+                        break
+                    j += 1
+                j += 1
+                while j < length and _is_word_char(source[j]):
+                    j += 1  # flags
+                out.append(source[i:j])
+                i = j
+            else:
+                out.append(char)
+                i += 1
+        elif char.isspace():
+            j = i
+            while j < length and source[j].isspace():
+                j += 1
+            before = out[-1][-1:] if out else ''
+            after = source[j:j + 1]
+            if '\n' in source[i:j]:
+                if before and before != '\n':
+                    out.append('\n')
+            elif before and after and (
+                    (_is_word_char(before) and _is_word_char(after)) or (before == after and before in '+-')):
+                out.append(' ')
+            i = j
+        else:
+            if template_stack:
+                if char == '{':
+                    template_stack[-1] += 1
+                elif char == '}':
+                    template_stack[-1] -= 1
+            out.append(char)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+_MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+# Build
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def build_asset(name, static_dir=STATIC_DIR):
+    """
+    Minify, fingerprint and precompress one asset.
+
+    Returns:
+        str: Path of the built file relative to the static folder
+    """
+    stem, ext = os.path.splitext(name)
+    with open(os.path.join(static_dir, name), encoding='utf-8') as f:
+        source = f.read()
+    minify = _MINIFIERS.get(ext)
+    data = (minify(source) if minify else source).encode('utf-8')
+
+    built = f"{DIST_DIR}/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+    path = os.path.join(static_dir, built)
+    exists = os.path.exists(path)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Compressed copies first, so they exist by the time the plain file shows it is built.
+    # An existing build still gets any copy it lacks, e.g. .br once brotli is installed
+    compressors = [('.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+    if BROTLI_AVAILABLE:
+        compressors.append(('.br', lambda raw: brotli.compress(raw, quality=11)))
+    for suffix, compress in compressors:
+        if not os.path.exists(path + suffix):
+            _write_atomic(path + suffix, compress(data))
+            if exists:
+                logger.info(f"Added missing {suffix} copy of {built}")
+    if exists:
+        return built
+    _write_atomic(path, data)
+    logger.info(f"Built {built}: {len(source)} -> {len(data)} bytes minified")
+    return built
+
+def build_assets(static_dir=STATIC_DIR):
+    """
+    Build every asset in ASSETS and make asset_url() return their hashed URLs.
+
+    Returns:
+        dict: Logical name -> built path; assets that failed to build are left
+        out and served unchanged
+    """
+    if not BROTLI_AVAILABLE:
+        logger.warning("brotli is not installed; static assets are precompressed with gzip only")
+    manifest = {}
+    for name in ASSETS:
+        try:
+            manifest[name] = build_asset(name, static_dir)
+        except Exception as e:
+            logger.error(f"Could not build static asset {name}: {e}")
+    _manifest.clear()
+    _manifest.update(manifest)
+    return manifest
+
+# Serving
+
+def asset_url(name):
+    """URL of an asset: the fingerprinted build when there is one, else the original"""
+    from flask import url_for
+    return url_for('static', filename=_manifest.get(name, name))
+
+def asset_response(filename, accept_encodings, static_dir=STATIC_DIR):
+    """
+    Response for a built asset under static/dist/, from the precompressed copy
+    that accept_encodings (a request's accept_encodings) prefers.
+
+    Returns:
+        flask.Response, or None if filename is not a built asset
+    """
+    from flask import send_file
+
+    path = os.path.join(static_dir, DIST_DIR, filename)
+    if '..' in filename.split('/') or filename.endswith(('.gz', '.br', '.tmp')) or not os.path.isfile(path):
+        return None
+
+    encoding, served = None, path
+    available = [(token, suffix) for token, suffix in _ENCODINGS if os.path.exists(path + suffix)]
+    best = accept_encodings.best_match([token for token, _ in available])
+    for token, suffix in available:
+        if token == best:
+            encoding, served = token, path + suffix
+
+    response = send_file(served, mimetype=mimetypes.guess_type(path)[0], conditional=True, max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    response.vary.add('Accept-Encoding')
+    return response
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    for logical, built in build_assets().items():
+        print(f"{logical} -> {built}")
+    sys.exit(0 if len(_manifest) == len(ASSETS) else 1)
@@ -1,9 +1,12 @@
 import os
 import json
+import time
 import logging
-import google.generativeai as genai
 from pathlib import Path
 from dotenv import load_dotenv
+from providers import get_text_provider
+from metrics import PROVIDER_REQUEST_DURATION, PROVIDER_FAILURES
+from resilience import call_with_retry, classify_error
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -14,114 +17,331 @@ if env_path.exists():
     load_dotenv(dotenv_path=env_path, override=True)
     logger.info("Loaded .env file")
 
-# Configure Gemini
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
-genai.configure(api_key=GEMINI_API_KEY)
+# Stream Gemini output so scenes can be handed downstream before the response ends
+STREAM_STORY_TEXT = os.getenv("STREAM_STORY_TEXT", "true").lower() in ("1", "true", "yes")
 
-# Initialize the model with the correct model name
-model = genai.GenerativeModel('gemini-1.5-flash')
+# Gemini calls per story, including retries after malformed JSON, timeouts and unknown errors
+TEXT_MAX_ATTEMPTS = int(os.getenv("TEXT_MAX_ATTEMPTS", 3))
 
-def generate_vedic_story(prompt):
+class SceneStreamParser:
+    """
+    Incremental JSON scanner that yields entries of the top-level "scenes" array
+    as soon as each one is complete.
+
+    Text is fed in arbitrary chunks; the scanner tracks string/escape state and
+    bracket depth so it never needs the whole document. Anything before the
+    first '{' (such as a ```json fence) is ignored. Scene entries that are
+    objects are reduced to their "description" field when present.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.last_key = None
+        self.scenes_depth = None
+        self.element_start = None
+        self.count = 0
+
+    def feed(self, text):
+        """Add a chunk of model output; returns the list of newly completed scenes"""
+        self.buffer += text
+        completed = []
+        buf = self.buffer
+        for i in range(self.pos, len(buf)):
+            c = buf[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == '\\':
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if self._at_scene_level() and self.element_start == self.string_start:
+                        self._emit(buf[self.element_start:i + 1], completed)
+                    elif len(self.stack) == 1:
+                        self.last_key = buf[self.string_start + 1:i]
+                continue
+
+            if c == '"':
+                self.in_string = True
+                self.string_start = i
+                if self._at_scene_level() and self.element_start is None:
+                    self.element_start = i
+            elif c in '{[':
+                if self._at_scene_level() and self.element_start is None:
+                    self.element_start = i
+                self.stack.append(c)
+                if c == '[' and len(self.stack) == 2 and self.last_key == 'scenes':
+                    self.scenes_depth = 2
+            elif c in '}]':
+                if self.stack:
+                    self.stack.pop()
+                if self.scenes_depth is not None:
+                    if len(self.stack) < self.scenes_depth:
+                        self.scenes_depth = None
+                    elif self._at_scene_level() and self.element_start is not None:
+                        self._emit(buf[self.element_start:i + 1], completed)
+        self.pos = len(buf)
+        return completed
+
+    def _at_scene_level(self):
+        return self.scenes_depth is not None and len(self.stack) == self.scenes_depth
+
+    def _emit(self, raw, completed):
+        self.element_start = None
+        try:
+            scene = json.loads(raw)
+        except json.JSONDecodeError:
+            logger.debug(f"Skipping unparseable streamed scene: {raw[:80]}")
+            return
+        if isinstance(scene, dict):
+            scene = scene.get('description') or json.dumps(scene)
+        completed.append((self.count, str(scene)))
+        self.count += 1
+
+class ContentStreamDecoder:
+    """
+    Incremental decoder of the top-level "content" string of a streamed story.
+
+    feed() returns the newly arrived part of the story text, with JSON escapes
+    decoded, so progress listeners see prose rather than raw model output. An
+    escape split across chunks is held back until it is complete.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.last_key = None
+        self.after_colon = False
+        self.in_content = False
+
+    def feed(self, text):
+        """Add a chunk of model output; returns the decoded story text it completed ('' if none)"""
+        self.buffer += text
+        buf = self.buffer
+        decoded = []
+        i = self.pos
+        while i < len(buf):
+            c = buf[i]
+            if self.in_content:
+                end = i
+                while end < len(buf) and buf[end] not in '"\\':
+                    end += 1
+                if end > i:
+                    decoded.append(buf[i:end])
+                if end == len(buf):
+                    i = end
+                    break
+                if buf[end] == '"':
+                    self.in_content = False
+                    i = end + 1
+                    continue
+                # Escape: decode it once all of it has arrived (both halves of a surrogate pair)
+                length = 2
+                if buf[end + 1:end + 2] == 'u':
+                    length = 6
+                    if end + 6 <= len(buf) and buf[end + 2:end + 4].lower() in ('d8', 'd9', 'da', 'db'):
+                        length = 12
+                if end + length > len(buf):
+                    i = end
+                    break
+                try:
+                    decoded.append(json.loads(f'"{buf[end:end + length]}"'))
+                except json.JSONDecodeError:
+                    pass
+                i = end + length
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == '\\':
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_key = buf[self.string_start + 1:i]
+            elif c == '"':
+                if self.depth == 1 and self.after_colon and self.last_key == 'content':
+                    self.in_content = True
+                else:
+                    self.in_string = True
+                    self.string_start = i
+                self.after_colon = False
+            elif c == ':':
+                self.after_colon = True
+            elif c in '{[':
+                self.depth += 1
+                self.after_colon = False
+            elif c in '}]':
+                self.depth -= 1
+            elif not c.isspace():
+                self.after_colon = False
+            i += 1
+        self.pos = i
+        return ''.join(decoded)
+
+def _stream_response_text(prompt_text, generation_config, on_scene=None, on_text=None):
+    """
+    Stream a Gemini response, passing the story text as it is decoded to
+    on_text and each completed scene to on_scene; returns the full raw text
+    """
+    parser = SceneStreamParser()
+    content = ContentStreamDecoder()
+    parts = []
+    for chunk in get_text_provider().generate_content(prompt_text, generation_config=generation_config, stream=True):
+        text = chunk.text
+        parts.append(text)
+        if on_text is not None:
+            story_text = content.feed(text)
+            try:
+                if story_text:
+                    on_text(story_text)
+            except Exception as e:
+                logger.warning(f"Text callback failed: {e}")
+        if on_scene is None:
+            continue
+        for index, scene in parser.feed(text):
+            logger.debug(f"Scene {index + 1} streamed: {scene[:80]}")
+            try:
+                on_scene(index, scene)
+            except Exception as e:
+                logger.warning(f"Scene callback failed for scene {index + 1}: {e}")
+    return ''.join(parts)
+
+def generate_vedic_story(prompt, on_scene=None, on_text=None, on_attempt=None):
     """
     Generate a Vedic mythology story using Google's Gemini AI model.
 
     This function implements a robust story generation pipeline with:
-    - Retry logic for handling API failures
+    - Retries with exponential backoff behind a circuit breaker (see resilience.py)
     - Optimized prompts for faster, more accurate responses
     - Comprehensive error handling for different failure types
     - JSON parsing with fallback error responses
 
     Args:
         prompt (str): User-provided prompt describing the desired story
+        on_scene (callable): Optional on_scene(index, scene) callback. When given and
+                             STREAM_STORY_TEXT is enabled, the response is streamed and
+                             each scene is passed on as soon as it has been parsed,
+                             before the rest of the story arrives
+        on_text (callable): Optional on_text(text) callback receiving the story
+                            content (decoded, without the surrounding JSON) as it
+                            streams in (same STREAM_STORY_TEXT condition)
+        on_attempt (callable): Optional on_attempt(number) callback invoked before
+                               each request, so listeners can discard what a
+                               failed attempt streamed
 
     Returns:
         dict: Story data containing title, content, scenes, characters, moral, and sources
               Or error dict with 'error' key and 'type' field for error classification
     """
-    # Retry up to 2 times to handle transient API failures
-    for attempt in range(2):
+    # Optimized system prompt for Vedic storytelling - concise yet comprehensive
+    # Scenes come before the content so their images are fetched while the story is still being written
+    system_prompt = (
+        "You are a Vedic storyteller. Create authentic Hindu mythology stories with:\n"
+        "- Characters and events from Vedas, Puranas, Ramayana, Mahabharata\n"
+        "- Sanskrit terms with translations\n"
+        "- Spiritual insights and morals\n"
+        "- EXACTLY 4 detailed scene descriptions for images (no more, no less)\n\n"
+        "Return JSON, with its keys in this order:\n"
+        "{\n"
+        '  "title": "Story Title",\n'
+        '  "scenes": ["Scene 1 description", "Scene 2", "Scene 3", "Scene 4"],\n'
+        '  "content": "Full story...",\n'
+        '  "characters": ["Char1", "Char2"],\n'
+        '  "moral": "Lesson",\n'
+        '  "sources": ["Reference"]\n'
+        "}\n\n"
+        "CRITICAL: You MUST provide exactly 4 scenes in the scenes array. Each scene should be vivid and detailed for AI image generation with traditional Indian art style."
+    )
+
+    # Generate the story with optimized settings
+    prompt_text = f"{system_prompt}\n\nCreate a Vedic story about: {prompt}"
+    generation_config = {
+        'temperature': 0.7,  # Balanced creativity
+        'max_output_tokens': 2048,  # Limit output size
+    }
+    attempts = []
+
+    def request_story():
+        attempts.append(time.perf_counter())
+        logger.info(f"Generating story for prompt: {prompt} (Attempt {len(attempts)})")
+        if on_attempt is not None:
+            try:
+                on_attempt(len(attempts))
+            except Exception as e:
+                logger.warning(f"Attempt callback failed: {e}")
         try:
-            logger.info(f"Generating story for prompt: {prompt} (Attempt {attempt + 1})")
-
-            # Optimized system prompt for Vedic storytelling - concise yet comprehensive
-            # Using f-string for better performance and readability
-            system_prompt = (
-                "You are a Vedic storyteller. Create authentic Hindu mythology stories with:\n"
-                "- Characters and events from Vedas, Puranas, Ramayana, Mahabharata\n"
-                "- Sanskrit terms with translations\n"
-                "- Spiritual insights and morals\n"
-                "- EXACTLY 4 detailed scene descriptions for images (no more, no less)\n\n"
-                "Return JSON:\n"
-                "{\n"
-                '  "title": "Story Title",\n'
-                '  "content": "Full story...",\n'
-                '  "scenes": ["Scene 1 description", "Scene 2", "Scene 3", "Scene 4"],\n'
-                '  "characters": ["Char1", "Char2"],\n'
-                '  "moral": "Lesson",\n'
-                '  "sources": ["Reference"]\n'
-                "}\n\n"
-                "CRITICAL: You MUST provide exactly 4 scenes in the scenes array. Each scene should be vivid and detailed for AI image generation with traditional Indian art style."
-            )
-
-            # Generate the story with optimized settings
-            response = model.generate_content(
-                f"{system_prompt}\n\nCreate a Vedic story about: {prompt}",
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.7,  # Balanced creativity
-                    max_output_tokens=2048,  # Limit output size
-                )
-            )
-
-            # Extract and clean the JSON response from Gemini
-            content = response.text.strip()
-            logger.debug(f"Raw response from Gemini: {content}")
-
-            # Handle different markdown code block formats that Gemini might return
-            if '```json' in content:
-                content = content.split('```json')[1].split('```')[0].strip()
-            elif '```' in content:
-                content = content.split('```')[1].split('```')[0].strip()
-
-            # Parse the cleaned JSON response
-            story_data = json.loads(content)
-            logger.info(f"Successfully generated story: {story_data.get('title', 'Untitled')}")
-            return story_data
+            if (on_scene is not None or on_text is not None) and STREAM_STORY_TEXT:
+                content = _stream_response_text(prompt_text, generation_config, on_scene, on_text)
+            else:
+                response = get_text_provider().generate_content(prompt_text, generation_config=generation_config)
+                content = response.text
+        except Exception:
+            PROVIDER_REQUEST_DURATION.observe(time.perf_counter() - attempts[-1], provider='text', outcome='error')
+            raise
+        PROVIDER_REQUEST_DURATION.observe(time.perf_counter() - attempts[-1], provider='text', outcome='ok')
+
+        # Extract and clean the JSON response from Gemini
+        content = content.strip()
+        logger.debug(f"Raw response from Gemini: {content}")
 
+        # Handle different markdown code block formats that Gemini might return
+        if '```json' in content:
+            content = content.split('```json')[1].split('```')[0].strip()
+        elif '```' in content:
+            content = content.split('```')[1].split('```')[0].strip()
+
+        # Parse the cleaned JSON response
+        try:
+            return json.loads(content)
         except json.JSONDecodeError as e:
             # Handle malformed JSON responses from the AI
-            logger.error(f"Failed to parse JSON response on attempt {attempt + 1}: {e}")
+            logger.error(f"Failed to parse JSON response on attempt {len(attempts)}: {e}")
             logger.error(f"Response content: {content}")
-            if attempt < 1:  # Allow retry for first attempt only
-                logger.info("Retrying due to JSON parsing error...")
-                continue
-            else:
-                return {"error": "Failed to parse story response from AI", "type": "json_error"}
-        except Exception as e:
-            error_str = str(e)
-            logger.error(f"Story generation failed on attempt {attempt + 1}: {error_str}", exc_info=True)
-
-            # Check for specific error types
-            if "429" in error_str or "quota" in error_str.lower() or "exceeded" in error_str.lower():
-                logger.error("Gemini API quota exceeded")
-                return {"error": "AI service quota exceeded. Please try again later or contact support.", "type": "quota_exceeded"}
-            elif "403" in error_str or "permission" in error_str.lower():
-                logger.error("Gemini API permission denied")
-                return {"error": "AI service access denied. Please check API configuration.", "type": "permission_denied"}
-            elif "timeout" in error_str.lower() or "deadline" in error_str.lower():
-                logger.error("Gemini API timeout")
-                if attempt < 1:  # Updated for 2 attempts
-                    logger.info("Retrying due to timeout...")
-                    continue
-                else:
-                    return {"error": "AI service timeout. Please try again.", "type": "timeout"}
-            else:
-                if attempt < 1:  # Updated for 2 attempts
-                    logger.info("Retrying due to unknown error...")
-                    continue
-                else:
-                    return {"error": f"AI service error: {error_str}", "type": "unknown_error"}
+            raise
+
+    try:
+        # Malformed JSON, timeouts and unknown errors are retried with backoff;
+        # quota and permission errors are not, but they count towards the circuit breaker;
+        # a timed-out wait for our own rate limiter is neither retried nor counted
+        story_data = call_with_retry(request_story, provider='text', attempts=TEXT_MAX_ATTEMPTS,
+                                     retry_on=('json_error', 'timeout', 'unknown_error'))
+        logger.info(f"Successfully generated story: {story_data.get('title', 'Untitled')}")
+        return story_data
+
+    except Exception as e:
+        error_str = str(e)
+        error_type = classify_error(e)
+        PROVIDER_FAILURES.inc(provider='text', error_type=error_type)
+        logger.error(f"Story generation failed after {len(attempts)} attempt(s): {error_str}",
+                     exc_info=error_type not in ('json_error', 'circuit_open'))
 
-    # All attempts failed
-    return {"error": "Failed to generate story after multiple attempts. Please try again later.", "type": "max_retries_exceeded"}
\ No newline at end of file
+        # Check for specific error types
+        if error_type == 'json_error':
+            return {"error": "Failed to parse story response from AI", "type": "json_error"}
+        elif error_type == 'circuit_open':
+            logger.error("Gemini circuit open, not calling the API")
+            return {"error": "AI service is temporarily unavailable after repeated failures. Please try again in a minute.", "type": "circuit_open"}
+        elif error_type == 'rate_limited':
+            return {"error": "AI service is busy. Please try again in a minute.", "type": "rate_limited"}
+        elif error_type == 'quota_exceeded':
+            logger.error("Gemini API quota exceeded")
+            return {"error": "AI service quota exceeded. Please try again later or contact support.", "type": "quota_exceeded"}
+        elif error_type == 'permission_denied':
+            logger.error("Gemini API permission denied")
+            return {"error": "AI service access denied. Please check API configuration.", "type": "permission_denied"}
+        elif error_type == 'timeout':
+            logger.error("Gemini API timeout")
+            return {"error": "AI service timeout. Please try again.", "type": "timeout"}
+        else:
+            return {"error": f"AI service error: {error_str}", "type": "unknown_error"}
\ No newline at end of file
@@ -2,54 +2,225 @@
 Story Service - Handles the complete story generation workflow
 """
 
+import os
 import json
+import time
+import base64
 import logging
+import threading
+from datetime import datetime
+from concurrent.futures import Future
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import defer, undefer
 from database import db
-from models import Story
+from models import Story, PromptFlight
 from vedic_story_generator import generate_vedic_story, generate_story_images
 from audio_generator import generate_audio_narration
+from image_generator import StoryImageBatch
 from video_generator import generate_story_video_from_paths
+import render_farm
+from image_variants import generate_story_variants, variant_file_paths
+from pipeline import Stage, run_stage_graph
+import single_flight
+from prompt_cache import prompt_cache_key, lookup_story
+from metrics import STAGE_DURATION, STAGE_OUTCOMES, CACHE_LOOKUPS
+import media_store
 
 logger = logging.getLogger(__name__)
 
-def create_story_from_prompt(prompt):
+# Pipeline stages reported to progress callbacks, in execution order
+PIPELINE_STAGES = ('text', 'images', 'audio', 'video')
+
+# 'eager' renders each story's video while the story is created; 'lazy' renders it
+# the first time the video is requested, taking the costliest stage off story creation
+VIDEO_POLICY = os.environ.get('VIDEO_POLICY', 'eager').lower()
+# Longest a request waits for a video that another worker process is rendering
+VIDEO_WAIT_TIMEOUT = float(os.environ.get('VIDEO_WAIT_TIMEOUT', 600))
+
+# Process-wide observers of every story's stage updates (benchmarks, metrics)
+_progress_listeners = []
+
+def add_progress_listener(listener):
+    """Register listener(stage, status, **detail) to receive stage updates of every story"""
+    _progress_listeners.append(listener)
+
+def _report(progress, stage, status, **detail):
+    """Forward a stage update to the progress callback, never letting it break the pipeline"""
+    for callback in [progress] + _progress_listeners:
+        if callback is None:
+            continue
+        try:
+            callback(stage, status, **detail)
+        except Exception as e:
+            logger.warning(f"Progress callback failed for stage {stage}: {e}")
+
+# Keyword used to pass each media stage's result to progress callbacks
+STAGE_DETAIL_KEYS = {'images': 'images', 'audio': 'audio_path', 'video': 'video_path'}
+
+def build_media_stages(story_data, story_id, image_batch=None, on_image=None, include_video=True):
+    """
+    Describe the media part of the pipeline as a stage graph.
+
+    Images and audio only need the story text, so they have no requirements;
+    video needs both and is skipped when either produced nothing. When an
+    image_batch was fed scenes while the text streamed in, the images stage
+    only has to collect its results. Without include_video the video is left
+    to ensure_story_video().
+    """
+    def images_stage():
+        if image_batch is not None:
+            image_paths = image_batch.finish(story_data, story_id, on_image=on_image)
+        else:
+            image_paths = generate_story_images(story_data, story_id)
+        if not image_paths:
+            raise RuntimeError("No images were generated")
+        logger.info(f"Generated {len(image_paths)} images for story {story_id}")
+        # Card and grid sized WebP/AVIF variants, not waited for so the video can start;
+        # pages show the PNGs until they exist
+        try:
+            render_farm.farm.submit('images', generate_story_variants, image_paths)
+        except render_farm.RenderError as e:
+            logger.warning(f"Image variants for story {story_id} were not created: {e}")
+        return image_paths
+
+    def audio_stage():
+        audio_path = generate_audio_narration(story_data['content'], story_id)
+        if not audio_path:
+            raise RuntimeError("No audio narration was generated")
+        logger.info(f"Generated audio narration for story {story_id}")
+        return audio_path
+
+    def video_stage(images, audio):
+        # Use all images for the video sequence, rendered off the request threads by the render farm
+        video_path = render_farm.farm.render(
+            'video',
+            generate_story_video_from_paths,
+            images,
+            audio,
+            story_data['title'],
+            story_data['content'],
+            story_id
+        )
+        if not video_path:
+            raise RuntimeError("Video rendering produced no file")
+        logger.info(f"Generated video sequence for story {story_id}: {video_path}")
+        return video_path
+
+    stages = [
+        Stage('images', images_stage),
+        Stage('audio', audio_stage),
+    ]
+    if include_video:
+        stages.append(Stage('video', video_stage, requires=('images', 'audio')))
+    return stages
+
+def create_story_from_prompt(prompt, progress=None):
     """
     Complete story creation workflow:
-    1. Check cache for existing story
-    2. Generate story content if not cached
-    3. Create database record
-    4. Generate images
-    5. Generate audio
-    6. Generate video
+    1. Check cache for existing story (canonical prompt key, optionally near-duplicates)
+    2. Wait for an identical prompt already being generated elsewhere (single flight)
+    3. Generate story content if not cached, starting image fetches as scenes stream in
+    4. Create database record
+    5. Generate images and audio in parallel
+    6. Generate video once both are ready (with VIDEO_POLICY 'lazy', only its
+       path is recorded and the video is rendered on first request)
     7. Update database record
 
+    If given, progress(stage, status, **detail) is called as each stage of
+    PIPELINE_STAGES moves through 'running' and then 'completed', 'failed' or 'skipped'
+    ('deferred' for a lazy video).
+    Incremental output is reported with status 'partial': streamed text chunks
+    (stage 'text', detail text=...) and single images as they land (stage 'images',
+    detail index=..., path=...). Partial updates may arrive from worker threads.
+
     Returns: (story, error_message)
     """
     try:
         logger.info(f"Starting story creation for prompt: {prompt}")
 
-        # Step 1: Check for existing story with same prompt (caching)
-        import hashlib
-        prompt_hash = hashlib.md5(prompt.strip().lower().encode()).hexdigest()
-        existing_story = Story.query.filter_by(prompt_hash=prompt_hash).first()
+        # Canonical key, so trivially different prompts share cached stories
+        prompt_hash = prompt_cache_key(prompt)
 
+        while True:
+            # Step 1: Serve a finished story straight from the cache. A story whose
+            # generation is still in flight is incomplete, so only followers see it.
+            if not single_flight.is_in_flight(prompt_hash):
+                existing_story, match = lookup_story(prompt)
+                if existing_story:
+                    logger.info(f"Found cached story with ID: {existing_story.id} ({match} match)")
+                    CACHE_LOOKUPS.inc(result=match)
+                    for stage in PIPELINE_STAGES:
+                        _report(progress, stage, 'completed', cached=True)
+                    return existing_story, None
+
+            # Step 2: Become the leader, or wait for the current leader's result
+            if single_flight.acquire(prompt_hash):
+                break
+            story, error_message, retry = single_flight.wait_for_leader(prompt_hash)
+            if not retry:
+                if story:
+                    CACHE_LOOKUPS.inc(result='coalesced')
+                    for stage in PIPELINE_STAGES:
+                        _report(progress, stage, 'completed', coalesced=True)
+                return story, error_message
+
+    except Exception as e:
+        logger.error(f"Story creation error: {e}")
+        db.session.rollback()
+        return None, f"An error occurred while generating the story: {str(e)}"
+
+    story, error_message = None, None
+    try:
+        story, error_message = _generate_story(prompt, prompt_hash, progress)
+        return story, error_message
+    finally:
+        single_flight.release(prompt_hash, None if story else (error_message or "Story generation failed"))
+
+def _generate_story(prompt, prompt_hash, progress=None):
+    """Run the generation pipeline while holding the single-flight lease for prompt_hash"""
+    try:
+        # Another leader may have finished between our cache check and acquiring the lease
+        existing_story = Story.query.filter_by(prompt_hash=prompt_hash).first()
         if existing_story:
             logger.info(f"Found cached story with ID: {existing_story.id}")
+            CACHE_LOOKUPS.inc(result='exact')
+            for stage in PIPELINE_STAGES:
+                _report(progress, stage, 'completed', cached=True)
             return existing_story, None
 
-        # Step 2: Generate the story content
-        story_data = generate_vedic_story(prompt)
+        # Step 2: Generate the story content, fetching scene images as they stream in
+        CACHE_LOOKUPS.inc(result='miss')
+        _report(progress, 'text', 'running')
+        image_batch = StoryImageBatch()
+        text_started = time.perf_counter()
+        listening = progress or _progress_listeners
+        story_data = generate_vedic_story(
+            prompt,
+            on_scene=image_batch.add_scene,
+            on_text=(lambda text: _report(progress, 'text', 'partial', text=text)) if listening else None,
+            # Each (re)try streams the story from the start, so listeners drop the previous attempt's text
+            on_attempt=(lambda number: _report(progress, 'text', 'partial', attempt=number)) if listening else None
+        )
+        STAGE_DURATION.observe(time.perf_counter() - text_started, stage='text')
         if not story_data:
+            image_batch.cancel()
+            STAGE_OUTCOMES.inc(stage='text', status='failed')
+            _report(progress, 'text', 'failed')
             return None, "Failed to generate story"
 
         # Check if story_data contains an error
         if isinstance(story_data, dict) and 'error' in story_data:
+            image_batch.cancel()
+            STAGE_OUTCOMES.inc(stage='text', status='failed')
+            _report(progress, 'text', 'failed', error_type=story_data.get('type', 'unknown'))
             error_type = story_data.get('type', 'unknown')
             error_message = story_data['error']
 
             # Provide specific error messages based on error type
             if error_type == 'quota_exceeded':
                 return None, 'AI Service Quota Exceeded: The AI service has reached its daily limit. Please try again tomorrow or upgrade your plan.'
+            elif error_type == 'rate_limited':
+                return None, 'AI Service Busy: Too many stories are being generated right now. Please try again in a minute.'
             elif error_type == 'permission_denied':
                 return None, 'AI Service Access Denied: There\'s an issue with the AI service configuration. Please contact support.'
             elif error_type == 'timeout':
@@ -57,6 +228,16 @@ def create_story_from_prompt(prompt):
             else:
                 return None, f'AI Service Error: {error_message}'
 
+        # A leader that lost its lease may have been overtaken; keep one story per prompt
+        existing_story = Story.query.filter_by(prompt_hash=prompt_hash).first()
+        if existing_story:
+            image_batch.cancel()
+            logger.warning(f"Story {existing_story.id} for this prompt was created meanwhile; using it")
+            CACHE_LOOKUPS.inc(result='coalesced')
+            for stage in PIPELINE_STAGES:
+                _report(progress, stage, 'completed', coalesced=True)
+            return existing_story, None
+
         # Step 3: Create new story record
         story = Story()
         story.title = story_data['title']
@@ -69,44 +250,47 @@ def create_story_from_prompt(prompt):
         db.session.add(story)
         db.session.commit()
         logger.info(f"Created story record with ID: {story.id}")
+        STAGE_OUTCOMES.inc(stage='text', status='completed')
+        _report(progress, 'text', 'completed', story_id=story.id)
 
-        # Step 3: Generate images for the story
-        try:
-            image_paths = generate_story_images(story_data, story.id)
-            story.set_images(image_paths)
-            logger.info(f"Generated {len(image_paths)} images for story {story.id}")
-        except Exception as e:
-            logger.error(f"Image generation failed: {e}")
-            story.set_images([])
+        # Steps 3-5: Images and audio run in parallel, video starts once both are ready
+        def on_stage_event(name, status, stage_result):
+            detail = {}
+            if stage_result is not None:
+                STAGE_OUTCOMES.inc(stage=name, status=status)
+                if status != 'skipped':
+                    STAGE_DURATION.observe(stage_result.duration, stage=name)
+                if status == 'completed':
+                    detail = {STAGE_DETAIL_KEYS[name]: stage_result.result}
+            _report(progress, name, status, **detail)
 
-        # Step 4: Generate audio narration
-        try:
-            audio_path = generate_audio_narration(story_data['content'], story.id)
-            story.audio_path = audio_path
-            logger.info(f"Generated audio narration for story {story.id}")
-        except Exception as e:
-            logger.error(f"Audio generation failed: {e}")
-            story.audio_path = None
-
-        # Step 5: Generate video if we have both image and audio
-        if image_paths and audio_path:
-            try:
-                # Use all images for the video sequence
-                video_path = generate_story_video_from_paths(
-                    image_paths,  # Pass all image paths
-                    audio_path,
-                    story_data['title'],
-                    story_data['content'],
-                    story.id
-                )
-                story.video_path = video_path
-                logger.info(f"Generated video sequence for story {story.id}: {video_path}")
-            except Exception as e:
-                logger.error(f"Video generation failed: {e}")
-                story.video_path = None
+        def on_image(index, path):
+            _report(progress, 'images', 'partial', index=index, path=path)
+
+        lazy_video = VIDEO_POLICY == 'lazy'
+        stage_results = run_stage_graph(build_media_stages(story_data, story.id, image_batch, on_image,
+                                                           include_video=not lazy_video),
+                                        on_event=on_stage_event)
+
+        image_paths = stage_results['images'].result or []
+        story.set_images(image_paths)
+        story.audio_path = stage_results['audio'].result
+        if lazy_video:
+            if image_paths and story.audio_path:
+                # Rendered by ensure_story_video() when this path is first requested
+                story.video_path = story_video_path(story.id)
+                STAGE_OUTCOMES.inc(stage='video', status='deferred')
+                _report(progress, 'video', 'deferred', video_path=story.video_path)
+            else:
+                STAGE_OUTCOMES.inc(stage='video', status='skipped')
+                _report(progress, 'video', 'skipped')
+                logger.info(f"No video for story {story.id} - missing image or audio")
         else:
-            logger.info(f"No video generated for story {story.id} - missing image or audio")
-            story.video_path = None
+            story.video_path = stage_results['video'].result
+            if stage_results['video'].status == 'skipped':
+                logger.info(f"No video generated for story {story.id} - missing image or audio")
+        logger.info(f"Media stages for story {story.id}: "
+                    f"{[r.to_dict() for r in stage_results.values()]}")
 
         # Step 6: Save all updates
         db.session.commit()
@@ -119,9 +303,105 @@ def create_story_from_prompt(prompt):
         db.session.rollback()
         return None, f"An error occurred while generating the story: {str(e)}"
 
+def story_video_path(story_id):
+    """Web path of a story's video, whether or not it has been rendered yet"""
+    return f"/static/videos/story_{story_id}_video.mp4"
+
+# Renders started by this process, story id -> Future shared by every waiting request
+_video_renders = {}
+_video_renders_lock = threading.Lock()
+
+def ensure_story_video(story):
+    """
+    Return the web path of the story's video, rendering it first if it does not exist.
+
+    Concurrent requests for one story share a single render: threads of this
+    process wait on the same future, and other worker processes wait on a
+    single-flight lease for the video. The rendered file is the cache.
+
+    Returns:
+        str: Web path of the video, or None if the story has no images or narration
+
+    Raises:
+        render_farm.RenderError: The render failed, timed out or could not be queued
+    """
+    video_path = story_video_path(story.id)
+    if os.path.exists(video_path.lstrip('/')):
+        return video_path
+    if not story.get_images() or not story.audio_path:
+        return None
+
+    with _video_renders_lock:
+        future = _video_renders.get(story.id)
+        leader = future is None
+        if leader:
+            future = Future()
+            _video_renders[story.id] = future
+    if not leader:
+        logger.info(f"Waiting for in-progress video render of story {story.id}")
+        return future.result()
+
+    try:
+        future.set_result(_render_story_video(story))
+    except Exception as e:
+        future.set_exception(e)
+    finally:
+        with _video_renders_lock:
+            _video_renders.pop(story.id, None)
+    return future.result()
+
+def _render_story_video(story):
+    lease = f"video:{story.id}"
+    if not single_flight.acquire(lease):
+        return _wait_for_video_render(story.id, lease)
+
+    error_message = None
+    try:
+        logger.info(f"Rendering video for story {story.id} on demand")
+        video_path = render_farm.farm.render(
+            'video',
+            generate_story_video_from_paths,
+            story.get_images(),
+            story.audio_path,
+            story.title,
+            story.content,
+            story.id
+        )
+        if not video_path:
+            raise render_farm.RenderError("Video rendering produced no file")
+        return video_path
+    except Exception as e:
+        error_message = str(e)
+        raise
+    finally:
+        single_flight.release(lease, error_message)
+
+def _wait_for_video_render(story_id, lease):
+    """Wait for another worker process to finish rendering the video"""
+    deadline = time.monotonic() + VIDEO_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        db.session.expire_all()
+        flight = db.session.get(PromptFlight, lease)
+        if flight is None or flight.expires_at <= datetime.utcnow():
+            break
+        if flight.status == 'failed':
+            raise render_farm.RenderError(flight.error or "Video rendering failed")
+        # End the read transaction so the next poll sees fresh data
+        db.session.rollback()
+        time.sleep(single_flight.POLL_INTERVAL)
+    video_path = story_video_path(story_id)
+    if os.path.exists(video_path.lstrip('/')):
+        return video_path
+    raise render_farm.RenderError("Video is still being rendered. Please try again shortly.")
+
 def delete_story_files(story):
     """
     Delete all associated files for a story
+
+    Narration and scene images are links into the media store, so removing them
+    only drops this story's reference. Blobs other stories still use are left
+    alone; blobs nobody uses any more stay cached until evicted by the store's
+    LRU size budget.
     """
     import os
 
@@ -138,6 +418,9 @@ def delete_story_files(story):
         if os.path.exists(image_file_path):
             os.remove(image_file_path)
             logger.info(f"Deleted image file: {image_file_path}")
+        for variant_file_path in variant_file_paths(image_path):
+            if os.path.exists(variant_file_path):
+                os.remove(variant_file_path)
 
     # Delete video file
     if story.video_path:
@@ -146,6 +429,8 @@ def delete_story_files(story):
             os.remove(video_file_path)
             logger.info(f"Deleted video file: {video_file_path}")
 
+    media_store.enforce_budget()
+
 def create_story_download_text(story):
     """
     Create downloadable text file content for a story
@@ -176,4 +461,56 @@ def create_story_download_text(story):
         f.write("\n" + "="*50 + "\n\n")
         f.write(story.content)
 
-    return filepath, filename
\ No newline at end of file
+    return filepath, filename
+
+# Page size limits for story listings
+STORIES_PAGE_SIZE = int(os.environ.get('STORIES_PAGE_SIZE', 24))
+STORIES_MAX_PAGE_SIZE = int(os.environ.get('STORIES_MAX_PAGE_SIZE', 100))
+
+def encode_story_cursor(story):
+    """Opaque cursor pointing just after story in (created_at, id) descending order"""
+    raw = f"{story.created_at.isoformat()}|{story.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_story_cursor(cursor):
+    """Inverse of encode_story_cursor; raises ValueError for malformed cursors"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, story_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(story_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def list_stories(cursor=None, limit=None):
+    """
+    Fetch one page of stories, newest first, using keyset pagination.
+
+    Rows are loaded without the full content text; content_preview and
+    content_length are selected instead for excerpts.
+
+    Args:
+        cursor (str): Cursor returned with the previous page, or None for the first page
+        limit (int): Page size, clamped to 1..STORIES_MAX_PAGE_SIZE
+
+    Returns:
+        (list, str): Stories on this page and the cursor for the next one (None on the last page)
+    """
+    limit = max(1, min(limit or STORIES_PAGE_SIZE, STORIES_MAX_PAGE_SIZE))
+
+    query = Story.query.options(
+        defer(Story.content),
+        undefer(Story.content_preview),
+        undefer(Story.content_length)
+    )
+
+    if cursor:
+        created_at, story_id = decode_story_cursor(cursor)
+        query = query.filter(or_(
+            Story.created_at < created_at,
+            and_(Story.created_at == created_at, Story.id < story_id)
+        ))
+
+    # Fetch one extra row to learn whether another page exists
+    stories = query.order_by(Story.created_at.desc(), Story.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_story_cursor(stories[limit - 1]) if len(stories) > limit else None
+    return stories[:limit], next_cursor
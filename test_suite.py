@@ -76,7 +76,7 @@ def test_api_endpoints(port=8000):
         response = requests.get(f"http://localhost:{port}/api/stories", timeout=5)
         if response.status_code == 200:
             data = response.json()
-            print(f"✅ Stories API working (found {len(data)} stories)")
+            print(f"✅ Stories API working (found {len(data['stories'])} stories on first page)")
             return True
         else:
             print(f"❌ Stories API failed (status {response.status_code})")
@@ -125,6 +125,33 @@ def test_story_generation(port=8000):
         print(f"❌ Story generation test failed: {e}")
         return False, None
 
+def test_async_job(port=8000):
+    """Test async job mode returns a job id that can be polled"""
+    print("⏳ Testing async story generation job...")
+    try:
+        response = requests.post(
+            f"http://localhost:{port}/generate_story",
+            json={"prompt": "Tell me a short story about Hanuman", "async": True},
+            timeout=5  # Job mode must answer immediately
+        )
+        if response.status_code != 202:
+            print(f"❌ Job submission failed (status {response.status_code})")
+            return False
+
+        job_id = response.json()["job_id"]
+        print(f"   🆔 Job ID: {job_id}")
+
+        status = requests.get(f"http://localhost:{port}/api/jobs/{job_id}", timeout=5)
+        if status.status_code == 200:
+            print(f"✅ Job status endpoint working (status: {status.json()['status']})")
+            return True
+        else:
+            print(f"❌ Job status endpoint failed (status {status.status_code})")
+            return False
+    except Exception as e:
+        print(f"❌ Async job test failed: {e}")
+        return False
+
 def test_story_page(story_id, port=8000):
     """Test individual story page"""
     if not story_id:
@@ -198,6 +225,620 @@ def test_video_generation():
     print("✅ Video generation components available")
     return True
 
+# UNIT TESTS - exercise modules directly; no server, network or API keys needed
+
+def _unit_app():
+    """The Flask app, on the scratch database run_unit_tests() points it at"""
+    from app import initialize_app
+    return initialize_app()
+
+def test_stage_graph():
+    """Test stages run after their requirements and failures skip their dependents"""
+    print("🕸️ Testing pipeline stage graph...")
+    try:
+        from pipeline import Stage, run_stage_graph
+
+        order = []
+        def record(name, value=None):
+            def func(**kwargs):
+                order.append(name)
+                return value if value is not None else sorted(kwargs)
+            return func
+        def fail(**kwargs):
+            raise RuntimeError("stage broke")
+
+        results = run_stage_graph([
+            Stage('video', record('video'), requires=('images', 'audio')),
+            Stage('images', record('images', ['a.png'])),
+            Stage('audio', record('audio', 'a.mp3'), requires=('text',)),
+            Stage('text', record('text', 'story')),
+        ])
+        assert order.index('video') > max(order.index('images'), order.index('audio')), order
+        assert order.index('audio') > order.index('text'), order
+        assert results['video'].result == ['audio', 'images'], results['video'].result
+
+        events = []
+        results = run_stage_graph([
+            Stage('text', record('text', 'story')),
+            Stage('audio', fail, requires=('text',)),
+            Stage('images', record('images', ['a.png']), requires=('text',)),
+            Stage('video', record('video'), requires=('images', 'audio')),
+            Stage('upload', record('upload'), requires=('video',)),
+        ], on_event=lambda name, status, result: events.append((name, status)))
+        assert results['audio'].status == 'failed' and 'stage broke' in str(results['audio'].error)
+        assert results['images'].status == 'completed'
+        assert results['video'].status == 'skipped' and results['upload'].status == 'skipped'
+        assert ('video', 'running') not in events and ('upload', 'skipped') in events
+
+        try:
+            run_stage_graph([Stage('a', record('a'), requires=('b',)), Stage('b', record('b'), requires=('a',))])
+            raise AssertionError("cycle was not detected")
+        except ValueError:
+            pass
+
+        print("✅ Stages run in dependency order and failures skip dependents")
+        return True
+    except Exception as e:
+        print(f"❌ Stage graph test failed: {e!r}")
+        return False
+
+def test_scene_stream_parser():
+    """Test scenes are parsed from arbitrarily split chunks, including escaped quotes"""
+    print("📜 Testing streamed scene parser...")
+    try:
+        from story_generator import SceneStreamParser
+
+        scenes = ['Hanuman says "Jai Shri Ram" \\ and leaps', 'Sita in the {Ashoka} grove [night]',
+                  {'description': 'Rama\'s "ring"'}]
+        document = '```json\n' + json.dumps({'title': 'T "quoted"', 'scenes': scenes, 'content': '"scenes": ["x"]'})
+        expected = [scenes[0], scenes[1], scenes[2]['description']]
+
+        for size in (1, 2, 3, 7, len(document)):
+            parser = SceneStreamParser()
+            found = []
+            for start in range(0, len(document), size):
+                found.extend(parser.feed(document[start:start + size]))
+            assert found == list(enumerate(expected)), (size, found)
+
+        # Each scene is emitted as soon as it is complete, before the rest of the document
+        parser = SceneStreamParser()
+        assert parser.feed('{"scenes": ["one", "tw') == [(0, 'one')]
+        assert parser.feed('o"') == [(1, 'two')]
+
+        print("✅ Scenes parsed from split chunks with escapes intact")
+        return True
+    except Exception as e:
+        print(f"❌ Scene stream parser test failed: {e!r}")
+        return False
+
+def test_image_batch_retry():
+    """Test a retried response's scenes replace the image fetches of the discarded attempt"""
+    print("🔁 Testing image batch scene replacement...")
+    try:
+        import image_generator
+
+        fetched = []
+        original = image_generator.fetch_scene_blob
+        image_generator.fetch_scene_blob = lambda scene, style, deadline: fetched.append(scene)
+        try:
+            batch = image_generator.StoryImageBatch()
+            batch.add_scene(0, 'first attempt scene')
+            batch.add_scene(0, 'first attempt scene')
+            batch.add_scene(0, 'retried scene')
+            batch.add_scene(7, 'beyond the last slot')
+            for future in batch.futures.values():
+                future.result(timeout=5)
+        finally:
+            image_generator.fetch_scene_blob = original
+
+        assert batch.scenes == {0: 'retried scene'}, batch.scenes
+        assert fetched.count('first attempt scene') <= 1 and 'retried scene' in fetched, fetched
+        print("✅ Retried scenes replace stale fetches")
+        return True
+    except Exception as e:
+        print(f"❌ Image batch test failed: {e!r}")
+        return False
+
+def test_content_stream_decoder():
+    """Test only the decoded story content is streamed, whatever the chunk boundaries"""
+    print("📝 Testing streamed story text decoder...")
+    try:
+        from story_generator import ContentStreamDecoder
+
+        content = 'Rama said "go"\\ to Hanumān 🐒\nand {he} leapt: [far]'
+        document = '```json\n' + json.dumps({'title': 'The "content" of it', 'scenes': ['content', 'x'],
+                                             'content': content, 'moral': 'content'}, indent=2)
+        for size in (1, 2, 5, 13, len(document)):
+            decoder = ContentStreamDecoder()
+            text = ''.join(decoder.feed(document[start:start + size]) for start in range(0, len(document), size))
+            assert text == content, (size, text)
+
+        print("✅ Story text decoded without JSON framing")
+        return True
+    except Exception as e:
+        print(f"❌ Content stream decoder test failed: {e!r}")
+        return False
+
+def test_single_flight_lease():
+    """Test one leader per key, heartbeat renewal, and takeover of a dead leader's lease"""
+    print("🔒 Testing single-flight leases...")
+    import uuid
+    import single_flight
+    from database import db
+    from models import PromptFlight
+
+    lease_ttl = single_flight.LEASE_TTL
+    try:
+        with _unit_app().app_context():
+            single_flight.LEASE_TTL = 0.6
+            key = f"test-lease-{uuid.uuid4().hex[:8]}"
+            assert single_flight.acquire(key), "first caller did not get the lease"
+            assert not single_flight.acquire(key), "a live lease was taken over"
+
+            first_expiry = db.session.get(PromptFlight, key).expires_at
+            time.sleep(1.0)
+            db.session.expire_all()
+            flight = db.session.get(PromptFlight, key)
+            assert flight.expires_at > first_expiry, "heartbeat did not renew the lease"
+            assert not single_flight.acquire(key), "a renewed lease was taken over"
+
+            # A leader that stops heartbeating (its process died) loses the lease once it expires
+            single_flight._stop_heartbeat(key)
+            time.sleep(0.8)
+            assert single_flight.acquire(key), "expired lease was not taken over"
+            single_flight.release(key)
+            db.session.expire_all()
+            assert db.session.get(PromptFlight, key) is None, "released lease still exists"
+
+        print("✅ Leases are exclusive, renewed while held and taken over after expiry")
+        return True
+    except Exception as e:
+        print(f"❌ Single-flight lease test failed: {e!r}")
+        return False
+    finally:
+        single_flight.LEASE_TTL = lease_ttl
+
+def test_prompt_cache():
+    """Test canonical keys and near-duplicate hits and misses"""
+    print("🗂️ Testing prompt cache...")
+    import prompt_cache
+    from database import db
+    from models import Story
+
+    enabled = prompt_cache.NEAR_DUPLICATE_ENABLED
+    try:
+        key = prompt_cache.prompt_cache_key
+        assert key("Story of Kṛṣṇa and Kaṃsa") == key("the story of krishna and kamsa!")
+        assert key("How did Rama defeat Ravana?") != key("When did Rama defeat Ravana?")
+        assert prompt_cache.canonicalize_prompt("A shower of flowers") == "shower flowers"
+        # Direction, preposition and possessive words pick a different story
+        for first, second in [("Hanuman flies to Lanka", "Hanuman flies from Lanka"),
+                              ("Rama fights for his brother", "Rama fights for her brother"),
+                              ("Arjuna fights with Karna", "Arjuna fights against Karna"),
+                              ("Sita in the forest", "Sita on the forest")]:
+            assert key(first) != key(second), (first, second)
+
+        with _unit_app().app_context():
+            prompt = f"How did Hanuman leap across the ocean to Lanka to find Sita {time.time():.0f}"
+            story = Story(title="Test", prompt=prompt, prompt_hash=key(prompt), content="Test story")
+            db.session.add(story)
+            db.session.commit()
+
+            prompt_cache.NEAR_DUPLICATE_ENABLED = True
+            found, kind = prompt_cache.lookup_story(prompt.replace("How did", "how did").upper() + "!")
+            assert (found and found.id, kind) == (story.id, 'exact'), (found, kind)
+            found, kind = prompt_cache.lookup_story(prompt + " devi")
+            assert (found and found.id, kind) == (story.id, 'near'), (found, kind)
+            # Similar wording, different question: not the same story
+            assert prompt_cache.lookup_story(prompt.replace("How did", "When did")) == (None, None)
+            # Similar wording, different direction: not the same story
+            assert prompt_cache.lookup_story(prompt.replace(" to Lanka", " from Lanka")) == (None, None)
+            assert prompt_cache.lookup_story("Krishna lifting Govardhan hill") == (None, None)
+
+            prompt_cache.NEAR_DUPLICATE_ENABLED = False
+            assert prompt_cache.lookup_story(prompt + " devi") == (None, None)
+
+            db.session.delete(story)
+            db.session.commit()
+            prompt_cache.forget_story(story.id)
+
+        print("✅ Canonical keys, near-duplicate hits and misses behave as expected")
+        return True
+    except Exception as e:
+        print(f"❌ Prompt cache test failed: {e!r}")
+        return False
+    finally:
+        prompt_cache.NEAR_DUPLICATE_ENABLED = enabled
+
+def test_resilience():
+    """Test the token bucket, circuit breaker states and retries, and that local rate-limit waits spare the breaker"""
+    print("🛡️ Testing retries, circuit breakers and rate limiting...")
+    import resilience
+
+    retry_base_delay = resilience.RETRY_BASE_DELAY
+    rate_limiter = resilience.gemini_rate_limiter
+    rate_limit_wait = resilience.GEMINI_RATE_LIMIT_WAIT
+    try:
+        resilience.RETRY_BASE_DELAY = 0.001
+
+        # Token bucket: a burst of capacity, then one token per 1/rate seconds, or a timeout
+        bucket = resilience.TokenBucket(rate=20, capacity=2)
+        assert bucket.acquire(0) and bucket.acquire(0), "burst was not granted"
+        assert not bucket.acquire(timeout=0.01), "token granted beyond the burst"
+        started = time.monotonic()
+        assert bucket.acquire(timeout=1)
+        assert 0.02 < time.monotonic() - started < 0.5, "refill did not pace the next token"
+
+        # Circuit breaker: closed -> open after the threshold -> half-open trial -> closed or open again
+        breaker = resilience.CircuitBreaker('test', failure_threshold=2, reset_timeout=0.1)
+        breaker.record_failure()
+        assert breaker.state == 'closed' and breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == 'open' and not breaker.allow()
+        time.sleep(0.15)
+        assert breaker.allow() and breaker.state == 'half_open'
+        assert not breaker.allow(), "a second trial call was let through"
+        breaker.record_failure()
+        assert breaker.state == 'open', "failed trial did not reopen the circuit"
+        time.sleep(0.15)
+        assert breaker.allow()
+        breaker.record_skipped()
+        assert breaker.state == 'half_open' and breaker.allow(), "skipped trial did not free the trial slot"
+        breaker.record_success()
+        assert breaker.to_dict() == {'state': 'closed', 'consecutive_failures': 0}
+
+        # call_with_retry: retryable errors are retried, others raised at once
+        provider = f"test-{time.time_ns()}"
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise RuntimeError("connection reset")
+            return 'ok'
+
+        assert resilience.call_with_retry(flaky, provider, attempts=3) == 'ok' and len(calls) == 3
+        calls.clear()
+
+        def denied():
+            calls.append(1)
+            raise RuntimeError("403 permission denied")
+
+        try:
+            resilience.call_with_retry(denied, provider, attempts=3)
+            raise AssertionError("permission error was swallowed")
+        except RuntimeError as e:
+            assert resilience.classify_error(e) == 'permission_denied'
+        assert len(calls) == 1 and resilience.get_circuit_breaker(provider).failures == 1
+
+        # Waiting too long for our own limiter is not a Gemini failure and never opens the circuit
+        resilience.gemini_rate_limiter = resilience.TokenBucket(rate=0.001, capacity=1)
+        resilience.GEMINI_RATE_LIMIT_WAIT = 0.01
+        resilience.gemini_rate_limiter.acquire(0)
+        provider = f"test-{time.time_ns()}"
+        for _ in range(resilience.CIRCUIT_FAILURE_THRESHOLD + 1):
+            try:
+                resilience.call_with_retry(resilience.wait_for_gemini_quota, provider, attempts=3)
+                raise AssertionError("rate limit wait did not fail")
+            except resilience.RateLimitWaitError as e:
+                assert resilience.classify_error(e) == 'rate_limited'
+        assert resilience.get_circuit_breaker(provider).to_dict() == {'state': 'closed', 'consecutive_failures': 0}
+
+        print("✅ Bucket paces requests, breaker opens and recovers, local rate-limit waits spare the circuit")
+        return True
+    except Exception as e:
+        print(f"❌ Resilience test failed: {e!r}")
+        return False
+    finally:
+        resilience.RETRY_BASE_DELAY = retry_base_delay
+        resilience.gemini_rate_limiter = rate_limiter
+        resilience.GEMINI_RATE_LIMIT_WAIT = rate_limit_wait
+
+def test_admission_limits():
+    """Test per-client and queue limits, queue timeouts, and the 429/503 responses with Retry-After"""
+    print("🚦 Testing admission control...")
+    import admission
+
+    default_controller = admission.controller
+    try:
+        controller = admission.AdmissionController(max_concurrent=1, max_per_client=1, queue_size=1, queue_timeout=0.2)
+        running = controller.reserve('alice')
+        assert running.wait(0) and controller.active == 1
+
+        try:
+            controller.reserve('alice')
+            raise AssertionError("second generation for one client was admitted")
+        except admission.AdmissionRejected as e:
+            assert (e.status, e.reason) == (429, 'client_limit') and e.retry_after > 0, (e.status, e.reason)
+
+        queued = controller.reserve('bob')
+        try:
+            controller.reserve('carol')
+            raise AssertionError("request beyond the queue bound was admitted")
+        except admission.AdmissionRejected as e:
+            assert (e.status, e.reason) == (503, 'queue_full'), (e.status, e.reason)
+
+        # A waiter that never gets a slot gives up and frees its queue place
+        assert not queued.wait(0.1) and controller.waiting == 0
+        running.release()
+        assert controller.active == 0 and controller.avg_generation_seconds is not None
+
+        # The route turns rejections into 429 + Retry-After before any generation starts
+        client = _unit_app().test_client()
+        admission.controller = admission.AdmissionController(max_concurrent=1, max_per_client=1, queue_size=0)
+        admission.controller.reserve('127.0.0.1')
+        response = client.post('/generate_story', json={'prompt': 'Hanuman and the ocean'})
+        assert response.status_code == 429, response.status_code
+        assert int(response.headers['Retry-After']) == response.get_json()['retry_after'] > 0
+
+        print("✅ Limits enforced with 429/503 and Retry-After")
+        return True
+    except Exception as e:
+        print(f"❌ Admission test failed: {e!r}")
+        return False
+    finally:
+        admission.controller = default_controller
+
+def test_mp3_concatenation():
+    """Test narration chunks are joined frame by frame without tags or per-file headers"""
+    print("🎵 Testing MP3 frame concatenation...")
+    import tempfile
+    from audio_generator import concatenate_mp3, mp3_frames
+
+    def frame(marker, padded=False):
+        # MPEG-1 Layer III, 128 kbps, 44.1 kHz: 417 bytes, 418 with the padding bit
+        header = b'\xff\xfb' + (b'\x92' if padded else b'\x90') + b'\x00'
+        return header + bytes([marker]) * (413 + padded)
+
+    def mp3_file(markers):
+        id3v2 = b'ID3\x04\x00\x00\x00\x00\x00\x14' + b'\x00' * 20
+        xing = frame(0)[:36] + b'Xing' + frame(0)[40:]
+        audio = [frame(m, padded=(i % 2 == 1)) for i, m in enumerate(markers)]
+        id3v1 = b'TAG' + b'\x00' * 125
+        return id3v2 + xing + audio[0] + b'junk' + b''.join(audio[1:]) + id3v1, b''.join(audio)
+
+    try:
+        first, first_audio = mp3_file([1, 2, 3])
+        second, second_audio = mp3_file([4, 5])
+        assert mp3_frames(first) == first_audio
+
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for i, data in enumerate((first, second)):
+                paths.append(os.path.join(tmp, f"chunk{i}.mp3"))
+                with open(paths[-1], 'wb') as f:
+                    f.write(data)
+            output = os.path.join(tmp, 'joined.mp3')
+            concatenate_mp3(paths, output)
+            with open(output, 'rb') as f:
+                joined = f.read()
+
+        assert joined == first_audio + second_audio, f"{len(joined)} bytes"
+        assert b'ID3' not in joined and b'TAG' not in joined and b'Xing' not in joined
+        print("✅ MP3 chunks joined frame by frame")
+        return True
+    except Exception as e:
+        print(f"❌ MP3 concatenation test failed: {e!r}")
+        return False
+
+def test_media_store():
+    """Test story links act as reference counts and eviction only removes old unreferenced blobs"""
+    print("🗄️ Testing media store refcounts and eviction...")
+    import tempfile
+    import media_store
+
+    saved = media_store.MEDIA_STORE_DIR, media_store.MEDIA_STORE_EVICT_GRACE, media_store._approx_bytes
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            media_store.MEDIA_STORE_DIR = os.path.join(tmp, 'media')
+            media_store.MEDIA_STORE_EVICT_GRACE = 30
+            media_store._approx_bytes = None
+
+            used = media_store.put_bytes('images', media_store.content_key('used'), 'png', b'u' * 4096)
+            cached = media_store.put_bytes('images', media_store.content_key('cached'), 'png', b'c' * 4096)
+            assert media_store.put_bytes('images', media_store.content_key('used'), 'png', b'x') == used
+
+            story_file = os.path.join(tmp, 'story_1_scene_1.png')
+            media_store.link(used, story_file)
+            media_store.link(used, story_file)
+            assert media_store.refcount(used) == 1 and media_store.refcount(cached) == 0
+            assert sorted(os.listdir(tmp)) == ['media', 'story_1_scene_1.png'], "relinking left a temp link"
+
+            # Older than the grace period; a zero budget evicts everything it may
+            old = time.time() - 60
+            for path in (used, cached):
+                os.utime(path, (old, old))
+            assert media_store.enforce_budget(budget_mb=0) == 1
+            assert os.path.exists(used) and not os.path.exists(cached)
+
+            # Deleting the story's file leaves the blob unreferenced, so it goes next
+            os.remove(story_file)
+            assert media_store.refcount(used) == 0
+            assert media_store.lookup('images', media_store.content_key('used'), 'png') == used
+            assert media_store.enforce_budget(budget_mb=0) == 0, "a just-used blob was evicted"
+            os.utime(used, (old, old))
+            assert media_store.enforce_budget(budget_mb=0) == 1 and not os.path.exists(used)
+
+        print("✅ Linked blobs kept, unreferenced blobs evicted LRU")
+        return True
+    except Exception as e:
+        print(f"❌ Media store test failed: {e!r}")
+        return False
+    finally:
+        media_store.MEDIA_STORE_DIR, media_store.MEDIA_STORE_EVICT_GRACE, media_store._approx_bytes = saved
+
+def test_render_farm():
+    """Test a timed-out job is killed with the encoder it started, a crash fails only its job, and workers restart"""
+    print("🏭 Testing render farm timeouts and crashes...")
+    import signal
+    import tempfile
+    import render_farm
+
+    def process_alive(pid):
+        # The killed encoder is orphaned, so it may linger as a zombie until init reaps it
+        if os.path.isdir('/proc/self'):
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+            except FileNotFoundError:
+                return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+    farm = render_farm.RenderFarm(workers=1, queue_size=1, job_timeout=30)
+    try:
+        first_worker = farm.render('test', os.getpid)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # Stands in for an ffmpeg started by the job: a child in the worker's process group
+            pid_file = os.path.join(tmp, 'encoder.pid')
+            job = farm.submit('test', os.system, f"sleep 60 & echo $! > {pid_file}; wait", timeout=1)
+            try:
+                job.wait(10)
+                raise AssertionError("job outlived its timeout")
+            except render_farm.RenderTimeout:
+                pass
+            with open(pid_file) as f:
+                encoder_pid = int(f.read())
+            if process_alive(encoder_pid):
+                os.kill(encoder_pid, signal.SIGKILL)
+                raise AssertionError("the job's child process survived the timeout kill")
+
+        second_worker = farm.render('test', os.getpid)
+        assert second_worker != first_worker, "worker was not replaced after the timeout"
+
+        try:
+            farm.render('test', os._exit, 1)
+            raise AssertionError("crashed job reported success")
+        except render_farm.RenderCrashed:
+            pass
+        assert farm.render('test', abs, -3) == 3
+
+        counts = farm.to_dict()['jobs']
+        assert (counts['timeout'], counts['crashed'], counts['ok']) == (1, 1, 3), counts
+        print("✅ Timed-out job killed with its children, crash isolated, workers restarted")
+        return True
+    except Exception as e:
+        print(f"❌ Render farm test failed: {e!r}")
+        return False
+    finally:
+        farm.shutdown()
+
+def test_static_assets():
+    """Test the CSS/JS minifiers on strings, templates, regexes and comments, and Accept-Encoding negotiation"""
+    print("🗜️ Testing static asset minification and precompression...")
+    import gzip
+    import shutil
+    import tempfile
+    import static_assets
+
+    static_dir = tempfile.mkdtemp(prefix='mythoscribe-assets-')
+    brotli_available = static_assets.BROTLI_AVAILABLE
+    try:
+        minify_js = static_assets.minify_js
+        # Comments go (a block comment leaves a space so tokens never merge); strings,
+        # template literals and regex literals are copied verbatim
+        assert minify_js('// note\nconst a = "x  // y";  /* block */ let b = 1;\n') == 'const a="x  // y"; let b=1;\n'
+        assert minify_js("let s = 'it\\'s  /* here */';") == "let s='it\\'s  /* here */';\n"
+        template = 'let t = `a  // b ${ {k: 1}.k + `in  ${"x"}` }  c`;'
+        assert minify_js(template) == 'let t=`a  // b ${{k:1}.k+`in  ${"x"}`}  c`;\n'
+        assert minify_js('const re = /\\/\\*[^/]*\\*\\//g, r = total / count / 2;') == \
+            'const re=/\\/\\*[^/]*\\*\\//g,r=total/count/2;\n'
+        assert minify_js('if (x) return /ab+c/i.test(s);') == 'if(x)return/ab+c/i.test(s);\n'
+        # Line breaks stay (automatic semicolon insertion), and "+ +" / "- -" are not merged
+        assert minify_js('a = b\n\n(c)\nd = e + +f - -g') == 'a=b\n(c)\nd=e+ +f- -g\n'
+
+        minify_css = static_assets.minify_css
+        assert minify_css('/* c */ .a  :hover , .b > .c { color: red ; }') == '.a :hover,.b>.c{color:red}'
+        assert minify_css('.q::before { content: "a ; {  } /* x */"; }') == '.q::before{content:"a ; {  } /* x */"}'
+
+        # Built files are named by content hash; the precompressed copy is picked by Accept-Encoding
+        os.makedirs(os.path.join(static_dir, 'css'))
+        with open(os.path.join(static_dir, 'css', 'site.css'), 'w') as f:
+            f.write('body { color: red; }\n' * 50)
+        # First built without brotli: only the gzip copy is written
+        static_assets.BROTLI_AVAILABLE = False
+        built = static_assets.build_asset('css/site.css', static_dir)
+        path = os.path.join(static_dir, built)
+        assert os.path.exists(path + '.gz') and not os.path.exists(path + '.br')
+        # A rebuild keeps the name and adds the copies the existing build lacks
+        static_assets.BROTLI_AVAILABLE = brotli_available
+        os.remove(path + '.gz')
+        assert built == static_assets.build_asset('css/site.css', static_dir), "rebuild changed the name"
+        assert os.path.exists(path + '.gz'), "missing .gz copy was not rewritten"
+        assert os.path.exists(path + '.br') == brotli_available, "missing .br copy was not added"
+        filename = built.split('/', 1)[1]
+
+        app = _unit_app()
+        for accept, encoding in [('gzip, deflate, br', 'br' if brotli_available else 'gzip'),
+                                 ('gzip', 'gzip'), ('br;q=0, gzip', 'gzip'), ('identity', None), ('', None)]:
+            with app.test_request_context(headers={'Accept-Encoding': accept}):
+                from flask import request
+                response = static_assets.asset_response(filename, request.accept_encodings, static_dir)
+                response.direct_passthrough = False
+                body = response.get_data()
+            assert response.headers.get('Content-Encoding') == encoding, (accept, response.headers.get('Content-Encoding'))
+            assert 'Accept-Encoding' in response.headers['Vary'] and 'immutable' in response.headers['Cache-Control']
+            if encoding == 'gzip':
+                body = gzip.decompress(body)
+            elif encoding == 'br':
+                import brotli
+                body = brotli.decompress(body)
+            assert body == b'body{color:red}' * 50, (accept, body[:40])
+
+        with app.test_request_context():
+            from flask import request
+            assert static_assets.asset_response(filename + '.gz', request.accept_encodings, static_dir) is None
+            assert static_assets.asset_response('../css/site.css', request.accept_encodings, static_dir) is None
+
+        print("✅ Minifiers keep strings, templates and regexes, and the best precompressed copy is served")
+        return True
+    except Exception as e:
+        print(f"❌ Static assets test failed: {e!r}")
+        return False
+    finally:
+        static_assets.BROTLI_AVAILABLE = brotli_available
+        shutil.rmtree(static_dir, ignore_errors=True)
+
+UNIT_TESTS = [
+    ("Stage Graph", test_stage_graph),
+    ("Scene Stream Parser", test_scene_stream_parser),
+    ("Image Batch Retry", test_image_batch_retry),
+    ("Content Stream Decoder", test_content_stream_decoder),
+    ("Single-Flight Lease", test_single_flight_lease),
+    ("Prompt Cache", test_prompt_cache),
+    ("Resilience", test_resilience),
+    ("Admission Limits", test_admission_limits),
+    ("MP3 Concatenation", test_mp3_concatenation),
+    ("Media Store", test_media_store),
+    ("Render Farm", test_render_farm),
+    ("Static Assets", test_static_assets),
+]
+
+def run_unit_tests():
+    """Run the unit tests, which need no running server"""
+    print("MYTHOSCRIBE UNIT TESTS")
+    print("=" * 50)
+    os.environ.setdefault('MYTHOSCRIBE_PROVIDERS', 'stub')
+    if 'MYTHOSCRIBE_DATABASE_URL' not in os.environ:
+        import tempfile
+        os.environ['MYTHOSCRIBE_DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp(prefix='mythoscribe-test-')}/test.db"
+
+    results = []
+    for test_name, test_func in UNIT_TESTS:
+        print(f"\n🧪 Running: {test_name}")
+        results.append((test_name, test_func()))
+
+    print("\n" + "=" * 50)
+    for test_name, success in results:
+        print(f"{'✅ PASS' if success else '❌ FAIL'} {test_name}")
+    passed = sum(1 for _, success in results if success)
+    print(f"\n🎯 Overall: {passed}/{len(results)} unit tests passed")
+    return passed, len(results)
+
 def run_full_test_suite(port=8000):
     """Run the complete test suite"""
     print("MYTHOSCRIBE COMPREHENSIVE TEST SUITE")
@@ -209,6 +850,7 @@ def run_full_test_suite(port=8000):
         ("Static Files", lambda: test_static_files(port)),
         ("API Endpoints", lambda: test_api_endpoints(port)),
         ("Story Generation", lambda: test_story_generation(port)[0]),  # Only get success status
+        ("Async Job", lambda: test_async_job(port)),
         ("Library Page", lambda: test_library_page(port)),
         ("Video Files", test_video_files),
         ("Video Generation", test_video_generation),
@@ -265,6 +907,7 @@ def run_full_test_suite(port=8000):
     print("   ✅ Static files served")
     print("   ✅ API endpoints working")
     print("   ✅ Story generation (with error handling)")
+    print("   ✅ Async generation jobs")
     print("   ✅ Library page")
     print("   ✅ Video files accessible")
     print("   ✅ Video generation components")
@@ -292,11 +935,15 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Mythoscribe Test Suite')
     parser.add_argument('--port', type=int, default=8000, help='Port number (default: 8000)')
     parser.add_argument('--quick', action='store_true', help='Run quick connectivity test only')
+    parser.add_argument('--unit', action='store_true', help='Run the unit tests only (no server needed)')
 
     args = parser.parse_args()
 
     if args.quick:
         success = run_quick_test(args.port)
+    elif args.unit:
+        passed, total = run_unit_tests()
+        success = passed == total
     else:
         passed, total = run_full_test_suite(args.port)
         success = passed == total
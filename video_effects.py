@@ -0,0 +1,159 @@
+"""
+Video Effects - Ken Burns pan/zoom and crossfades computed with NumPy
+
+Frames are produced one at a time from stills preloaded as arrays, so a render
+holds the stills plus a couple of frames in memory no matter how long the video
+is. Everything works directly on YUV 4:2:0 planes, the encoder's own input
+format: half the samples of RGB, and no per-frame colour conversion in ffmpeg.
+Every step is a whole-array operation in fixed point: the pan/zoom is a
+separable bilinear resample of the moving crop window, the crossfade a
+weighted sum of two frames, and the caption banner a precomputed
+premultiplied blend over the bottom rows. The caller streams the frames into
+the encoder.
+"""
+
+import os
+import numpy as np
+
+# Zoom at the tight end of each still's pan/zoom (1.0 disables the motion)
+KEN_BURNS_ZOOM = float(os.environ.get('KEN_BURNS_ZOOM', 1.12))
+# Seconds each cut between stills is blended over (0 for hard cuts)
+VIDEO_CROSSFADE = float(os.environ.get('VIDEO_CROSSFADE', 1.0))
+
+# Pan directions, as (start, end) centers in fractions of the free margin; stills cycle through them
+_PANS = (((-1, -1), (0, 0)), ((1, 0), (-1, 0)), ((0, 1), (0, -1)), ((1, 1), (0, 0)))
+
+def rgb_to_yuv420(rgb):
+    """
+    Convert an (height, width, 3) uint8 RGB array with even dimensions to
+    limited-range BT.601 Y, U and V planes, the layout of ffmpeg's yuv420p.
+    """
+    r, g, b = (rgb[..., i].astype(np.float32) for i in range(3))
+    y = 16 + (65.481 * r + 128.553 * g + 24.966 * b) / 255
+    u = 128 + (-37.797 * r - 74.203 * g + 112.0 * b) / 255
+    v = 128 + (112.0 * r - 93.786 * g - 18.214 * b) / 255
+    return [np.clip(np.rint(plane), 0, 255).astype(np.uint8) for plane in (y, _halve(u), _halve(v))]
+
+def _halve(plane):
+    """Average each 2x2 block (chroma subsampling)"""
+    return (plane[0::2, 0::2] + plane[1::2, 0::2] + plane[0::2, 1::2] + plane[1::2, 1::2]) / 4
+
+def _lerp(a, b, weight):
+    """a + (b - a) * weight / 128 for uint8 arrays, in int16 without overflow"""
+    mixed = b.astype(np.int16)
+    mixed -= a
+    mixed *= weight
+    mixed >>= 7
+    mixed += a
+    return mixed.astype(np.uint8)
+
+def _axis_samples(start, length, source_size):
+    """Source indices and 7-bit weights for resampling [start, start + length) back to source_size pixels"""
+    positions = start + (np.arange(source_size, dtype=np.float32) + 0.5) * (length / source_size) - 0.5
+    positions = np.clip(positions, 0, source_size - 1)
+    lower = positions.astype(np.intp)
+    upper = np.minimum(lower + 1, source_size - 1)
+    weight = ((positions - lower) * 128).astype(np.int16)
+    return lower, upper, weight
+
+def zoom_plane(plane, zoom, center_x, center_y):
+    """
+    Resample the window of plane zoomed by zoom around (center_x, center_y)
+    (fractions of the frame) back to full size with bilinear filtering.
+    """
+    height, width = plane.shape
+    crop_w, crop_h = width / zoom, height / zoom
+    left = min(max(center_x * width - crop_w / 2, 0), width - crop_w)
+    top = min(max(center_y * height - crop_h / 2, 0), height - crop_h)
+
+    x0, x1, wx = _axis_samples(left, crop_w, width)
+    y0, y1, wy = _axis_samples(top, crop_h, height)
+    # Vertical pass gathers whole rows (cheap), the horizontal pass gathers columns
+    rows = _lerp(plane[y0], plane[y1], wy[:, None])
+    # take() keeps the result in C order, which the encoder pipe needs
+    return _lerp(np.take(rows, x0, axis=1), np.take(rows, x1, axis=1), wx[None, :])
+
+class CaptionOverlay:
+    """An RGBA banner converted and pre-multiplied once, then blended onto the bottom rows of each frame"""
+
+    def __init__(self, banner_rgba):
+        if banner_rgba.shape[0] % 2:
+            # Chroma rows cover two luma rows: pad with a transparent row on top
+            banner_rgba = np.concatenate([np.zeros_like(banner_rgba[:1]), banner_rgba])
+        alpha = banner_rgba[..., 3].astype(np.float32) / 255
+        alphas = (alpha, _halve(alpha), _halve(alpha))
+        self.planes = []
+        for colour, plane_alpha in zip(rgb_to_yuv420(banner_rgba[..., :3]), alphas):
+            inverse = np.rint((1 - plane_alpha) * 256).astype(np.uint16)
+            premultiplied = np.rint(colour * plane_alpha * 256).astype(np.uint16)
+            self.planes.append((colour.shape[0], inverse, premultiplied))
+
+    def apply(self, frame):
+        for plane, (rows, inverse, premultiplied) in zip(frame, self.planes):
+            bottom = plane[-rows:]
+            bottom[...] = ((bottom * inverse + premultiplied) >> 8).astype(np.uint8)
+        return frame
+
+def _smoothstep(t):
+    return t * t * (3 - 2 * t)
+
+def _still_motion(index, progress):
+    """(zoom, center_x, center_y) of still number index at progress 0..1 through its time on screen"""
+    eased = _smoothstep(min(max(progress, 0.0), 1.0))
+    # Alternate zooming in and out so consecutive stills do not all rush forward
+    if index % 2:
+        eased = 1 - eased
+    zoom = 1 + (KEN_BURNS_ZOOM - 1) * eased
+    (sx, sy), (ex, ey) = _PANS[index % len(_PANS)]
+    # The window can move by at most half the margin the zoom frees up
+    margin = (1 - 1 / zoom) / 2
+    center_x = 0.5 + margin * (sx + (ex - sx) * eased)
+    center_y = 0.5 + margin * (sy + (ey - sy) * eased)
+    return zoom, center_x, center_y
+
+def iter_motion_frames(stills, fps, total_duration, crossfade=VIDEO_CROSSFADE, caption=None):
+    """
+    Yield the frames of a slideshow with Ken Burns motion and crossfades.
+
+    Args:
+        stills (list): [Y, U, V] plane lists from rgb_to_yuv420(), all the same size
+        fps (int): Frames per second
+        total_duration (float): Video length in seconds, shared equally by the stills
+        crossfade (float): Seconds over which each cut is blended
+        caption (CaptionOverlay): Banner drawn over every frame, if any
+
+    Yields:
+        list: The Y, U and V planes (uint8) of one frame at a time
+    """
+    count = len(stills)
+    segment = total_duration / count
+    crossfade = min(crossfade, segment / 2)
+    total_frames = max(1, int(round(total_duration * fps)))
+
+    def render(index, t):
+        if KEN_BURNS_ZOOM == 1:
+            return [plane.copy() for plane in stills[index]]
+        # Motion runs over the still's whole time on screen, including both fades
+        start = index * segment - crossfade / 2
+        motion = _still_motion(index, (t - start) / (segment + crossfade))
+        return [zoom_plane(plane, *motion) for plane in stills[index]]
+
+    for frame_number in range(total_frames):
+        t = (frame_number + 0.5) / fps
+        index = min(int(t // segment), count - 1)
+        frame = render(index, t)
+
+        # Within crossfade / 2 of a cut, blend with the neighbouring still
+        into_segment = t - index * segment
+        neighbour = None
+        if crossfade and index > 0 and into_segment < crossfade / 2:
+            neighbour, mix = index - 1, 0.5 - into_segment / crossfade
+        elif crossfade and index < count - 1 and segment - into_segment < crossfade / 2:
+            neighbour, mix = index + 1, 0.5 - (segment - into_segment) / crossfade
+        if neighbour is not None:
+            weight = np.int16(round(mix * 128))
+            frame = [_lerp(own, other, weight) for own, other in zip(frame, render(neighbour, t))]
+
+        if caption is not None:
+            caption.apply(frame)
+        yield frame
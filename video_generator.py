@@ -1,17 +1,36 @@
 import os
+import re
+import time
+import uuid
+import shutil
 import logging
+import tempfile
+import subprocess
+import media_store
+from metrics import record_file_written, VIDEO_RENDER_DURATION
 
 try:
-    from moviepy.editor import VideoFileClip, AudioFileClip, ImageClip, TextClip, CompositeVideoClip, concatenate_videoclips
-    from moviepy.config import change_settings
+    from moviepy.editor import VideoFileClip, AudioFileClip, ImageClip, concatenate_videoclips
     MOVIEPY_AVAILABLE = True
 except ImportError:
     MOVIEPY_AVAILABLE = False
-    logging.warning("MoviePy not available. Video generation will be disabled.")
+    logging.warning("MoviePy not available. Videos can only be rendered with the ffmpeg renderer.")
 
-# Set ImageMagick path if needed (for Windows)
-# Uncomment and modify path if ImageMagick is installed:
-# change_settings({"IMAGEMAGICK_BINARY": r"C:\Path\To\ImageMagick\magick.exe"})
+# How story slideshows are rendered: 'ffmpeg' hands the captioned stills to the ffmpeg
+# binary (concat demuxer) so no frame is composited in Python;
+# 'moviepy' uses the MoviePy compositing pipeline. ffmpeg falls back to MoviePy on failure.
+VIDEO_RENDERER = os.environ.get('VIDEO_RENDERER', 'ffmpeg').lower()
+# Path to the ffmpeg binary; defaults to the one on PATH, then the one bundled with imageio-ffmpeg
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY')
+# Seconds an ffmpeg render may take before it is killed
+FFMPEG_TIMEOUT = float(os.environ.get('FFMPEG_TIMEOUT', 300))
+
+# 'kenburns' gives the ffmpeg renderer slow pan/zoom and crossfades (see video_effects);
+# 'static' keeps hard cuts between static stills
+VIDEO_MOTION = os.environ.get('VIDEO_MOTION', 'kenburns').lower()
+
+VIDEO_FPS = 20
+VIDEO_MAX_DURATION = 180  # 3 minutes max
 
 def generate_story_video(image_path, audio_path, text_caption, story_id):
     """Generate a video combining image, audio, and text caption"""
@@ -19,6 +38,7 @@ def generate_story_video(image_path, audio_path, text_caption, story_id):
         logging.warning("MoviePy not available, skipping video generation")
         return None
 
+    work_dir = tempfile.mkdtemp(prefix='video_')
     try:
         logging.info(f"Starting video generation for story ID: {story_id}")
 
@@ -37,32 +57,15 @@ def generate_story_video(image_path, audio_path, text_caption, story_id):
 
         logging.info(f"Video duration will be: {duration} seconds")
 
-        # Create image clip
-        image_clip = ImageClip(image_path).set_duration(duration)
+        # Caption composited onto the still once, instead of a TextClip overlay on every frame
+        stills, _, _ = prepare_stills([image_path], text_caption, work_dir)
+        if not stills:
+            logging.error(f"Failed to load image {image_path}")
+            return None
 
-        # Try to create text clip for caption with fallback options
-        text_clip = None
-        try:
-            # Limit text length to avoid issues
-            short_caption = text_caption[:80] if len(text_caption) > 80 else text_caption
-
-            text_clip = TextClip(
-                short_caption,
-                fontsize=35,  # Smaller font for better compatibility
-                color='white',
-                bg_color='rgba(0,0,0,0.7)',  # Semi-transparent background
-                size=(700, 60)  # Smaller size
-            ).set_position(('center', 'bottom')).set_duration(duration)
-
-            # Composite video with text
-            video = CompositeVideoClip([image_clip, text_clip])
-            logging.info("Video created with text overlay")
-        except Exception as text_error:
-            logging.warning(f"Text overlay failed, creating video without text: {str(text_error)}")
-            # Create video without text overlay
-            video = image_clip
-            logging.info("Video created without text overlay")
-        video = video.set_audio(audio_clip)
+        # Create image clip
+        image_clip = ImageClip(stills[0]).set_duration(duration)
+        video = image_clip.set_audio(audio_clip)
 
         # Export video
         filename = f"story_{story_id}_video.mp4"
@@ -87,10 +90,8 @@ def generate_story_video(image_path, audio_path, text_caption, story_id):
         audio_clip.close()
         image_clip.close()
         video.close()
-        # Close text_clip if it was created
-        if text_clip is not None:
-            text_clip.close()
 
+        record_file_written('video', filepath)
         web_path = f"/static/videos/{filename}"
         logging.info(f"Successfully generated video: {filepath}")
         return web_path
@@ -98,6 +99,8 @@ def generate_story_video(image_path, audio_path, text_caption, story_id):
     except Exception as e:
         logging.error(f"Video generation failed: {str(e)}", exc_info=True)
         return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
 
 def generate_story_video_from_paths(image_paths, audio_path, story_title, story_content, story_id):
     """Generate video using multiple image paths and story data"""
@@ -128,14 +131,377 @@ def generate_story_video_from_paths(image_paths, audio_path, story_title, story_
         logging.error(f"Video generation from paths failed: {str(e)}", exc_info=True)
         return None
 
+def find_ffmpeg():
+    """Path of the ffmpeg binary, or None if there is none"""
+    if FFMPEG_BINARY:
+        return FFMPEG_BINARY
+    path = shutil.which('ffmpeg')
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+_DURATION = re.compile(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+
+def probe_duration(ffmpeg, media_path):
+    """Duration of a media file in seconds, read from ffmpeg's input summary"""
+    result = subprocess.run([ffmpeg, '-hide_banner', '-i', media_path],
+                            capture_output=True, text=True, timeout=30)
+    match = _DURATION.search(result.stderr)
+    if not match:
+        raise RuntimeError(f"Could not read the duration of {media_path}")
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+# Caption banner: largest font size whose wrapped caption fits in CAPTION_MAX_LINES lines
+CAPTION_FONT_SIZES = (30, 26, 22, 19, 16, 14)
+CAPTION_MAX_LINES = 3
+CAPTION_BACKGROUND = (0, 0, 0, int(255 * 0.7))  # Semi-transparent black
+
+def _load_font(size):
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 only has the fixed-size bitmap font
+        return ImageFont.load_default()
+
+def _wrap_text(draw, text, font, max_width):
+    """Greedy word wrap of one paragraph to lines no wider than max_width pixels"""
+    lines, current = [], ''
+    for word in text.split():
+        candidate = f"{current} {word}" if current else word
+        if current and draw.textlength(candidate, font=font) > max_width:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        lines.append(current)
+    return lines
+
+def _fit_caption(draw, text_caption, max_width):
+    """Font and wrapped lines for the caption, shrinking the font until it fits"""
+    paragraphs = [p for p in text_caption.split('\n') if p.strip()]
+    for size in CAPTION_FONT_SIZES:
+        font = _load_font(size)
+        lines = [line for p in paragraphs for line in _wrap_text(draw, p, font, max_width)]
+        if len(lines) <= CAPTION_MAX_LINES:
+            return font, lines
+    # Still too long at the smallest size: keep the first lines and mark the cut
+    lines = lines[:CAPTION_MAX_LINES]
+    last = lines[-1]
+    while last and draw.textlength(last + '...', font=font) > max_width:
+        last = last[:-1]
+    lines[-1] = last.rstrip() + '...'
+    return font, lines
+
+def render_caption_banner(text_caption, frame_width):
+    """
+    Draw the caption as a semi-transparent RGBA banner as wide as the frame.
+
+    The title and preview are wrapped to the frame width, using the largest
+    font size that fits in CAPTION_MAX_LINES lines.
+    """
+    from PIL import Image, ImageDraw
+
+    padding = max(8, frame_width // 60)
+    measure = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+    font, lines = _fit_caption(measure, text_caption, frame_width - 2 * padding)
+    ascent, descent = font.getmetrics() if hasattr(font, 'getmetrics') else (11, 3)
+    line_height = int((ascent + descent) * 1.15)
+
+    banner = Image.new('RGBA', (frame_width, line_height * len(lines) + 2 * padding), CAPTION_BACKGROUND)
+    draw = ImageDraw.Draw(banner)
+    for i, line in enumerate(lines):
+        x = (frame_width - draw.textlength(line, font=font)) // 2
+        draw.text((x, padding + i * line_height), line, fill='white', font=font)
+    return banner
+
+def caption_banner_path(text_caption, frame_width):
+    """
+    Path of the caption banner PNG for a story, drawn only the first time.
+
+    Banners live in the media store, keyed by caption and width, so
+    re-rendering a story's video reuses the banner.
+    """
+    key = media_store.content_key('caption-banner', 'v1', text_caption, frame_width)
+    path = media_store.lookup('caption', key, 'png')
+    if path:
+        return path
+    with media_store.writing('caption', key, 'png') as tmp_path:
+        render_caption_banner(text_caption, frame_width).save(tmp_path, format='PNG')
+    return media_store.blob_path('caption', key, 'png')
+
+def _slideshow_frame_size(image_paths):
+    """
+    Readable images and the frame size that fits all of them (like MoviePy's
+    "compose" concatenation), rounded to even numbers as H.264 requires.
+    """
+    from PIL import Image
+
+    valid_paths, width, height = [], 0, 0
+    for image_path in image_paths:
+        try:
+            with Image.open(image_path) as image:
+                image.verify()
+                size = image.size
+        except Exception as img_error:
+            logging.error(f"Failed to load image {image_path}: {str(img_error)}")
+            continue
+        valid_paths.append(image_path)
+        width, height = max(width, size[0]), max(height, size[1])
+    return valid_paths, width + width % 2, height + height % 2
+
+def letterbox_still(image_path, width, height):
+    """The image scaled to fit a width x height RGBA frame, centred on black"""
+    from PIL import Image
+
+    with Image.open(image_path) as image:
+        image = image.convert('RGBA')
+    scale = min(width / image.width, height / image.height)
+    if scale != 1:
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                             Image.LANCZOS)
+    frame = Image.new('RGBA', (width, height), (0, 0, 0, 255))
+    frame.paste(image, ((width - image.width) // 2, (height - image.height) // 2))
+    return frame
+
+def prepare_stills(image_paths, text_caption, work_dir):
+    """
+    Letterbox every readable still to one frame size and composite the
+    caption banner onto it, once per still rather than once per frame.
+
+    Returns:
+        (list, int, int): Paths of the finished stills in work_dir, frame width and height
+    """
+    from PIL import Image
+
+    started = time.perf_counter()
+    valid_paths, width, height = _slideshow_frame_size(image_paths)
+    if not valid_paths:
+        return [], width, height
+
+    banner = Image.open(caption_banner_path(text_caption, width)).convert('RGBA')
+    banner_done = time.perf_counter()
+
+    stills = []
+    for i, image_path in enumerate(valid_paths):
+        frame = letterbox_still(image_path, width, height)
+        frame.alpha_composite(banner, (0, height - banner.height))
+        still_path = os.path.join(work_dir, f"still_{i + 1}.png")
+        frame.convert('RGB').save(still_path, compress_level=1)
+        stills.append(still_path)
+
+    logging.info(f"Prepared {len(stills)} captioned stills in {(time.perf_counter() - started) * 1000:.0f} ms "
+                 f"(caption banner {(banner_done - started) * 1000:.0f} ms)")
+    return stills, width, height
+
+def _concat_entry(path):
+    # Quote for the concat demuxer: a literal ' is written as '\''
+    return "file '" + os.path.abspath(path).replace("'", "'\\''") + "'\n"
+
+def render_slideshow_ffmpeg(ffmpeg, image_paths, audio_path, text_caption, filepath):
+    """
+    Encode stills, narration and caption into an MP4 with a single ffmpeg run.
+
+    The stills are captioned once by prepare_stills(), the concat demuxer shows
+    each for its share of the narration, and the narration audio is muxed in,
+    so the cost is essentially that of the H.264/AAC encode.
+
+    Args:
+        ffmpeg (str): Path of the ffmpeg binary
+        image_paths (list): File system paths of the stills, in order
+        audio_path (str): File system path of the narration
+        text_caption (str): Caption shown at the bottom of every frame
+        filepath (str): Where to write the MP4
+
+    Returns:
+        bool: False if none of the images could be read
+    """
+    total_duration = min(probe_duration(ffmpeg, audio_path), VIDEO_MAX_DURATION)
+    logging.info(f"Video total duration will be: {total_duration} seconds")
+
+    with tempfile.TemporaryDirectory(prefix='slideshow_') as work_dir:
+        valid_paths, width, height = prepare_stills(image_paths, text_caption, work_dir)
+        if not valid_paths:
+            logging.error("No valid images found for video generation")
+            return False
+        image_duration = total_duration / len(valid_paths)
+
+        list_path = os.path.join(work_dir, 'stills.txt')
+        with open(list_path, 'w', encoding='utf-8') as f:
+            f.write('ffconcat version 1.0\n')
+            for image_path in valid_paths:
+                f.write(_concat_entry(image_path))
+                f.write(f"duration {image_duration:.3f}\n")
+            # The demuxer ignores the duration of the last entry unless the file is repeated
+            f.write(_concat_entry(valid_paths[-1]))
+
+        # Written next to the target and renamed, so a half-written file is never served
+        tmp_path = f"{filepath}.{uuid.uuid4().hex}.tmp.mp4"
+        command = [
+            ffmpeg, '-y', '-hide_banner', '-loglevel', 'error',
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-i', audio_path,
+            '-map', '0:v', '-map', '1:a',
+            # Convert each still to YUV once, then repeat it, rather than converting every frame
+            '-vf', f"format=yuv420p,fps={VIDEO_FPS}",
+            '-t', f"{total_duration:.3f}",
+            '-c:v', 'libx264', '-preset', 'fast', '-tune', 'stillimage', '-b:v', '800k',
+            '-c:a', 'aac', '-b:a', '128k',
+            '-movflags', '+faststart',
+            tmp_path
+        ]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=FFMPEG_TIMEOUT)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg exited with {result.returncode}: {result.stderr.strip()[-500:]}")
+            os.replace(tmp_path, filepath)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return True
+
+def render_motion_ffmpeg(ffmpeg, image_paths, audio_path, text_caption, filepath):
+    """
+    Encode the stills with Ken Burns pan/zoom and crossfades.
+
+    video_effects computes each frame with NumPy from the preloaded stills and
+    it is written straight into ffmpeg's stdin as raw yuv420p, so only a
+    couple of frames are in memory at any time and nothing touches the disk
+    but the MP4.
+
+    Args:
+        ffmpeg (str): Path of the ffmpeg binary
+        image_paths (list): File system paths of the stills, in order
+        audio_path (str): File system path of the narration
+        text_caption (str): Caption shown at the bottom of every frame
+        filepath (str): Where to write the MP4
+
+    Returns:
+        bool: False if none of the images could be read
+    """
+    import numpy as np
+    from PIL import Image
+    import video_effects
+
+    started = time.perf_counter()
+    valid_paths, width, height = _slideshow_frame_size(image_paths)
+    if not valid_paths:
+        logging.error("No valid images found for video generation")
+        return False
+
+    total_duration = min(probe_duration(ffmpeg, audio_path), VIDEO_MAX_DURATION)
+    logging.info(f"Video total duration will be: {total_duration} seconds")
+
+    stills = [video_effects.rgb_to_yuv420(np.asarray(letterbox_still(path, width, height).convert('RGB')))
+              for path in valid_paths]
+    with Image.open(caption_banner_path(text_caption, width)) as banner:
+        caption = video_effects.CaptionOverlay(np.asarray(banner.convert('RGBA')))
+    logging.info(f"Loaded {len(stills)} stills for motion rendering in "
+                 f"{(time.perf_counter() - started) * 1000:.0f} ms")
+
+    # Written next to the target and renamed, so a half-written file is never served
+    tmp_path = f"{filepath}.{uuid.uuid4().hex}.tmp.mp4"
+    command = [
+        ffmpeg, '-y', '-hide_banner', '-loglevel', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'yuv420p', '-s', f"{width}x{height}", '-r', str(VIDEO_FPS), '-i', '-',
+        '-i', audio_path,
+        '-map', '0:v', '-map', '1:a',
+        '-t', f"{total_duration:.3f}",
+        # Every frame differs, so a faster preset keeps the encode near the cost of a static slideshow
+        '-c:v', 'libx264', '-preset', 'veryfast', '-b:v', '800k',
+        '-c:a', 'aac', '-b:a', '128k',
+        '-movflags', '+faststart',
+        tmp_path
+    ]
+    deadline = time.monotonic() + FFMPEG_TIMEOUT
+    # stderr goes to a file: a pipe nobody reads could fill up and stall ffmpeg
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=errors)
+        try:
+            try:
+                for frame in video_effects.iter_motion_frames(stills, VIDEO_FPS, total_duration, caption=caption):
+                    for plane in frame:
+                        process.stdin.write(plane.data)
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Motion render exceeded {FFMPEG_TIMEOUT:g}s")
+                process.stdin.close()
+            except BrokenPipeError:
+                # ffmpeg exited early; its exit code and stderr say why
+                pass
+            returncode = process.wait(timeout=max(1.0, deadline - time.monotonic()))
+            if returncode != 0:
+                errors.seek(0)
+                message = errors.read().decode(errors='replace').strip()[-500:]
+                raise RuntimeError(f"ffmpeg exited with {returncode}: {message}")
+            os.replace(tmp_path, filepath)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return True
+
 def generate_story_video_sequence(image_paths, audio_path, text_caption, story_id):
-    """Generate a video combining multiple images in sequence with audio and text"""
+    """
+    Generate a video combining multiple images in sequence with audio and text.
+
+    Rendered by ffmpeg directly when VIDEO_RENDERER is 'ffmpeg' and a binary is
+    available, otherwise (or if that render fails) with MoviePy.
+    """
+    if VIDEO_RENDERER == 'ffmpeg':
+        ffmpeg = find_ffmpeg()
+        if ffmpeg:
+            web_path = _generate_sequence_ffmpeg(ffmpeg, image_paths, audio_path, text_caption, story_id)
+            if web_path or not MOVIEPY_AVAILABLE:
+                return web_path
+            logging.warning("ffmpeg slideshow render failed, retrying with MoviePy")
+        else:
+            logging.warning("ffmpeg binary not found, rendering video with MoviePy")
+    return _generate_sequence_moviepy(image_paths, audio_path, text_caption, story_id)
+
+def _generate_sequence_ffmpeg(ffmpeg, image_paths, audio_path, text_caption, story_id):
+    try:
+        logging.info(f"Starting ffmpeg slideshow for story ID: {story_id} with {len(image_paths)} images")
+
+        videos_dir = os.path.join('static', 'videos')
+        os.makedirs(videos_dir, exist_ok=True)
+        filename = f"story_{story_id}_video.mp4"
+        filepath = os.path.join(videos_dir, filename)
+
+        started = time.perf_counter()
+        if VIDEO_MOTION == 'kenburns':
+            renderer, render = 'ffmpeg_motion', render_motion_ffmpeg
+        else:
+            renderer, render = 'ffmpeg', render_slideshow_ffmpeg
+        if not render(ffmpeg, image_paths, audio_path, text_caption, filepath):
+            return None
+        elapsed = time.perf_counter() - started
+        VIDEO_RENDER_DURATION.observe(elapsed, renderer=renderer)
+
+        record_file_written('video', filepath)
+        logging.info(f"Successfully generated video sequence with ffmpeg in {elapsed:.2f}s: {filepath}")
+        return f"/static/videos/{filename}"
+
+    except Exception as e:
+        logging.error(f"ffmpeg video sequence generation failed: {str(e)}")
+        return None
+
+def _generate_sequence_moviepy(image_paths, audio_path, text_caption, story_id):
     if not MOVIEPY_AVAILABLE:
         logging.warning("MoviePy not available, skipping video generation")
         return None
 
+    work_dir = tempfile.mkdtemp(prefix='video_')
     try:
         logging.info(f"Starting sequence video generation for story ID: {story_id} with {len(image_paths)} images")
+        started = time.perf_counter()
 
         # Ensure videos directory exists
         videos_dir = os.path.join('static', 'videos')
@@ -152,52 +518,25 @@ def generate_story_video_sequence(image_paths, audio_path, text_caption, story_i
 
         logging.info(f"Video total duration will be: {total_duration} seconds")
 
+        # Caption composited onto each still once, instead of a TextClip overlay on every frame
+        stills, _, _ = prepare_stills(image_paths, text_caption, work_dir)
+        if not stills:
+            logging.error("No valid images found for video generation")
+            return None
+
         # Calculate duration for each image
-        num_images = len(image_paths)
+        num_images = len(stills)
         image_duration = total_duration / num_images
 
         # Create image clips for each image
         image_clips = []
-        for i, image_path in enumerate(image_paths):
-            try:
-                img_clip = ImageClip(image_path).set_duration(image_duration)
-                image_clips.append(img_clip)
-                logging.info(f"Added image {i+1}/{num_images}: {image_path}")
-            except Exception as img_error:
-                logging.error(f"Failed to load image {image_path}: {str(img_error)}")
-                continue
-
-        if not image_clips:
-            logging.error("No valid images found for video generation")
-            return None
+        for i, still_path in enumerate(stills):
+            image_clips.append(ImageClip(still_path).set_duration(image_duration))
+            logging.info(f"Added image {i+1}/{num_images}")
 
-        # Concatenate all image clips
-        video_clip = concatenate_videoclips(image_clips, method="compose")
-
-        # Try to create text clip for caption with fallback options
-        text_clip = None
-        try:
-            # Limit text length to avoid issues
-            short_caption = text_caption[:80] if len(text_caption) > 80 else text_caption
-
-            text_clip = TextClip(
-                short_caption,
-                fontsize=35,  # Smaller font for better compatibility
-                color='white',
-                bg_color='rgba(0,0,0,0.7)',  # Semi-transparent background
-                size=(700, 60)  # Smaller size
-            ).set_position(('center', 'bottom')).set_duration(total_duration)
-
-            # Composite video with text
-            final_video = CompositeVideoClip([video_clip, text_clip])
-            logging.info("Video sequence created with text overlay")
-        except Exception as text_error:
-            logging.warning(f"Text overlay failed, creating video without text: {str(text_error)}")
-            # Create video without text overlay
-            final_video = video_clip
-            logging.info("Video sequence created without text overlay")
-
-        final_video = final_video.set_audio(audio_clip)
+        # Concatenate all image clips (the stills share one size, so no compositing is needed)
+        video_clip = concatenate_videoclips(image_clips)
+        final_video = video_clip.set_audio(audio_clip)
 
         # Export video
         filename = f"story_{story_id}_video.mp4"
@@ -224,14 +563,15 @@ def generate_story_video_sequence(image_paths, audio_path, text_caption, story_i
             clip.close()
         video_clip.close()
         final_video.close()
-        # Close text_clip if it was created
-        if text_clip is not None:
-            text_clip.close()
 
+        VIDEO_RENDER_DURATION.observe(time.perf_counter() - started, renderer='moviepy')
+        record_file_written('video', filepath)
         web_path = f"/static/videos/{filename}"
         logging.info(f"Successfully generated video sequence: {filepath}")
         return web_path
 
     except Exception as e:
         logging.error(f"Video sequence generation failed: {str(e)}", exc_info=True)
-        return None
\ No newline at end of file
+        return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
\ No newline at end of file
@@ -0,0 +1,13 @@
+"""
+WSGI entry point for production servers
+
+    gunicorn wsgi:app
+
+Sets up logging, static assets and the database schema once, then exposes the
+Flask app. Importing app alone does none of that, so processes that only need
+the module (such as spawned render workers) stay light.
+"""
+
+from app import app, initialize_app
+
+initialize_app()